@@ -1,70 +1,97 @@
 """Python script to seed the database with judges names"""
 
+from functools import lru_cache
 from os import getenv
 import requests
-from bs4 import BeautifulSoup, element
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer, element
 import psycopg2
 from psycopg2.extensions import connection
 from psycopg2.extras import RealDictCursor, execute_values
 from dotenv import load_dotenv
 
-COMMON_JUDGE_WORDS = (
-    "Senior",
-    "(Magistrates’",
-    " His",
-    "Master",
-    "King’s",
-    "(The",
-    "The",
-    "King's",
-    "Remembrancer)",
-    "Bench",
-    "Chief",
-    "Chancery",
-    "Costs",
-    "Judge",
-    "(Chief",
-    "Taxing",
-    "Master)",
-    "Insolvency",
-    "and",
-    "Companies",
-    "Court",
-    "Registrar",
-    "District",
-    "(MC)",
-    "His",
-    "Her",
-    "Honour",
-    "Tribunal",
-    "Employment",
-    "Deputy",
-    "Magistrate)",
-    "CBE",
-    "DL",
-    "(Deputy",
-    "Lead",
-    "DCRJ)",
-    "Upper",
-    "Recorder",
-    "of",
-    "London,",
-    "Regional",
-    "ICC",
-    "(Magistrates",
-    "(Magistrates'",
-    "Court)",
-    "KC",
-    "Assistant",
-    "Advocate",
-    "General",
-    "Lieutenant",
-    "Colonel",
-    "(Retired)",
-    "JP",
-    "",
-    "OBE",
+# titles, ranks and courts dropped from a judge's name, checked once per word, the same as
+# TITLE_WORDS in the pipeline's name_normalisation.py, which the tests check
+TITLE_WORDS = frozenset(
+    (
+        "Senior",
+        "(Magistrates’",
+        "Master",
+        "King’s",
+        "(The",
+        "The",
+        "King's",
+        "Remembrancer)",
+        "Bench",
+        "Chief",
+        "Chancery",
+        "Costs",
+        "Judge",
+        "(Chief",
+        "Taxing",
+        "Master)",
+        "Insolvency",
+        "and",
+        "Companies",
+        "Court",
+        "Registrar",
+        "District",
+        "(MC)",
+        "His",
+        "Her",
+        "Honour",
+        "Tribunal",
+        "Employment",
+        "Deputy",
+        "Magistrate)",
+        "CBE",
+        "DL",
+        "(Deputy",
+        "Lead",
+        "DCRJ)",
+        "Upper",
+        "Recorder",
+        "of",
+        "London,",
+        "Regional",
+        "ICC",
+        "(Magistrates",
+        "(Magistrates'",
+        "Court)",
+        "KC",
+        "Assistant",
+        "Advocate",
+        "General",
+        "Lieutenant",
+        "Colonel",
+        "(Retired)",
+        "JP",
+        "OBE",
+    )
 )
+NAME_CACHE_SIZE = 65536
+
+
+def create_session() -> requests.Session:
+    """
+    Creates a session keeping the connection to the judiciary site alive between its pages,
+    retrying rate limited or failed requests with a backoff. The pages are fetched one at a
+    time, so unlike the pipeline's shared client no cap on concurrent requests is needed
+    """
+    retry = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    new_session = requests.Session()
+    new_session.mount("https://", HTTPAdapter(max_retries=retry))
+    return new_session
+
+
+session = create_session()
 
 
 def get_connection() -> connection:
@@ -84,8 +111,13 @@ def get_judge_rows(url: str) -> element:
     """
     Gets all table rows from tables on the url given
     """
-    whole_page = requests.get(url, timeout=20)
-    soup = BeautifulSoup(whole_page.content, "html.parser")
+    whole_page = session.get(url, timeout=20)
+    # only the div holding the tables is built into a tree
+    soup = BeautifulSoup(
+        whole_page.content,
+        "html.parser",
+        parse_only=SoupStrainer("div", {"class": "page__content [ flow ]"}),
+    )
     table_contents = soup.find("div", class_="page__content [ flow ]")
     rows = table_contents.find_all("td")
     return rows
@@ -198,19 +230,23 @@ def gather_all_judges() -> list[str]:
     )
 
 
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def standardise_name(name: str) -> str:
+    """
+    Returns a judge's name without titles and words not starting with a letter
+    """
+    return " ".join(
+        part
+        for part in name.split(" ")
+        if part and part not in TITLE_WORDS and part[0].isalpha()
+    )
+
+
 def standardise_judge_names(judges: list[str]) -> list[tuple]:
     """
     Makes the judges names just the personal name and creates a list of tuples ready for upload
     """
-    standardised_names = []
-    for judge in judges:
-        name_parts = judge.split(" ")
-        good_parts = []
-        for part in name_parts:
-            if part not in COMMON_JUDGE_WORDS and part[0].isalpha():
-                good_parts.append(part)
-        standardised_names.append((" ".join(good_parts),))
-    return standardised_names
+    return [(standardise_name(judge),) for judge in judges]
 
 
 def upload_judges(conn: connection, judges: list[tuple]) -> None:
@@ -1,6 +1,9 @@
+import importlib.util
+from pathlib import Path
 import pytest
 from unittest.mock import MagicMock, patch
 from bs4 import BeautifulSoup
+import judges_seed
 from judges_seed import get_judge_rows, get_bench_judges, get_district_judges_magistrates, get_diversity_high_court_judges, get_judge_advocates, get_circuit_district_judges, gather_all_judges, standardise_judge_names, upload_judges
 
 
@@ -22,7 +25,7 @@ def fake_url():
 
 
 class TestGetJudgeRows:
-    @patch('judges_seed.requests.get')
+    @patch('judges_seed.session.get')
     def test_get_judge_rows_correct_length(self, mock_get, fake_url):
         mock_response = MagicMock()
         mock_response.content = """
@@ -42,7 +45,7 @@ class TestGetJudgeRows:
         rows = get_judge_rows(url)
         assert len(rows) == 2
 
-    @patch('judges_seed.requests.get')
+    @patch('judges_seed.session.get')
     def test_get_judge_rows_correct_contents(self, mock_get, fake_url):
         mock_response = MagicMock()
         mock_response.content = """
@@ -186,6 +189,38 @@ class TestStandardiseJudgeNames:
             names) == [("Mark", ), ("James", ), ("Jeremy", )]
 
 
+def load_pipeline_name_normalisation():
+    path = Path(__file__).resolve().parent.parent / "pipeline" / "name_normalisation.py"
+    spec = importlib.util.spec_from_file_location("pipeline_name_normalisation", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestSameAsPipeline:
+    """The seeder keeps its own copy of the pipeline's name standardisation, which must strip
+    names the same way or seeded judges won't match the names the loader standardises"""
+
+    def test_same_title_words(self):
+        assert judges_seed.TITLE_WORDS == load_pipeline_name_normalisation().TITLE_WORDS
+
+    def test_same_standardised_names(self):
+        pipeline = load_pipeline_name_normalisation()
+        names = [
+            "His Honour Judge Smith KC",
+            "Senior District Judge (Chief Magistrate) Paul Goldspring",
+            "Master  Kaye 2",
+            "The Hon. Mrs Justice O'Farrell DBE",
+            "Lieutenant Colonel (Retired) Jane Doe OBE JP",
+            "Regional Employment Judge Ann Lead-Jones",
+            "",
+            "1st Judge",
+        ]
+        names += list(pipeline.TITLE_WORDS)
+        for name in names:
+            assert judges_seed.standardise_name(name) == pipeline.standardise_name(name)
+
+
 class TestUploadJudges:
     @patch("judges_seed.execute_values")
     @patch("judges_seed.standardise_judge_names")
@@ -0,0 +1,199 @@
+"""Python script to run the backfill as date or court shards in a pool of processes, with the
+requests to the archive site and the OpenAI API of every process (and of other machines loading
+the same database) kept under one set of rate limits, and the progress of every shard merged
+into one report"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from os import cpu_count, getenv
+import logging
+import time
+import http_client
+import transform
+from batch_pipeline import initialise_logger, run_backfill
+from checkpoint import parse_shard
+from extract import COURTS, construct_search_url
+from rate_limiter import connect_rate_limiters, serve_rate_limiters
+
+BACKFILL_START = date(2020, 1, 1)
+BACKFILL_END = date(2024, 8, 11)
+SHARD_DAYS = 30
+ARCHIVE_HOST = "caselaw.nationalarchives.gov.uk"
+BACKFILL_WORKERS = int(getenv("BACKFILL_WORKERS", str(cpu_count() or 1)))
+
+
+def get_authkey() -> bytes | None:
+    """Returns the key the processes of every machine use to reach the rate limiters,
+    without RATE_LIMITER_AUTHKEY only the processes started by this one can"""
+    authkey = getenv("RATE_LIMITER_AUTHKEY")
+    return authkey.encode("utf-8") if authkey else None
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """Reads an address given as HOST:PORT"""
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Address should be HOST:PORT, not {address!r}")
+    return host, int(port)
+
+
+def get_date_ranges(start: date, end: date, days: int = SHARD_DAYS) -> list[tuple[date, date]]:
+    """Splits the dates from start to end, both included, into ranges of up to days days"""
+    if days < 1:
+        raise ValueError("Shards should be at least a day long")
+    ranges = []
+    while start <= end:
+        range_end = min(start + timedelta(days=days - 1), end)
+        ranges.append((start, range_end))
+        start = range_end + timedelta(days=1)
+    return ranges
+
+
+def get_shards(
+    start: date = BACKFILL_START,
+    end: date = BACKFILL_END,
+    days: int = SHARD_DAYS,
+    by_court: bool = False,
+) -> list[dict]:
+    """Returns the name and search URL of every shard of the backfill, a shard for each
+    range of dates, or for each court and range of dates with by_court"""
+    court_groups = [(court,) for court in COURTS] if by_court else [COURTS]
+    return [
+        {
+            "name": f"{from_date}..{to_date}" + (f" {courts[0]}" if by_court else ""),
+            "url": construct_search_url(from_date, to_date, courts),
+        }
+        for from_date, to_date in get_date_ranges(start, end, days)
+        for courts in court_groups
+    ]
+
+
+def get_machine_shards(shards: list[dict], machine: str = "0/1") -> list[dict]:
+    """Returns the shards run by one of several machines given as INDEX/COUNT"""
+    index, count = parse_shard(machine)
+    return shards[index::count]
+
+
+def initialise_worker(address: tuple[str, int], authkey: bytes | None) -> None:
+    """Makes the GPT calls and archive requests of a worker process wait for the shared limiters"""
+    initialise_logger()
+    limiters = connect_rate_limiters(address, authkey)
+    transform.gpt_rate_limiter = limiters.get_limiter("gpt")
+    http_client.set_host_rate_limiter(ARCHIVE_HOST, limiters.get_limiter("archive"))
+
+
+def run_shard(shard: dict, resume: bool = False) -> dict:
+    """Runs the backfill of one shard, returning its progress, or its error if it failed
+    so the other shards carry on"""
+    start = time.perf_counter()
+    result = {"name": shard["name"], "pages": 0, "cases": 0, "error": None}
+    try:
+        result |= run_backfill(shard["url"], resume, show_progress=False)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.getLogger("pipeline").exception("Shard %s failed", shard["name"])
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def merge_report(results: list[dict]) -> dict:
+    """Merges the progress of every shard into the totals of the backfill"""
+    return {
+        "shards": len(results),
+        "pages": sum(result["pages"] for result in results),
+        "cases": sum(result["cases"] for result in results),
+        "failed": sorted(
+            (result for result in results if result["error"]), key=lambda result: result["name"]
+        ),
+    }
+
+
+def format_report(report: dict, seconds: float) -> str:
+    """Formats the merged progress of the backfill"""
+    lines = [
+        f"{report['shards']} shards: {report['pages']} pages and {report['cases']} cases "
+        f"loaded in {seconds:.0f} seconds, {len(report['failed'])} shards failed"
+    ]
+    lines.extend(f"  {result['name']}: {result['error']}" for result in report["failed"])
+    return "\n".join(lines)
+
+
+def run_shards(
+    shards: list[dict],
+    address: tuple[str, int],
+    authkey: bytes | None,
+    resume: bool = False,
+    workers: int = BACKFILL_WORKERS,
+) -> dict:
+    """Runs the shards in a pool of processes using the rate limiters served at the address,
+    logging the merged progress as each shard finishes"""
+    logger = initialise_logger()
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initialise_worker, initargs=(address, authkey)
+    ) as executor:
+        futures = [executor.submit(run_shard, shard, resume) for shard in shards]
+        for future in as_completed(futures):
+            results.append(future.result())
+            report = merge_report(results)
+            logger.info(
+                "%s/%s shards done, %s pages and %s cases loaded, %s failed",
+                len(results),
+                len(shards),
+                report["pages"],
+                report["cases"],
+                len(report["failed"]),
+            )
+    return merge_report(results)
+
+
+def main(args) -> None:
+    """Serves the rate limiters, or connects to the ones another machine serves,
+    then runs this machine's shards and prints the report"""
+    logger = initialise_logger()
+    shards = get_machine_shards(
+        get_shards(args.start, args.end, args.days, args.by_court), args.machine
+    )
+    authkey = get_authkey()
+    if args.limiters:
+        address = parse_address(args.limiters)
+        manager = None
+    else:
+        manager = serve_rate_limiters(parse_address(args.serve_limiters), authkey)
+        address = manager.address
+        logger.info("Serving the rate limiters at %s:%s", *address)
+
+    start = time.perf_counter()
+    try:
+        report = run_shards(shards, address, authkey, args.resume, args.workers)
+    finally:
+        if manager is not None:
+            manager.shutdown()
+    print(format_report(report, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Run the backfill as shards in a pool of processes")
+    parser.add_argument("--start", type=date.fromisoformat, default=BACKFILL_START)
+    parser.add_argument("--end", type=date.fromisoformat, default=BACKFILL_END)
+    parser.add_argument("--days", type=int, default=SHARD_DAYS, help="days of judgments per shard")
+    parser.add_argument("--by-court", action="store_true", help="split each range by court too")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="processes to run")
+    parser.add_argument(
+        "--resume", action="store_true", help="skip the pages checkpointed by an earlier run"
+    )
+    parser.add_argument(
+        "--machine",
+        default="0/1",
+        help="INDEX/COUNT share of the shards run by this machine, for COUNT machines",
+    )
+    parser.add_argument(
+        "--serve-limiters",
+        default="127.0.0.1:0",
+        help="HOST:PORT to serve the rate limiters on, 0.0.0.0:PORT to share them with other machines",
+    )
+    parser.add_argument(
+        "--limiters", help="HOST:PORT of the rate limiters served by another machine's backfill"
+    )
+    main(parser.parse_args())
@@ -1,20 +1,18 @@
 """Python script to run the batch pipeline locally to insert past 
-court cases to the database and cache GPT data in Redis"""
+court cases to the database, GPT data is cached in Redis when it is running"""
 
-from ast import literal_eval
+from argparse import ArgumentParser
+from functools import partial
 import logging
-import redis
 from rich.progress import Progress
-import nltk
-from extract import get_listing_data, get_max_page_num
-from transform import get_data, assemble_data
-from load import get_connection, insert_to_database
-
-nltk.download("wordnet")
-
-# Initialize Redis connection
-r = redis.Redis(host="localhost", port=6379, decode_responses=True)
+from extract import get_listing_items, get_judgments, get_max_page_num
+from transform import get_all_data, assemble_data
+from load import get_connection, get_loaded_citations, insert_to_database
+from stages import run_stages
+from gpt_batch import run_batch_backfill
+from checkpoint import BackfillCheckpoint, get_shard_pages, parse_shard
 
+BATCH_API_DIR = "batch_api"
 BATCH_URL = """https://caselaw.nationalarchives.gov.uk/judgments/search?per_page=50&order=date&query=&from_date_0=1&from_date_1=1&from_date_2=2020&to_date_0=11&to_date_1=8&to_date_2=2024&court=uksc&court=ukpc&court=ewca%2Fciv&court=ewca%2Fcrim&court=ewhc%2Fadmin&court=ewhc%2Fadmlty&court=ewhc%2Fch&court=ewhc%2Fcomm&court=ewhc%2Ffam&court=ewhc%2Fipec&court=ewhc%2Fkb&court=ewhc%2Fmercantile&court=ewhc%2Fpat&court=ewhc%2Fscco&court=ewhc%2Ftcc&party=&judge=&page="""
 
 
@@ -22,6 +20,8 @@ def initialise_logger() -> logging.Logger:
     """Initialise the logger to log to both file and console."""
     logger = logging.getLogger("pipeline")
     logger.setLevel(logging.INFO)
+    if logger.handlers:  # already set up for an earlier shard of the process
+        return logger
     file_handler = logging.FileHandler("batch_pipeline.log")
     console_handler = logging.StreamHandler()
     file_handler.setLevel(logging.INFO)
@@ -34,55 +34,157 @@ def initialise_logger() -> logging.Logger:
     return logger
 
 
-def main() -> None:
-    """Main function to process all pages of the batch URL and insert data into the database"""
+def scrape_listing(
+    page_num: int, search_url: str = BATCH_URL
+) -> tuple[int, list[tuple[str, dict]]]:
+    """Stage that reads the cases listed on a page of the batch URL or another search"""
+    return page_num, get_listing_items(search_url, page_num)
+
+
+def get_new_listings(conn, listings: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+    """Leaves out the listed cases already in the database, so their articles are not downloaded"""
+    loaded = get_loaded_citations(conn, [listing["citation"] for _, listing in listings])
+    return [(href, listing) for href, listing in listings if listing["citation"] not in loaded]
+
+
+def scrape_articles(page: tuple[int, list[tuple[str, dict]]]) -> tuple[int, list[dict]]:
+    """Stage that downloads the article of every case listed on a page"""
+    page_num, listings = page
+    return page_num, get_judgments(listings)
+
+
+def summarise_cases(page: tuple[int, list[dict]]) -> tuple[int, list[dict]]:
+    """Stage that gets the GPT data of every case on a page in parallel,
+    cases whose transcript was summarised before are read from the GPT cache"""
+    page_num, data = page
+    return page_num, get_all_data(data)
+
+
+def assemble_page(page: tuple[int, list[dict]]) -> tuple[int, int, dict]:
+    """Stage that formats the GPT data of a page into a load batch"""
+    page_num, gpt_response = page
+    return page_num, len(gpt_response), assemble_data(gpt_response, True)
+
+
+def run_backfill(
+    search_url: str, resume: bool = False, shard: str = "0/1", show_progress: bool = True
+) -> dict:
+    """Processes all pages of a search and inserts their data into the database, returning
+    the number of pages and cases loaded. Pages stream through the scraping, GPT and
+    assembling stages so that the GPT calls of one page overlap with scraping the next page
+    and loading the previous one. Every page loaded is checkpointed, with resume the pages
+    loaded before are skipped, and with a shard only that share of the pages is processed"""
     logger = initialise_logger()
-    max_page_num = get_max_page_num(BATCH_URL)
+    max_page_num = get_max_page_num(search_url)
     if max_page_num == 0:
         logger.info("No new data to insert, exiting")
-        return None
+        return {"pages": 0, "cases": 0}
+
+    checkpoint = BackfillCheckpoint()
+    page_nums = get_shard_pages(max_page_num, *parse_shard(shard))
+    if resume:
+        loaded_pages = checkpoint.get_loaded_pages(search_url)
+        page_nums = [page_num for page_num in page_nums if page_num not in loaded_pages]
+        logger.info("Resuming with %s pages left of shard %s", len(page_nums), shard)
+    else:
+        checkpoint.reset(search_url, page_nums)
 
     cases_count = 0
-    with Progress() as progress:
-        task = progress.add_task("[cyan]Processing batch data...", total=max_page_num)
-        for page_num in range(1, max_page_num + 1):
-            data = get_listing_data(BATCH_URL, page_num)
-            cases_count += len(data)
-            gpt_response = []
-
-            for index, item in enumerate(data):
-                court_case_citation = item.get("citation")
-                if r.exists(court_case_citation):
-                    case_details = literal_eval(
-                        r.hgetall(court_case_citation)["case_details"]
-                    )
-                    gpt_response.append(case_details)
-                    message = (
-                        f"Cache hit for {court_case_citation}, retrieved from Redis."
-                    )
-                else:
-                    response = get_data(data, index)
-                    r.hset(
-                        court_case_citation,
-                        mapping={"case_details": str(response)},
-                    )
-                    gpt_response.append(response)
-                    message = (
-                        f"Cache miss for {court_case_citation}, "
-                        "GPT data fetched and stored in Redis."
-                    )
-                logger.info(message)
+    conn = get_connection()
+    # the loading transaction is kept apart from the lookups made while it runs
+    filter_conn = get_connection()
+
+    def filter_loaded(page: tuple[int, list]) -> tuple[int, list[tuple[str, dict]]]:
+        """Stage that leaves out the cases of a page already in the database"""
+        page_num, listings = page
+        return page_num, get_new_listings(filter_conn, listings)
 
-            insert_to_database(get_connection(), assemble_data(gpt_response, True))
-            message = (
-                f"Page {page_num} inserted to database, {cases_count} records in total"
+    pages_count = 0
+    try:
+        with Progress(disable=not show_progress) as progress:
+            task = progress.add_task("[cyan]Processing batch data...", total=len(page_nums))
+            load_batches = run_stages(
+                page_nums,
+                [
+                    partial(scrape_listing, search_url=search_url),
+                    filter_loaded,
+                    scrape_articles,
+                    summarise_cases,
+                    assemble_page,
+                ],
             )
-            logger.info(message)
-            progress.update(task, advance=1)
+            for page_num, page_cases_count, table_data in load_batches:
+                insert_to_database(conn, table_data)
+                checkpoint.mark_page_loaded(search_url, page_num, table_data["case_ids"])
+                pages_count += 1
+                cases_count += page_cases_count
+                message = (
+                    f"Page {page_num} inserted to database, {cases_count} records in total"
+                )
+                logger.info(message)
+                progress.update(task, advance=1)
+    finally:
+        conn.close()
+        filter_conn.close()
 
     logger.info("Batch data successfully inserted to database")
+    return {"pages": pages_count, "cases": cases_count}
+
+
+def main(resume: bool = False, shard: str = "0/1") -> None:
+    """Main function to process all pages of the batch URL and insert data into the database"""
+    run_backfill(BATCH_URL, resume, shard)
+
+
+def batch_api_main(batch_dir: str = BATCH_API_DIR) -> None:
+    """Processes all pages of the batch URL through the OpenAI Batch API: every transcript is
+    written to JSONL batch files and submitted at once, then the results are inserted page by
+    page once the batches are complete. Rerunning resumes from the files saved in batch_dir"""
+    logger = initialise_logger()
+    max_page_num = get_max_page_num(BATCH_URL)
+    if max_page_num == 0:
+        logger.info("No new data to insert, exiting")
+        return None
+
+    conn = get_connection()
+    pages = (
+        (page_num, get_judgments(get_new_listings(conn, get_listing_items(BATCH_URL, page_num))))
+        for page_num in range(1, max_page_num + 1)
+    )
+
+    def load_page(page_num: int, gpt_response: list[dict]) -> None:
+        insert_to_database(conn, assemble_data(gpt_response, True))
+        logger.info("Page %s inserted to database", page_num)
+
+    cases_count = run_batch_backfill(pages, batch_dir, load_page)
+    logger.info("Batch data successfully inserted to database, %s records", cases_count)
     return None
 
 
 if __name__ == "__main__":
-    main()
+    parser = ArgumentParser(description="Insert past court cases to the database")
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="summarise the cases through the OpenAI Batch API at half the cost",
+    )
+    parser.add_argument(
+        "--batch-dir",
+        default=BATCH_API_DIR,
+        help="folder for the Batch API request files, reused to resume a backfill",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the pages checkpointed as loaded by an earlier run",
+    )
+    parser.add_argument(
+        "--shard",
+        default="0/1",
+        help="INDEX/COUNT share of the pages to process, to run COUNT processes side by side",
+    )
+    args = parser.parse_args()
+    if args.batch_api:
+        batch_api_main(args.batch_dir)
+    else:
+        main(args.resume, args.shard)
@@ -0,0 +1,118 @@
+"""Python script to benchmark getting the article text of saved judgment pages with the parser
+the pipeline used before (the whole page parsed by html.parser) against the faster ways of
+html_parsing, reporting throughput, peak memory and whether the text is the same"""
+
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import find_spec
+from multiprocessing import get_context
+from pathlib import Path
+import resource
+import time
+import tracemalloc
+from bs4 import BeautifulSoup
+from html_parsing import get_article_text, parse_only, stream_article_text
+
+FIXTURES_DIR = "html_fixtures"
+BASE_URL = "https://caselaw.nationalarchives.gov.uk"
+
+
+def parse_whole_page(content: bytes) -> str:
+    """The article text as the pipeline got it before, from a tree of the whole page"""
+    return BeautifulSoup(content, "html.parser").article.get_text()
+
+
+def parse_article_only(content: bytes) -> str:
+    """The article text from a soup of only the article, built by lxml"""
+    return parse_only(content, "article", parser="lxml").article.get_text()
+
+
+def stream_whole_article(content: bytes) -> str:
+    """The article text tokenised in chunks as it would be while downloading, with windows
+    long enough to keep all of it so the text can be compared"""
+    chunks = (content[i : i + 65536] for i in range(0, len(content), 65536))
+    return stream_article_text(chunks, len(content), len(content))
+
+
+PATHS = {
+    "html.parser, whole page": parse_whole_page,
+    "html.parser, article only": lambda content: get_article_text(content, "html.parser"),
+    "lxml, article only": parse_article_only,
+    "lxml, streamed": lambda content: get_article_text(content, "lxml"),
+    "html.parser, tokenised in chunks": stream_whole_article,
+}
+
+
+def save_fixtures(hrefs: list[str], fixtures_dir: str) -> None:
+    """Downloads judgment pages, e.g. /ewhc/admin/2024/2177, to the fixtures folder"""
+    import http_client  # pylint: disable=import-outside-toplevel
+
+    Path(fixtures_dir).mkdir(exist_ok=True)
+    for href in hrefs:
+        page = http_client.get(BASE_URL + href, timeout=30)
+        path = Path(fixtures_dir) / (href.strip("/").replace("/", "_") + ".html")
+        path.write_bytes(page.content)
+        print(f"Saved {href} to {path}")
+
+
+def read_fixtures(fixtures_dir: str) -> list[bytes]:
+    """Reads every saved page of the fixtures folder"""
+    return [path.read_bytes() for path in sorted(Path(fixtures_dir).glob("*.html"))]
+
+
+def measure(path_name: str, pages: list[bytes], repeats: int) -> dict:
+    """Gets the article text of every page with one of the paths, in a fresh process so
+    the peak memory is its own, returning the texts, timing and memory"""
+    get_text = PATHS[path_name]
+    get_text(pages[0])  # imports the parser
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(repeats):
+        texts = [get_text(page) for page in pages]
+    seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    for page in pages:
+        get_text(page)
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "texts": texts,
+        "seconds": seconds,
+        "rss_mb": (rss_after - rss_before) / 1024,  # ru_maxrss is in KB on Linux
+        "python_peak_mb": python_peak / 1024**2,
+    }
+
+
+def run_benchmark(pages: list[bytes], repeats: int) -> None:
+    """Prints the throughput, peak memory and text parity of every path"""
+    megabytes = sum(len(page) for page in pages) * repeats / 1024**2
+    paths = [name for name in PATHS if "lxml" not in name or find_spec("lxml")]
+    print(f"{len(pages)} pages, {megabytes / repeats:.1f} MB, {repeats} repeats")
+    baseline = None
+    for path_name in paths:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(measure, path_name, pages, repeats).result()
+        baseline = baseline or result["texts"]
+        same = sum(text == expected for text, expected in zip(result["texts"], baseline))
+        print(
+            f"{path_name:<32} {len(pages) * repeats / result['seconds']:8.1f} pages/s "
+            f"{megabytes / result['seconds']:7.2f} MB/s, peak +{result['rss_mb']:.1f} MB RSS "
+            f"{result['python_peak_mb']:.1f} MB Python, same text {same}/{len(pages)}"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark getting the article text of judgment pages")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="folder of saved .html pages")
+    parser.add_argument("--repeats", type=int, default=3, help="times every page is parsed")
+    parser.add_argument("--save", nargs="*", default=[], help="judgment hrefs to download first")
+    args = parser.parse_args()
+
+    if args.save:
+        save_fixtures(args.save, args.fixtures)
+    fixture_pages = read_fixtures(args.fixtures)
+    if not fixture_pages:
+        sys.exit(f"No .html pages in {args.fixtures}, save some with --save")
+    run_benchmark(fixture_pages, args.repeats)
@@ -0,0 +1,122 @@
+"""Python script to benchmark judge matching with the blocked candidate index against a scan
+of the whole roster, over the judge table or a roster file and the judge names found in the
+batch logs"""
+
+import sys
+from argparse import ArgumentParser
+from ast import literal_eval
+from pathlib import Path
+from statistics import mean, median
+import time
+from dotenv import load_dotenv
+from judge_matching import JudgeIndex, get_connection, get_judges, match_judge, match_judges
+
+LOG_FILES = ("batch_pipeline.log", "invalid_gpt_responses.txt")
+LOGGED_RESPONSE_PREFIX = "Invalid GPT response: "
+
+
+def read_roster(roster_file: str | None) -> list[str]:
+    """Reads the roster from a file with a judge per line, or else from the judge table"""
+    if roster_file:
+        with open(roster_file, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    load_dotenv()
+    conn = get_connection()
+    try:
+        return list(dict.fromkeys(get_judges(conn)))
+    finally:
+        conn.close()
+
+
+def read_logged_judges(log_files: list[str]) -> list[str]:
+    """Returns the judge names of the GPT responses written to the batch logs"""
+    judges = []
+    for log_file in log_files:
+        if not Path(log_file).exists():
+            continue
+        with open(log_file, "r", encoding="utf-8") as f:
+            for line in f:
+                response = line.split(LOGGED_RESPONSE_PREFIX, 1)[-1].strip()
+                try:
+                    data = literal_eval(response)
+                except (SyntaxError, ValueError):
+                    continue
+                if isinstance(data, dict) and isinstance(data.get("judge"), list):
+                    judges.extend(judge for judge in data["judge"] if isinstance(judge, str))
+    return judges
+
+
+def time_matches(match, names: list[str]) -> tuple[list[str], list[float]]:
+    """Matches every name, returning the results and the time each match took in ms"""
+    results, timings = [], []
+    for name in names:
+        start = time.perf_counter()
+        results.append(match(name))
+        timings.append((time.perf_counter() - start) * 1000)
+    return results, timings
+
+
+def describe(label: str, timings: list[float]) -> str:
+    """Formats the latency of a set of matches"""
+    return (
+        f"{label:<22} mean {mean(timings):.3f} ms, median {median(timings):.3f} ms, "
+        f"max {max(timings):.3f} ms"
+    )
+
+
+def run_benchmark(roster: list[str], names: list[str]) -> None:
+    """Prints the lookup latency of both ways of matching and how often they agree"""
+    start = time.perf_counter()
+    index = JudgeIndex(roster)
+    build_ms = (time.perf_counter() - start) * 1000
+    candidates = [len(index.get_candidates(name)) for name in names]
+
+    full_results, full_timings = time_matches(lambda name: match_judge(name, roster), names)
+    index_results, index_timings = time_matches(
+        lambda name: match_judge(name, index.get_candidates(name)), names
+    )
+    start = time.perf_counter()
+    batch_results = match_judges(names, roster)
+    batch_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    index_batch_results = JudgeIndex(roster).match_all(names)
+    index_batch_ms = (time.perf_counter() - start) * 1000
+    time_matches(index.match, names)
+    _, memo_timings = time_matches(index.match, names)
+
+    mismatches = [
+        (name, full, indexed)
+        for name, full, indexed in zip(names, full_results, index_results)
+        if full != indexed
+    ]
+    print(f"Roster of {len(roster)} judges, {len(names)} names, index built in {build_ms:.1f} ms")
+    print(f"Candidates scored per name: mean {mean(candidates):.1f}, max {max(candidates)}")
+    print(describe("Full roster scan", full_timings))
+    print(describe("Blocked index", index_timings))
+    print(describe("Blocked index, memo", memo_timings))
+    print(f"{'Batch cdist':<22} {batch_ms:.3f} ms for all names")
+    print(f"{'Blocked index, batch':<22} {index_batch_ms:.3f} ms for all names")
+    print(
+        f"Batch parity: cdist {sum(a == b for a, b in zip(full_results, batch_results))}"
+        f"/{len(names)}, blocked cdist "
+        f"{sum(a == b for a, b in zip(full_results, index_batch_results))}/{len(names)}"
+    )
+    print(f"Parity: {len(names) - len(mismatches)}/{len(names)} names matched the same")
+    for name, full, indexed in mismatches:
+        print(f"  {name!r}: full scan {full!r}, index {indexed!r}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the judge candidate index")
+    parser.add_argument("--roster", help="file with a judge per line, else the judge table")
+    parser.add_argument("--logs", nargs="*", default=list(LOG_FILES), help="logs to read names from")
+    parser.add_argument("--names", help="file with extra judge names to match, one per line")
+    args = parser.parse_args()
+
+    judge_names = read_logged_judges(args.logs)
+    if args.names:
+        with open(args.names, "r", encoding="utf-8") as names_file:
+            judge_names.extend(line.strip() for line in names_file if line.strip())
+    if not judge_names:
+        sys.exit("No judge names found to match")
+    run_benchmark(read_roster(args.roster), judge_names)
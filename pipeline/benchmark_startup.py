@@ -0,0 +1,101 @@
+"""Python script to benchmark the start up of the live pipeline: the time to import it and its heavy
+modules in a fresh interpreter, the first and warm calls of what the handler sets up, and optionally
+a cold and a warm invocation of the handler itself"""
+
+import subprocess
+import sys
+from argparse import ArgumentParser
+from os import getenv
+from statistics import median
+import time
+
+IMPORT_MODULES = ("live_pipeline", "extract", "boto3", "transform", "load", "send_emails")
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(module: str, repeats: int) -> list[float]:
+    """Imports a module in a new interpreter each time, returning the import times in ms"""
+    timings = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]) * 1000)
+    return timings
+
+
+def time_calls(setup, calls: int = 2) -> list[float | str]:
+    """Times consecutive calls of a set up function in ms, or gives the error it raised"""
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            setup()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return timings + [f"failed: {type(e).__name__}"]
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def get_setup_steps() -> dict:
+    """The set up the handler does, imported here so their import is not timed"""
+    # pylint: disable=import-outside-toplevel
+    import live_pipeline
+    from transform import get_encoder
+    from wordnet_synonyms import get_synonym_table
+
+    steps = {
+        "S3 client": live_pipeline.get_client,
+        "tiktoken encoder": get_encoder,
+        "synonym table": get_synonym_table,
+    }
+    try:
+        from send_emails import get_sns_client
+
+        steps["SNS client"] = lambda: live_pipeline.get_shared("sns", get_sns_client)
+    except SyntaxError:  # send_emails needs Python 3.12, like the Lambda image
+        pass
+    if getenv("DB_HOST"):
+        steps["database connection"] = live_pipeline.get_db_connection
+    return steps
+
+
+def describe(timings: list) -> str:
+    """Formats the first and warm timings of a step"""
+    return ", ".join(t if isinstance(t, str) else f"{t:.1f} ms" for t in timings)
+
+
+def run_benchmark(repeats: int, invoke: bool) -> None:
+    """Prints the import, set up and invocation timings"""
+    print(f"Import in a new interpreter (median of {repeats}):")
+    for module in IMPORT_MODULES:
+        try:
+            print(f"  {module:<22} {median(time_import(module, repeats)):.1f} ms")
+        except subprocess.CalledProcessError as e:
+            print(f"  {module:<22} failed: {e.stderr.strip().splitlines()[-1]}")
+
+    print("Set up steps (first call, warm call):")
+    for name, setup in get_setup_steps().items():
+        print(f"  {name:<22} {describe(time_calls(setup))}")
+
+    if invoke:
+        import live_pipeline  # pylint: disable=import-outside-toplevel
+
+        print("Handler invocations (cold, warm):")
+        print(f"  {'handler':<22} {describe(time_calls(lambda: live_pipeline.handler({}, None)))}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the live pipeline start up")
+    parser.add_argument("--repeats", type=int, default=5, help="fresh imports timed per module")
+    parser.add_argument(
+        "--invoke", action="store_true", help="also run the handler twice, needs AWS and DB access"
+    )
+    args = parser.parse_args()
+    run_benchmark(args.repeats, args.invoke)
@@ -5,6 +5,7 @@ from ast import literal_eval
 # pricing info available at https://openai.com/api/pricing/
 INPUT_COST_PER_MILLION_TOKENS = 0.15
 OUTPUT_COST_PER_MILLION_TOKENS = 0.60
+BATCH_API_DISCOUNT = 0.5
 
 
 def calculate_cost(file_name):
@@ -20,6 +21,12 @@ def calculate_cost(file_name):
             cost_list = literal_eval(cost_string)
             output_tokens += cost_list[0]
             input_tokens += cost_list[1]
+        elif "GPT-4o-mini batch usage cost:" in line:
+            # Batch API tokens are billed at a discount
+            cost_string = line.split(": ")[1]
+            cost_list = literal_eval(cost_string)
+            output_tokens += cost_list[0] * BATCH_API_DISCOUNT
+            input_tokens += cost_list[1] * BATCH_API_DISCOUNT
 
     output_cost = (output_tokens / 1000000) * OUTPUT_COST_PER_MILLION_TOKENS
     input_cost = (input_tokens / 1000000) * INPUT_COST_PER_MILLION_TOKENS
@@ -0,0 +1,95 @@
+"""Python script for the checkpoint of a backfill: the pages and cases of each search loaded so far,
+kept in a local SQLite file so a backfill that stopped can carry on from where it was, and the split
+of the pages of a search into shards run by separate processes"""
+
+from os import getenv
+from threading import Lock
+import sqlite3
+import time
+
+CHECKPOINT_PATH = getenv("BACKFILL_CHECKPOINT_PATH", "backfill_checkpoint.sqlite")
+CHECKPOINT_TIMEOUT_SECONDS = 30  # waits for the other shard processes writing to the file
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """Reads a shard given as INDEX/COUNT, e.g. 0/4 for the first of four shards"""
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError as e:
+        raise ValueError(f"Shard should be INDEX/COUNT, not {shard!r}") from e
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index should be from 0 to {count - 1}, not {index}")
+    return index, count
+
+
+def get_shard_pages(max_page_num: int, shard_index: int = 0, shard_count: int = 1) -> list[int]:
+    """Returns the page numbers of a shard, every shard_count-th page so each shard gets
+    as many old and new pages as the others"""
+    return list(range(1 + shard_index, max_page_num + 1, shard_count))
+
+
+class BackfillCheckpoint:
+    """Record of the pages loaded by a backfill and the cases on them, by search URL,
+    written once a page's transaction is committed"""
+
+    def __init__(self, checkpoint_path: str = CHECKPOINT_PATH):
+        self.lock = Lock()
+        self.conn = sqlite3.connect(
+            checkpoint_path, timeout=CHECKPOINT_TIMEOUT_SECONDS, check_same_thread=False
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS loaded_page (
+                search_url TEXT NOT NULL,
+                page_num INTEGER NOT NULL,
+                cases INTEGER NOT NULL,
+                loaded_at REAL NOT NULL,
+                PRIMARY KEY (search_url, page_num)
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS loaded_case (
+                search_url TEXT NOT NULL,
+                citation TEXT NOT NULL,
+                page_num INTEGER NOT NULL,
+                PRIMARY KEY (search_url, citation)
+            )"""
+        )
+        self.conn.commit()
+
+    def get_loaded_pages(self, search_url: str) -> set[int]:
+        """Returns the pages of a search already loaded"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT page_num FROM loaded_page WHERE search_url = ?", (search_url,)
+            )
+            return {row[0] for row in rows}
+
+    def count_loaded_cases(self, search_url: str) -> int:
+        """Returns the number of cases of a search loaded so far"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM loaded_case WHERE search_url = ?", (search_url,)
+            ).fetchone()[0]
+
+    def mark_page_loaded(self, search_url: str, page_num: int, citations: list[str]) -> None:
+        """Records a page and its cases as loaded, both in one transaction"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO loaded_page(search_url, page_num, cases, loaded_at)
+                VALUES (?, ?, ?, ?)""",
+                (search_url, page_num, len(citations), time.time()),
+            )
+            self.conn.executemany(
+                """INSERT OR REPLACE INTO loaded_case(search_url, citation, page_num)
+                VALUES (?, ?, ?)""",
+                ((search_url, citation, page_num) for citation in citations),
+            )
+
+    def reset(self, search_url: str, page_nums: list[int]) -> None:
+        """Forgets the given pages of a search, for a backfill started again from scratch"""
+        with self.lock, self.conn:
+            for table in ("loaded_page", "loaded_case"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE search_url = ? AND page_num = ?",
+                    ((search_url, page_num) for page_num in page_nums),
+                )
@@ -0,0 +1,83 @@
+"""Python script for the incremental crawl of the live pipeline: a high-water mark of the newest
+judgment date loaded and the citations loaded on that date, and a crawl of the newest-first search
+results that stops at the first page without a new judgment"""
+
+from datetime import date, datetime
+from extract import get_listing_items
+
+LOG_DATE_FORMAT = "%d-%m-%Y"
+
+
+def get_listing_date(listing: dict) -> date | None:
+    """Returns the judgment date of a listing, given as e.g. '3 Feb 2003, midnight'"""
+    date_string = listing.get("date")
+    if not isinstance(date_string, str):
+        return None
+    try:
+        return datetime.strptime(date_string.split(",")[0].strip(), "%d %b %Y").date()
+    except ValueError:
+        pass
+    try:
+        return date.fromisoformat(date_string[:10])
+    except ValueError:
+        return None
+
+
+class HighWaterMark:
+    """The newest judgment date loaded and the set of citations loaded on that date,
+    everything older is treated as already loaded"""
+
+    def __init__(self, mark_date: date, citations=()):
+        self.date = mark_date
+        self.citations = set(citations)
+
+    @classmethod
+    def from_json(cls, log_json: dict) -> "HighWaterMark":
+        """Reads the mark from log.json, or from its old format of a date and the citations
+        loaded on it"""
+        if "date" in log_json:
+            return cls(date.fromisoformat(log_json["date"]), log_json.get("citations", ()))
+        log_date, log = next(iter(log_json.items()))
+        return cls(datetime.strptime(log_date, LOG_DATE_FORMAT).date(), log)
+
+    def to_json(self) -> dict:
+        """Returns the mark as saved to log.json"""
+        return {"date": self.date.isoformat(), "citations": sorted(self.citations)}
+
+    def get_log_date(self) -> str:
+        """Returns the mark's date as the pipeline's log dates are written"""
+        return self.date.strftime(LOG_DATE_FORMAT)
+
+    def is_new(self, listing: dict) -> bool:
+        """Checks whether a listed judgment is newer than the mark or a new one on its date"""
+        listing_date = get_listing_date(listing)
+        if listing_date is None or not listing.get("citation"):
+            return False
+        return listing_date > self.date or (
+            listing_date == self.date and listing["citation"] not in self.citations
+        )
+
+    def add(self, judgments: list[dict]) -> None:
+        """Moves the mark on to the judgments loaded"""
+        for judgment in judgments:
+            judgment_date = get_listing_date(judgment)
+            if judgment_date is None or judgment_date < self.date:
+                continue
+            if judgment_date > self.date:
+                self.date = judgment_date
+                self.citations = set()
+            self.citations.add(judgment["citation"])
+
+
+def crawl_new_listings(url_no_page_num: str, mark: HighWaterMark, max_pages: int | None = None):
+    """Yields the page number and the listings new to the mark of each page of newest-first search
+    results, stopping at the first page with none. The mark should only be moved on once the
+    crawl is over, as the pages after a moved mark would look already loaded"""
+    page_num = 1
+    while max_pages is None or page_num <= max_pages:
+        listings = get_listing_items(url_no_page_num, page_num)
+        new_listings = [(href, listing) for href, listing in listings if mark.is_new(listing)]
+        if not new_listings:
+            return
+        yield page_num, new_listings
+        page_num += 1
@@ -0,0 +1,160 @@
+"""Python script to evaluate the transcripts condensed to their key sections against the first and
+last 4000 tokens kept by the truncation, on the judgments of the page archive or saved pages. It
+reports the input tokens of both prompts and, unless --tokens-only, how often each field of GPT's
+replies to the two agrees. Replies come from the GPT cache for transcripts sent before, so the
+truncated prompts the pipeline already sent cost nothing"""
+
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import mean
+import re
+import prompts
+from calculate_gpt_cost import INPUT_COST_PER_MILLION_TOKENS
+from gpt_schema import CASE_SCHEMA
+from html_parsing import get_article_text
+from page_archive import PAGE_ARCHIVE_DIR, PageArchive
+from transform import build_user_message, get_encoder, get_gpt_reply
+
+DEFAULT_TOKEN_BUDGET = 3000
+DEFAULT_LIMIT = 50
+PARTICIPANT_FIELDS = ("first_side", "second_side")
+# compared by the words they share, as two summaries are never worded the same
+TEXT_FIELDS = ("summary", "verdict_summary")
+
+
+def read_archived_transcripts(archive_dir: str, limit: int = DEFAULT_LIMIT) -> dict[str, str]:
+    """Returns the article text of up to limit judgments of the page archive, by URL"""
+    archive = PageArchive(archive_dir)
+    transcripts = {}
+    for url in archive.get_urls():
+        if len(transcripts) == limit:
+            break
+        content = archive.read(url)
+        if "/search" in url or content is None:
+            continue
+        try:
+            transcripts[url] = get_article_text(content)
+        except AttributeError:
+            continue
+    return transcripts
+
+
+def read_saved_transcripts(folder: str, limit: int = DEFAULT_LIMIT) -> dict[str, str]:
+    """Returns the transcripts of up to limit saved judgment pages (.html) or texts (.txt)"""
+    transcripts = {}
+    for path in sorted(Path(folder).glob("*.*"))[:limit]:
+        if path.suffix == ".html":
+            transcripts[path.name] = get_article_text(path.read_bytes())
+        elif path.suffix == ".txt":
+            transcripts[path.name] = path.read_text(encoding="utf-8")
+    return transcripts
+
+
+def normalise(value: str) -> str:
+    """Lowercases a value and keeps only its words, so spacing and punctuation don't count"""
+    return " ".join(re.findall(r"[a-z0-9]+", value.lower()))
+
+
+def get_values(reply: dict, field: str) -> set[str]:
+    """Returns the normalised values of a field of a reply, the names, lawyers and law firms
+    of a side, the items of a list or the words of a summary"""
+    value = reply.get(field)
+    if field in PARTICIPANT_FIELDS:
+        return {
+            normalise(participant[key])
+            for participant in value or []
+            if isinstance(participant, dict)
+            for key in ("name", "lawyer", "law_firm")
+            if isinstance(participant.get(key), str)
+        } - {""}
+    if isinstance(value, list):
+        return {normalise(item) for item in value if isinstance(item, str)} - {""}
+    if not isinstance(value, str):
+        return set()
+    if field in TEXT_FIELDS:
+        return set(normalise(value).split())
+    return {normalise(value)} - {""}
+
+
+def compare_field(field: str, first: dict, second: dict) -> float:
+    """Returns the agreement of a field of two replies, the share of their values in common"""
+    first_values, second_values = get_values(first, field), get_values(second, field)
+    if not first_values and not second_values:
+        return 1.0
+    return len(first_values & second_values) / len(first_values | second_values)
+
+
+def compare_replies(baseline: dict, condensed: dict) -> dict[str, float]:
+    """Returns the agreement of every field GPT is asked for"""
+    return {field: compare_field(field, baseline, condensed) for field in CASE_SCHEMA["required"]}
+
+
+def count_prompt_tokens(user_message: str) -> int:
+    """Returns the input tokens of the system and user messages of a prompt"""
+    return len(get_encoder().encode(prompts.SYSTEM_MESSAGE + user_message))
+
+
+def evaluate(transcripts: dict[str, str], token_budget: int, ask_gpt: bool = True) -> list[dict]:
+    """Builds the truncated and condensed prompts of every transcript, counting their tokens
+    and comparing GPT's replies to them when ask_gpt"""
+    results = []
+    for name, transcript in transcripts.items():
+        baseline = build_user_message(transcript, 0)
+        condensed = build_user_message(transcript, token_budget)
+        result = {
+            "name": name,
+            "baseline_tokens": count_prompt_tokens(baseline),
+            "condensed_tokens": count_prompt_tokens(condensed),
+        }
+        if ask_gpt:
+            result["agreement"] = compare_replies(get_gpt_reply(baseline), get_gpt_reply(condensed))
+        results.append(result)
+        print(f"{name}: {result['baseline_tokens']} -> {result['condensed_tokens']} tokens")
+    return results
+
+
+def format_report(results: list[dict], token_budget: int) -> str:
+    """Formats the mean tokens and input cost of both prompts and the agreement of every field"""
+    baseline = mean(result["baseline_tokens"] for result in results)
+    condensed = mean(result["condensed_tokens"] for result in results)
+    lines = [
+        f"{len(results)} transcripts, budget of {token_budget} tokens",
+        f"Mean prompt tokens: truncated {baseline:.0f}, condensed {condensed:.0f} "
+        f"({(condensed - baseline) / baseline:+.1%})",
+        f"Input cost per 1000 cases: "
+        f"truncated ${baseline * INPUT_COST_PER_MILLION_TOKENS / 1000:.2f}, "
+        f"condensed ${condensed * INPUT_COST_PER_MILLION_TOKENS / 1000:.2f}",
+    ]
+    compared = [result["agreement"] for result in results if "agreement" in result]
+    if compared:
+        lines.append("Field agreement with the truncated prompt's reply (mean, share identical):")
+        for field in CASE_SCHEMA["required"]:
+            scores = [agreement[field] for agreement in compared]
+            identical = sum(score == 1.0 for score in scores) / len(scores)
+            lines.append(f"  {field:<16} {mean(scores):.2f} {identical:.0%}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Compare condensed transcripts with the truncation")
+    parser.add_argument("--archive", default=PAGE_ARCHIVE_DIR, help="page archive of judgments")
+    parser.add_argument("--saved", help="folder of saved .html judgment pages or .txt transcripts")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="most judgments compared")
+    parser.add_argument(
+        "--budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="tokens condensed to"
+    )
+    parser.add_argument(
+        "--tokens-only", action="store_true", help="count the tokens without asking GPT"
+    )
+    args = parser.parse_args()
+
+    if args.saved:
+        found = read_saved_transcripts(args.saved, args.limit)
+    elif args.archive:
+        found = read_archived_transcripts(args.archive, args.limit)
+    else:
+        sys.exit("Give a folder of saved judgments with --saved or a page archive with --archive")
+    if not found:
+        sys.exit("No judgments found to compare")
+    print(format_report(evaluate(found, args.budget, not args.tokens_only), args.budget))
@@ -1,30 +1,90 @@
 """Python script to read HTML of case law website and obtain available data for each case"""
 
-from bs4 import BeautifulSoup
+from collections.abc import Collection
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import date
+from os import getenv
+from urllib.parse import quote
 from bs4.element import Tag
-import requests
+from html_parsing import get_article_text, parse_only, stream_article_text
+from page_archive import fetch, fetch_stream
+
+ARTICLE_FETCH_WORKERS = 8
+# articles are parsed as they download, keeping only the start and end of the text the GPT prompt
+# uses, so the memory needed for a judgment does not grow with its length
+ARTICLE_STREAMING = getenv("ARTICLE_STREAMING", "").lower() in ("1", "true", "yes")
+ARTICLE_MAX_BYTES = int(getenv("ARTICLE_MAX_BYTES", str(64 * 1024 * 1024)))
+SEARCH_URL = "https://caselaw.nationalarchives.gov.uk/judgments/search"
+COURTS = (
+    "uksc",
+    "ukpc",
+    "ewca/civ",
+    "ewca/crim",
+    "ewhc/admin",
+    "ewhc/admlty",
+    "ewhc/ch",
+    "ewhc/comm",
+    "ewhc/fam",
+    "ewhc/ipec",
+    "ewhc/kb",
+    "ewhc/mercantile",
+    "ewhc/pat",
+    "ewhc/scco",
+    "ewhc/tcc",
+)
+
+
+def construct_search_url(
+    from_date: date, to_date: date | None = None, courts=COURTS, order: str = "date"
+) -> str:
+    """Constructs the URL of the search for the judgments of the courts from a date up to
+    another (or up to now), ending just before the page number"""
+    to_day, to_month, to_year = (to_date.day, to_date.month, to_date.year) if to_date else ("",) * 3
+    court_params = "".join(f"&court={quote(court, safe='')}" for court in courts)
+    return (
+        f"{SEARCH_URL}?per_page=50&order={order}&query="
+        f"&from_date_0={from_date.day}&from_date_1={from_date.month}&from_date_2={from_date.year}"
+        f"&to_date_0={to_day}&to_date_1={to_month}&to_date_2={to_year}"
+        f"{court_params}&party=&judge=&page="
+    )
 
 
 def get_article_data(href: str) -> str:
-    """Returns text contents of a single case by returning article tag contents"""
+    """Returns text contents of a single case by returning article tag contents, when streaming
+    only the start and end of a very long judgment are kept"""
 
     base_url = "https://caselaw.nationalarchives.gov.uk"
-    page = requests.get(base_url + href, timeout=30)
+    if ARTICLE_STREAMING:
+        # closed here, as the traceback of an error would keep the response and its host's
+        # connection slot open until the garbage collector got to it
+        with closing(
+            fetch_stream(base_url + href, timeout=30, max_bytes=ARTICLE_MAX_BYTES)
+        ) as chunks:
+            return stream_article_text(chunks)
+    content = fetch(base_url + href, timeout=30)
+
+    text_raw = get_article_text(content)
+    return text_raw
 
-    soup = BeautifulSoup(page.content, "html.parser")
-    article_only = soup.article
 
-    text_raw = article_only.get_text()
-    return text_raw
+def get_articles_data(hrefs: list[str], max_workers: int = ARTICLE_FETCH_WORKERS) -> list[str]:
+    """Returns the text contents of several cases, in the same order as the hrefs given,
+    downloading them concurrently when more than one worker is allowed"""
+    if max_workers <= 1 or len(hrefs) <= 1:
+        return [get_article_data(href) for href in hrefs]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(hrefs))) as executor:
+        return list(executor.map(get_article_data, hrefs))
 
 
 def get_max_page_num(url_no_page_num: str) -> int:
     """Returns the maximum page number available for a given URL"""
     url = url_no_page_num + "1"
 
-    page = requests.get(url, timeout=10)
-    soup = BeautifulSoup(page.content, "html.parser")
-    pagination = soup.find("nav", {"aria-label": "Results pagination"})
+    content = fetch(url, timeout=10)
+    pagination_attrs = {"aria-label": "Results pagination"}
+    soup = parse_only(content, "nav", pagination_attrs)
+    pagination = soup.find("nav", pagination_attrs)
     if not pagination:
         return 0
     page_links = pagination.find_all("a", class_="pagination__page-link")
@@ -54,8 +114,8 @@ def validate_html_data(data: dict) -> bool:
     return True
 
 
-def extract_judgment_data(case: Tag, base_url: str, already_loaded: list) -> dict:
-    """Extracts judgment data from a list item."""
+def parse_judgment_listing(case: Tag, base_url: str) -> tuple[str, dict]:
+    """Returns the article href and the listing data (everything but the text) of a list item"""
     title_tag = case.find("span", class_="judgment-listing__title")
     court_tag = case.find("span", class_="judgment-listing__court")
     citation_tag = case.find("span", class_="judgment-listing__neutralcitation")
@@ -67,30 +127,35 @@ def extract_judgment_data(case: Tag, base_url: str, already_loaded: list) -> dic
     citation = citation_tag.get_text(strip=True) if citation_tag else None
     date = date_tag.get("datetime") if date_tag else None
 
-    if citation not in already_loaded:
-        html_data = {
-            "title": title,
-            "url": base_url + href,
-            "court": court,
-            "citation": citation,
-            "date": date,
-            "text_raw": get_article_data(href),
-        }
+    listing = {
+        "title": title,
+        "url": base_url + href,
+        "court": court,
+        "citation": citation,
+        "date": date,
+    }
+    return href, listing
+
+
+def extract_judgment_data(case: Tag, base_url: str, already_loaded: Collection[str]) -> dict:
+    """Extracts judgment data from a list item."""
+    href, listing = parse_judgment_listing(case, base_url)
+
+    if listing["citation"] not in already_loaded:
+        html_data = listing | {"text_raw": get_article_data(href)}
         if validate_html_data(html_data):
             return html_data
     return None
 
 
-def get_listing_data(
-    url_no_page_num: str, page_num: int, already_loaded:list|None = None
-) -> list[dict]:
-    """Returns a list of dictionaries with the data for a given page number sorting by oldest"""
+def get_listing_items(url_no_page_num: str, page_num: int) -> list[tuple[str, dict]]:
+    """Returns the article href and listing data of every case on a given page number"""
 
     url = url_no_page_num + str(page_num)
     base_url = "https://caselaw.nationalarchives.gov.uk"
-    page = requests.get(url, timeout=30)
+    content = fetch(url, timeout=30)
 
-    soup = BeautifulSoup(page.content, "html.parser")
+    soup = parse_only(content, "ul", {"class": "judgment-listing__list"})
 
     ul_tag = soup.find("ul", class_="judgment-listing__list")
 
@@ -98,18 +163,46 @@ def get_listing_data(
         return []
     cases_list = ul_tag.find_all("li")
 
-    judgments = []
-    if not already_loaded:
-        already_loaded = []
+    return [parse_judgment_listing(case, base_url) for case in cases_list]
 
-    for case in cases_list:
-        judgment_data = extract_judgment_data(case, base_url, already_loaded)
-        if judgment_data:
+
+def get_judgments(
+    listings: list[tuple[str, dict]],
+    already_loaded: Collection[str] | None = None,
+    max_workers: int = ARTICLE_FETCH_WORKERS,
+) -> list[dict]:
+    """Downloads the article of every listed case not already loaded, concurrently,
+    and returns the valid cases in listing order"""
+    already_loaded = set(already_loaded or ())
+
+    new_listings = [
+        (href, listing)
+        for href, listing in listings
+        if listing["citation"] not in already_loaded
+    ]
+    texts = get_articles_data([href for href, _ in new_listings], max_workers)
+
+    judgments = []
+    for (_, listing), text_raw in zip(new_listings, texts):
+        judgment_data = listing | {"text_raw": text_raw}
+        if validate_html_data(judgment_data):
             judgments.append(judgment_data)
 
     return judgments
 
 
+def get_listing_data(
+    url_no_page_num: str,
+    page_num: int,
+    already_loaded: Collection[str] | None = None,
+    max_workers: int = ARTICLE_FETCH_WORKERS,
+) -> list[dict]:
+    """Returns a list of dictionaries with the data for a given page number sorting by oldest"""
+    return get_judgments(
+        get_listing_items(url_no_page_num, page_num), already_loaded, max_workers
+    )
+
+
 if __name__ == "__main__":
     URL_NO_PAGE_NUM = """https://caselaw.nationalarchives.gov.uk/judgments/search?per_page=50&order=date&query=&from_date_0=12&from_date_1=8&from_date_2=2024&to_date_0=&to_date_1=&to_date_2=&court=uksc&court=ukpc&court=ewca%2Fciv&court=ewca%2Fcrim&court=ewhc%2Fadmin&court=ewhc%2Fadmlty&court=ewhc%2Fch&court=ewhc%2Fcomm&court=ewhc%2Ffam&court=ewhc%2Fipec&court=ewhc%2Fkb&court=ewhc%2Fmercantile&court=ewhc%2Fpat&court=ewhc%2Fscco&court=ewhc%2Ftcc&party=&judge=&page="""
     print(get_listing_data(URL_NO_PAGE_NUM, 5))
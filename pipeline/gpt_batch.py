@@ -0,0 +1,309 @@
+"""Python script to summarise a whole date range of court cases through the OpenAI Batch API,
+which halves the GPT cost in exchange for results arriving within 24 hours"""
+
+from os import makedirs, path
+import json
+import logging
+import time
+from openai import OpenAI
+import prompts
+from openai_client import get_openai_client
+from gpt_cache import get_cache_key, get_gpt_cache
+from gpt_schema import get_invalid_fields, get_response_format
+from transform import (
+    GPT_MODEL,
+    GPT_TEMPERATURE,
+    build_messages,
+    build_user_message,
+    parse_gpt_content,
+    log_usage,
+)
+
+logger = logging.getLogger("pipeline")
+
+# the Batch API accepts up to 50,000 requests and 200 MB per input file
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+POLL_SECONDS = 60
+UPLOAD_TIMEOUT_SECONDS = 900
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+MANIFEST_FILE = "manifest.json"
+CASES_FILE = "cases.jsonl"
+
+
+class UsageTokens:  # pylint: disable=too-few-public-methods
+    """Token usage read from a batch result line, shaped like a completion's usage"""
+
+    def __init__(self, usage: dict):
+        self.completion_tokens = usage.get("completion_tokens", 0)
+        self.prompt_tokens = usage.get("prompt_tokens", 0)
+        self.total_tokens = usage.get("total_tokens", 0)
+
+
+def build_batch_request(custom_id: str, user_message: str) -> dict:
+    """Returns the Batch API request summarising a single shortened transcript"""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": GPT_MODEL,
+            "messages": build_messages(prompts.SYSTEM_MESSAGE, user_message),
+            "temperature": GPT_TEMPERATURE,
+            "response_format": get_response_format(),
+        },
+    }
+
+
+def load_manifest(batch_dir: str) -> dict:
+    """Reads the record of the batch files written and submitted so far"""
+    manifest_path = path.join(batch_dir, MANIFEST_FILE)
+    if not path.exists(manifest_path):
+        return {"files": [], "batches": {}, "loaded": []}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(batch_dir: str, manifest: dict) -> None:
+    """Saves the record of the batch files so a backfill can be resumed"""
+    with open(path.join(batch_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+class BatchFileWriter:
+    """Writes batch requests to as many JSONL files as the Batch API limits require"""
+
+    def __init__(self, batch_dir: str, prefix: str = "requests"):
+        self.batch_dir = batch_dir
+        self.prefix = prefix
+        self.files = []
+        self.file = None
+        self.requests = 0
+        self.bytes = 0
+
+    def open_next_file(self) -> None:
+        """Closes the current file and starts a new one"""
+        self.close()
+        file_name = path.join(self.batch_dir, f"{self.prefix}_{len(self.files) + 1}.jsonl")
+        self.file = open(file_name, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+        self.files.append(file_name)
+        self.requests = 0
+        self.bytes = 0
+
+    def write(self, request: dict) -> None:
+        """Adds a request to the current file, starting a new file once it is full"""
+        line = json.dumps(request) + "\n"
+        size = len(line.encode("utf-8"))
+        if (
+            self.file is None
+            or self.requests >= MAX_REQUESTS_PER_FILE
+            or self.bytes + size > MAX_BYTES_PER_FILE
+        ):
+            self.open_next_file()
+        self.file.write(line)
+        self.requests += 1
+        self.bytes += size
+
+    def close(self) -> None:
+        """Closes the current file"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def write_batch_files(pages, batch_dir: str, cache=None) -> list[str]:
+    """Writes a request for every scraped case missing from the GPT cache to JSONL batch files,
+    and the case's html data without the transcript to the cases file, returning the batch file names.
+    Requests are identified by their cache key, and a judgment listed on two pages is only
+    requested once, as the Batch API rejects a file with a custom id used twice"""
+    cache = cache or get_gpt_cache()
+    makedirs(batch_dir, exist_ok=True)
+    writer = BatchFileWriter(batch_dir)
+    requested = set()
+    with open(path.join(batch_dir, CASES_FILE), "w", encoding="utf-8") as cases_file:
+        for page_num, data in pages:
+            for case in data:
+                user_message = build_user_message(case.pop("text_raw"))
+                cache_key = get_cache_key(
+                    prompts.SYSTEM_MESSAGE,
+                    user_message,
+                    GPT_MODEL,
+                    GPT_TEMPERATURE,
+                    get_response_format(),
+                )
+                if cache_key not in requested and cache.get(cache_key) is None:
+                    writer.write(build_batch_request(cache_key, user_message))
+                    requested.add(cache_key)
+                cases_file.write(
+                    json.dumps({"page": page_num, "cache_key": cache_key, "case": case}) + "\n"
+                )
+    writer.close()
+    return writer.files
+
+
+def submit_batch_file(client: OpenAI, file_name: str) -> str:
+    """Uploads a batch file and creates a batch for it, returning the batch id"""
+    with open(file_name, "rb") as f:
+        uploaded = client.files.create(
+            file=f, purpose="batch", timeout=UPLOAD_TIMEOUT_SECONDS
+        )
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+    )
+    logger.info("Submitted %s as batch %s", file_name, batch.id)
+    return batch.id
+
+
+def wait_for_batches(
+    client: OpenAI, batch_ids: list[str], poll_seconds: float = POLL_SECONDS, sleep=time.sleep
+) -> list:
+    """Polls the batches until every one of them has finished and returns them"""
+    finished = {}
+    while len(finished) < len(batch_ids):
+        for batch_id in batch_ids:
+            if batch_id in finished:
+                continue
+            batch = client.batches.retrieve(batch_id)
+            if batch.status in FINISHED_STATUSES:
+                logger.info("Batch %s finished with status %s", batch_id, batch.status)
+                finished[batch_id] = batch
+        if len(finished) < len(batch_ids):
+            sleep(poll_seconds)
+    return [finished[batch_id] for batch_id in batch_ids]
+
+
+def read_failed_requests(file_names: list[str], results: dict[str, str]) -> list[dict]:
+    """Returns the requests of the batch files that have no result, once each"""
+    failed = {}
+    for file_name in file_names:
+        with open(file_name, "r", encoding="utf-8") as f:
+            for line in f:
+                request = json.loads(line)
+                if request["custom_id"] not in results:
+                    failed.setdefault(request["custom_id"], request)
+    return list(failed.values())
+
+
+def resubmit_failed_requests(client: OpenAI, batch_dir: str, manifest: dict, results: dict) -> None:
+    """Writes the requests that failed, or whose batch failed or expired, to new batch files,
+    submits them and adds their results once they finish"""
+    failed = read_failed_requests(manifest["files"], results)
+    if not failed:
+        return
+    logger.warning("Resubmitting %s failed batch requests", len(failed))
+    writer = BatchFileWriter(batch_dir, f"retry_{len(manifest['files'])}")
+    for request in failed:
+        writer.write(request)
+    writer.close()
+    manifest["files"].extend(writer.files)
+    save_manifest(batch_dir, manifest)
+    batch_ids = []
+    for file_name in writer.files:
+        manifest["batches"][file_name] = submit_batch_file(client, file_name)
+        batch_ids.append(manifest["batches"][file_name])
+        save_manifest(batch_dir, manifest)
+    for batch in wait_for_batches(client, batch_ids):
+        results.update(read_batch_results(client, batch))
+
+
+def read_batch_results(client: OpenAI, batch) -> dict[str, str]:
+    """Returns GPT's reply to every successful request of a finished batch by its custom id"""
+    results = {}
+    if not batch.output_file_id:
+        logger.warning("Batch %s has no output (%s)", batch.id, batch.status)
+        return results
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            logger.warning("Batch request %s failed: %s", result.get("custom_id"), result.get("error"))
+            continue
+        body = response["body"]
+        log_usage(UsageTokens(body.get("usage", {})), "GPT-4o-mini batch usage cost")
+        results[result["custom_id"]] = body["choices"][0]["message"]["content"]
+    return results
+
+
+def read_cases_by_page(batch_dir: str) -> dict[int, list[dict]]:
+    """Reads back the html data and cache key of every case written to the batch files,
+    grouped by page"""
+    pages = {}
+    with open(path.join(batch_dir, CASES_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            pages.setdefault(record["page"], []).append(record)
+    return pages
+
+
+def combine_results(records: list[dict], results: dict[str, str], cache=None) -> list[dict]:
+    """Combines the html data of cases with their GPT data, like transform.get_data does.
+    Valid new replies are stored in the GPT cache and the cases left out of the batch are
+    read from it. Invalid replies are not repaired as the transcripts are not kept"""
+    cache = cache or get_gpt_cache()
+    combined = []
+    for record in records:
+        case = record["case"]
+        content = results.get(record["cache_key"])
+        if content is None:
+            cached = cache.get(record["cache_key"])
+            gpt_data = cached["reply"] if cached is not None else None
+        else:
+            gpt_data = parse_gpt_content(content)
+            if gpt_data is not None and not get_invalid_fields(gpt_data):
+                cache.set(record["cache_key"], {"reply": gpt_data})
+        if gpt_data:
+            combined.append(case | gpt_data)
+        else:
+            combined.append(None)
+    return combined
+
+
+def run_batch_backfill(
+    pages, batch_dir: str, load_page, client: OpenAI = None, cache=None
+) -> int:
+    """Runs a backfill through the Batch API: writes the requests for every page, submits
+    them, waits for the results and gives the combined data of each page to load_page.
+    Requests that failed are resubmitted once, a page still missing cases after that is
+    loaded but not checkpointed, so rerunning resubmits them again. The manifest in batch_dir
+    lets an interrupted backfill carry on where it stopped. Returns the number of cases loaded"""
+    client = client or get_openai_client()
+    cache = cache or get_gpt_cache()
+    manifest = load_manifest(batch_dir)
+
+    if not manifest.get("written", bool(manifest["files"])):
+        manifest["files"] = write_batch_files(pages, batch_dir, cache)
+        manifest["written"] = True
+        save_manifest(batch_dir, manifest)
+
+    for file_name in manifest["files"]:
+        if file_name not in manifest["batches"]:
+            manifest["batches"][file_name] = submit_batch_file(client, file_name)
+            save_manifest(batch_dir, manifest)
+
+    results = {}
+    for batch in wait_for_batches(client, list(manifest["batches"].values())):
+        results.update(read_batch_results(client, batch))
+    resubmit_failed_requests(client, batch_dir, manifest, results)
+
+    cases_count = 0
+    for page_num, records in sorted(read_cases_by_page(batch_dir).items()):
+        if page_num in manifest["loaded"]:
+            continue
+        combined = combine_results(records, results, cache)
+        load_page(page_num, combined)
+        loaded_cases = sum(case is not None for case in combined)
+        cases_count += loaded_cases
+        if loaded_cases < len(combined):
+            logger.warning(
+                "Page %s is missing %s cases, left to a rerun", page_num, len(combined) - loaded_cases
+            )
+            continue
+        manifest["loaded"].append(page_num)
+        save_manifest(batch_dir, manifest)
+    return cases_count
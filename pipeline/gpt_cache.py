@@ -0,0 +1,183 @@
+"""Python script for the cache of GPT replies, keyed on a hash of everything sent to the model
+so that a reply is reused only while the transcript, prompt, schema, model and temperature are unchanged.
+Uses Redis when it is available and a local SQLite file otherwise"""
+
+from os import getenv
+from hashlib import sha256
+from threading import Lock
+import json
+import logging
+import sqlite3
+import time
+import redis
+
+logger = logging.getLogger("pipeline")
+
+CACHE_KEY_PREFIX = "gpt:"
+CACHE_TTL_SECONDS = int(getenv("GPT_CACHE_TTL_SECONDS", str(90 * 24 * 60 * 60)))
+LOCAL_CACHE_PATH = getenv("GPT_CACHE_PATH", "gpt_cache.sqlite")
+LOCAL_CACHE_MAX_ENTRIES = int(getenv("GPT_CACHE_MAX_ENTRIES", "50000"))
+REDIS_HOST = getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(getenv("REDIS_PORT", "6379"))
+
+
+def get_cache_key(
+    system_message: str,
+    user_message: str,
+    model: str,
+    temperature: float,
+    response_format: dict | None = None,
+) -> str:
+    """Returns the cache key of a GPT request, a hash of the prompt, the shortened
+    transcript, the model, the temperature and the format of the reply"""
+    request = json.dumps(
+        [system_message, user_message, model, temperature, response_format], sort_keys=True
+    )
+    return CACHE_KEY_PREFIX + sha256(request.encode("utf-8")).hexdigest()
+
+
+class RedisCache:
+    """GPT reply cache stored in Redis, entries expire after the TTL and Redis evicts
+    the least recently used ones if it is configured with maxmemory-policy allkeys-lru"""
+
+    def __init__(self, client: redis.Redis, ttl: int = CACHE_TTL_SECONDS):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key: str) -> dict | None:
+        """Returns the cached entry for a key, or None if missing or Redis is unreachable"""
+        try:
+            value = self.client.get(key)
+        except redis.exceptions.RedisError as e:
+            logger.warning("GPT cache read failed: %s", e)
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: dict) -> None:
+        """Stores an entry for the TTL, a failed write only loses the cached reply"""
+        try:
+            self.client.set(key, json.dumps(value), ex=self.ttl)
+        except redis.exceptions.RedisError as e:
+            logger.warning("GPT cache write failed: %s", e)
+
+
+class LocalCache:
+    """GPT reply cache stored in a SQLite file (or in memory with ':memory:'),
+    entries expire after the TTL and the least recently used are evicted past max_entries"""
+
+    def __init__(
+        self,
+        cache_path: str = LOCAL_CACHE_PATH,
+        ttl: int = CACHE_TTL_SECONDS,
+        max_entries: int = LOCAL_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS gpt_cache (
+                cache_key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def get(self, key: str) -> dict | None:
+        """Returns the cached entry for a key, or None if missing, expired or the file is
+        locked by another process for too long"""
+        try:
+            return self.read(key)
+        except sqlite3.Error as e:
+            self.rollback()
+            logger.warning("GPT cache read failed: %s", e)
+            return None
+
+    def read(self, key: str) -> dict | None:
+        """Reads an entry and marks it as used"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM gpt_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self.conn.execute("DELETE FROM gpt_cache WHERE cache_key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute(
+                "UPDATE gpt_cache SET last_used = ? WHERE cache_key = ?", (now, key)
+            )
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict) -> None:
+        """Stores an entry for the TTL, a failed write only loses the cached reply"""
+        try:
+            self.write(key, value)
+        except sqlite3.Error as e:
+            self.rollback()
+            logger.warning("GPT cache write failed: %s", e)
+
+    def write(self, key: str, value: dict) -> None:
+        """Stores an entry, evicting the least recently used past max_entries"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO gpt_cache(cache_key, value, expires_at, last_used)
+                VALUES (?, ?, ?, ?)""",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            self.conn.execute(
+                """DELETE FROM gpt_cache WHERE cache_key IN (
+                    SELECT cache_key FROM gpt_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+    def rollback(self) -> None:
+        """Drops the changes of a read or write that failed part way"""
+        with self.lock:
+            try:
+                self.conn.rollback()
+            except sqlite3.Error:
+                pass
+
+
+cache_lock = Lock()
+caches = {}
+
+
+def create_gpt_cache() -> RedisCache | LocalCache:
+    """Connects to Redis if a server is reachable, otherwise opens the local cache file"""
+    client = redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        decode_responses=True,
+        socket_connect_timeout=1,
+    )
+    try:
+        client.ping()
+        logger.info("Caching GPT replies in Redis at %s:%s", REDIS_HOST, REDIS_PORT)
+        return RedisCache(client)
+    except redis.exceptions.RedisError:
+        logger.info("Redis unavailable, caching GPT replies in %s", LOCAL_CACHE_PATH)
+        return LocalCache()
+
+
+def get_gpt_cache() -> RedisCache | LocalCache:
+    """Returns the GPT reply cache shared by the process, creating it on first use"""
+    with cache_lock:
+        if "default" not in caches:
+            caches["default"] = create_gpt_cache()
+        return caches["default"]
+
+
+def set_gpt_cache(cache: RedisCache | LocalCache) -> None:
+    """Replaces the shared cache, e.g. with an in-memory one in tests"""
+    with cache_lock:
+        caches["default"] = cache
@@ -0,0 +1,144 @@
+"""Python script with the JSON schema of GPT-4o-mini's replies, sent to the API as a structured
+output format, and the validator compiled from it that finds the fields of a reply that are invalid"""
+
+from typing import Callable
+
+VERDICTS = [
+    "Guilty",
+    "Not Guilty",
+    "Dismissed",
+    "Acquitted",
+    "Hung Jury",
+    "Claimant Wins",
+    "Defendant Wins",
+    "Settlement",
+    "Struck Out",
+    "Appeal Allowed",
+    "Appeal Dismissed",
+    "Other",
+]
+
+NULLABLE_STRING = {"type": ["string", "null"]}
+TEXT = {"type": "string", "minLength": 1}
+
+PARTICIPANT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": NULLABLE_STRING,
+        "lawyer": NULLABLE_STRING,
+        "law_firm": NULLABLE_STRING,
+    },
+    "required": ["name", "lawyer", "law_firm"],
+    "additionalProperties": False,
+}
+
+CASE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "case_number": NULLABLE_STRING,
+        "judge": {"type": "array", "items": TEXT, "minItems": 1},
+        "first_side": {"type": "array", "items": PARTICIPANT_SCHEMA, "minItems": 1},
+        "second_side": {"type": "array", "items": PARTICIPANT_SCHEMA, "minItems": 1},
+        "verdict": {"type": "string", "enum": VERDICTS},
+        "verdict_summary": TEXT,
+        "summary": TEXT,
+        "tags": {"type": "array", "items": TEXT, "minItems": 1},
+    },
+    "required": [
+        "case_number",
+        "judge",
+        "first_side",
+        "second_side",
+        "verdict",
+        "verdict_summary",
+        "summary",
+        "tags",
+    ],
+    "additionalProperties": False,
+}
+
+# checked by the validator but not accepted by the API in strict mode
+VALIDATOR_ONLY_KEYWORDS = ("minLength", "minItems")
+
+JSON_TYPES = {
+    "string": str,
+    "array": list,
+    "object": dict,
+    "null": type(None),
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def compile_schema(schema: dict) -> Callable[[object], bool]:
+    """Turns a JSON schema into a function checking whether a value matches it, so the
+    schema is walked once rather than for every reply. Strings must not be blank"""
+    checks = []
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        allowed = tuple(JSON_TYPES[json_type] for json_type in types)
+        checks.append(lambda value: isinstance(value, allowed))
+    if "enum" in schema:
+        options = frozenset(schema["enum"])
+        checks.append(lambda value: value in options)
+    if "minLength" in schema:
+        min_length = schema["minLength"]
+        checks.append(lambda value: not isinstance(value, str) or len(value.strip()) >= min_length)
+    if "minItems" in schema:
+        min_items = schema["minItems"]
+        checks.append(lambda value: not isinstance(value, list) or len(value) >= min_items)
+    if "items" in schema:
+        item_check = compile_schema(schema["items"])
+        checks.append(
+            lambda value: not isinstance(value, list) or all(item_check(item) for item in value)
+        )
+    if "properties" in schema:
+        field_checks = compile_fields(schema)
+        checks.append(
+            lambda value: not isinstance(value, dict) or not get_failures(field_checks, value)
+        )
+    return lambda value: all(check(value) for check in checks)
+
+
+def compile_fields(schema: dict) -> dict[str, Callable[[object], bool]]:
+    """Compiles the check of every property of an object schema"""
+    return {name: compile_schema(field) for name, field in schema["properties"].items()}
+
+
+def get_failures(field_checks: dict, value: dict) -> list[str]:
+    """Returns the names of the fields that are missing or fail their check"""
+    return [name for name, check in field_checks.items() if name not in value or not check(value[name])]
+
+
+case_field_checks = compile_fields(CASE_SCHEMA)
+
+
+def get_invalid_fields(reply: dict) -> list[str]:
+    """Returns the fields of a GPT reply that are missing or invalid, other keys are ignored"""
+    return get_failures(case_field_checks, reply)
+
+
+def strip_validator_keywords(schema):
+    """Returns a copy of a schema without the keywords the API does not accept in strict mode"""
+    if isinstance(schema, dict):
+        return {
+            key: strip_validator_keywords(value)
+            for key, value in schema.items()
+            if key not in VALIDATOR_ONLY_KEYWORDS
+        }
+    if isinstance(schema, list):
+        return [strip_validator_keywords(value) for value in schema]
+    return schema
+
+
+def get_response_format(fields: list[str] | None = None) -> dict:
+    """Returns the structured output format asking for a whole reply, or only some of its fields"""
+    fields = fields or CASE_SCHEMA["required"]
+    schema = strip_validator_keywords(CASE_SCHEMA)
+    schema["properties"] = {name: schema["properties"][name] for name in fields}
+    schema["required"] = list(fields)
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "court_case", "strict": True, "schema": schema},
+    }
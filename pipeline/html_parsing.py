@@ -0,0 +1,238 @@
+"""Python script for parsing the pages scraped from the case law website with lxml
+where it is installed, building only the element wanted into a tree, and pulling the text of a
+judgment's article out without keeping the rest of the page, or as the page downloads keeping
+only the start and end of the text"""
+
+from codecs import getincrementaldecoder
+from collections import deque
+from html.parser import HTMLParser
+from importlib.util import find_spec
+from io import BytesIO
+from os import getenv
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import HTMLTreeBuilder
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+from bs4.dammit import EncodingDetector, EntitySubstitution
+
+HTML_PARSER = getenv("HTML_PARSER", "lxml" if find_spec("lxml") else "html.parser")
+# the text inside these is left out, like BeautifulSoup's get_text does
+NON_TEXT_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+# BeautifulSoup turns a string of only whitespace into a newline or a space, except in these
+WHITESPACE_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+# tags BeautifulSoup closes as soon as they open
+VOID_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS)
+ASCII_SPACES = " \n\t\f\r"
+# bytes at the start of a streamed page searched for its declared encoding, as BeautifulSoup does
+ENCODING_SEARCH_BYTES = 2048
+# characters kept from each end of a streamed article, enough for the start and end tokens kept
+# by shorten_text_by_tokens even at 32 characters a token, so it shortens the text the same way
+ARTICLE_WINDOW_CHARS = int(getenv("ARTICLE_WINDOW_CHARS", str(256 * 1024)))
+# put where the middle of a long article was dropped, a paragraph of its own like the
+# condenser's placeholder, so the last paragraph of the start isn't joined to the first of the end
+OMITTED_TEXT_MARKER = "\n\n[...]\n\n"
+
+
+def parse_only(
+    content: bytes, name: str, attrs: dict | None = None, parser: str = HTML_PARSER
+) -> BeautifulSoup:
+    """Parses only the elements of a page with the name and attributes given, and everything
+    inside them, into a soup that can be searched like the whole page"""
+    return BeautifulSoup(content, parser, parse_only=SoupStrainer(name, attrs or {}))
+
+
+def as_soup_string(text: str, keep_whitespace: bool) -> str:
+    """Returns a string of text as BeautifulSoup keeps it, a string of only whitespace
+    becomes a newline if it has one and a space otherwise"""
+    if keep_whitespace or text.strip(ASCII_SPACES):
+        return text
+    return "\n" if "\n" in text else " "
+
+
+def iter_text(element, with_tail: bool = False, keep_whitespace: bool = False):
+    """Yields the strings of an lxml element and its descendants in document order as
+    BeautifulSoup's get_text does, leaving out comments and scripts"""
+    if isinstance(element.tag, str) and element.tag not in NON_TEXT_TAGS:
+        keep_child_whitespace = keep_whitespace or element.tag in WHITESPACE_TAGS
+        if element.text:
+            yield as_soup_string(element.text, keep_child_whitespace)
+        for child in element:
+            yield from iter_text(child, True, keep_child_whitespace)
+    if with_tail and element.tail:
+        yield as_soup_string(element.tail, keep_whitespace)
+
+
+def get_article_text(content: bytes, parser: str = HTML_PARSER) -> str:
+    """Returns the text of the first article of a page, raising AttributeError if it has none.
+    With lxml the page is parsed as a stream that stops at the end of the article, and the
+    elements before it are cleared as soon as they are parsed"""
+    if parser != "lxml":
+        return parse_only(content, "article", parser=parser).article.get_text()
+
+    from lxml import etree  # pylint: disable=import-outside-toplevel
+
+    encoding = EncodingDetector.find_declared_encoding(content, is_html=True) or "utf-8"
+    depth = 0
+    try:
+        for event, element in etree.iterparse(
+            BytesIO(content), events=("start", "end"), html=True, encoding=encoding
+        ):
+            if element.tag == "article":
+                depth += 1 if event == "start" else -1
+                if depth == 0:
+                    return "".join(iter_text(element))
+            elif event == "end" and depth == 0:
+                element.clear(keep_tail=True)
+    except etree.XMLSyntaxError:  # raised for an empty page
+        pass
+    raise AttributeError("The page has no article")
+
+
+class TextWindow:
+    """The first head_chars and a rolling buffer of the last tail_chars of a text added in
+    pieces, the text in between is dropped as it arrives and marked by OMITTED_TEXT_MARKER"""
+
+    def __init__(self, head_chars: int = ARTICLE_WINDOW_CHARS, tail_chars: int = ARTICLE_WINDOW_CHARS):
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self.head = []
+        self.head_size = 0
+        self.tail = deque()
+        self.tail_size = 0
+        self.tail_added = 0
+
+    def add(self, text: str) -> None:
+        """Adds the next piece of the text"""
+        if self.head_size < self.head_chars:
+            room = self.head_chars - self.head_size
+            self.head.append(text[:room])
+            self.head_size += len(self.head[-1])
+            text = text[room:]
+        if text:
+            self.tail.append(text)
+            self.tail_size += len(text)
+            self.tail_added += len(text)
+            while self.tail_size - len(self.tail[0]) >= self.tail_chars:
+                self.tail_size -= len(self.tail.popleft())
+
+    def get_text(self) -> str:
+        """Returns the start and end of the text with the marker between them, or all of the
+        text if it fitted"""
+        tail = "".join(self.tail)
+        if self.tail_added <= self.tail_chars:
+            return "".join(self.head) + tail
+        return "".join(self.head) + OMITTED_TEXT_MARKER + tail[len(tail) - self.tail_chars :]
+
+
+class ArticleTextParser(HTMLParser):
+    """Tokenises a page fed in chunks and hands each string of its first article to add_text,
+    the same strings a BeautifulSoup tree built by html.parser gives get_text, without building
+    a tree or keeping more of the page than the chunk being tokenised"""
+
+    def __init__(self, add_text):
+        super().__init__(convert_charrefs=False)  # references are converted like BeautifulSoup
+        self.add_text = add_text
+        self.data = []
+        self.open_tags = []  # closed like BeautifulSoup does, up to the last tag of the name
+        self.article_index = None
+        self.found = self.finished = False
+
+    def is_in_article(self) -> bool:
+        """Checks whether the strings parsed now are part of the first article"""
+        return self.article_index is not None
+
+    def flush(self) -> None:
+        """Hands over the string that ended at a tag, comment or declaration"""
+        if self.data:
+            text = "".join(self.data)
+            self.data = []
+            if not NON_TEXT_TAGS.intersection(self.open_tags):
+                keep_whitespace = bool(WHITESPACE_TAGS.intersection(self.open_tags))
+                self.add_text(as_soup_string(text, keep_whitespace))
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if self.finished or tag in VOID_TAGS:
+            return
+        if tag == "article" and not self.found:
+            self.found = True
+            self.article_index = len(self.open_tags)
+        self.open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        self.flush()
+        if tag not in self.open_tags:
+            return
+        del self.open_tags[len(self.open_tags) - self.open_tags[::-1].index(tag) - 1 :]
+        if self.is_in_article() and len(self.open_tags) <= self.article_index:
+            self.article_index = None
+            self.finished = True
+
+    def handle_data(self, data):
+        if self.is_in_article():
+            self.data.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name, f"&{name}"))
+
+    def handle_charref(self, name):
+        dereferenced, _, extra_data = (
+            BeautifulSoupHTMLParser._dereference_numeric_character_reference(  # pylint: disable=protected-access
+                name
+            )
+        )
+        self.handle_data(dereferenced or "")
+        self.handle_data(extra_data or "")
+
+    def unknown_decl(self, data):
+        self.flush()
+        if data.upper().startswith("CDATA["):
+            self.handle_data(data[len("CDATA[") :])
+            self.flush()
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+
+def get_decoder(start: bytes):
+    """Returns an incremental decoder for the encoding declared at the start of a page"""
+    encoding = EncodingDetector.find_declared_encoding(start, is_html=True) or "utf-8"
+    if encoding.lower().replace("_", "-") in ("utf-8", "utf8"):
+        encoding = "utf-8-sig"  # drops a byte order mark like BeautifulSoup does
+    return getincrementaldecoder(encoding)(errors="replace")
+
+
+def stream_article_text(
+    chunks, head_chars: int = ARTICLE_WINDOW_CHARS, tail_chars: int = ARTICLE_WINDOW_CHARS
+) -> str:
+    """Returns the text of the first article of a page streamed in chunks, the same as
+    get_article_text with html.parser, keeping only its first head_chars and last tail_chars
+    so the memory used is the same for any length of judgment. Raises AttributeError if the
+    page has no article"""
+    window = TextWindow(head_chars, tail_chars)
+    parser = ArticleTextParser(window.add)
+    decoder = None
+    start = b""  # held until it is long enough to find the declared encoding in
+    for chunk in chunks:
+        if decoder is None:
+            start += chunk
+            if len(start) < ENCODING_SEARCH_BYTES:
+                continue
+            decoder = get_decoder(start)
+            chunk, start = start, b""
+        parser.feed(decoder.decode(chunk))
+        if parser.finished:
+            break
+    if not parser.finished:
+        decoder = decoder or get_decoder(start)
+        parser.feed(decoder.decode(start, final=True))
+        parser.close()
+    parser.flush()
+    if not parser.found:
+        raise AttributeError("The page has no article")
+    return window.get_text()
@@ -0,0 +1,136 @@
+"""Python script providing a shared HTTP session for every scraper, with keep-alive
+connection pooling, retries with backoff and a cap on concurrent requests per host"""
+
+from os import getenv
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_MAX_CONNECTIONS_PER_HOST = int(getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "4"))
+HOST_CONNECTION_LIMITS = {
+    "caselaw.nationalarchives.gov.uk": DEFAULT_MAX_CONNECTIONS_PER_HOST,
+}
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_RETRIES = int(getenv("HTTP_MAX_RETRIES", "5"))
+RETRY_BACKOFF_FACTOR = float(getenv("HTTP_RETRY_BACKOFF_FACTOR", "0.5"))
+DEFAULT_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "court-transcripts-pipeline",
+}
+
+session_lock = Lock()
+sessions = {}
+host_semaphores = {}
+host_rate_limiters = {}  # e.g. the archive's limiter shared by the processes of a backfill
+
+
+def get_host_limit(host: str) -> int:
+    """Returns the maximum number of concurrent requests allowed to a host"""
+    return HOST_CONNECTION_LIMITS.get(host, DEFAULT_MAX_CONNECTIONS_PER_HOST)
+
+
+def set_host_limit(host: str, limit: int) -> None:
+    """Changes the maximum number of concurrent requests allowed to a host,
+    only takes effect for hosts that have not been requested yet"""
+    if limit < 1:
+        raise ValueError("Host limit must be at least 1")
+    with session_lock:
+        HOST_CONNECTION_LIMITS[host] = limit
+        host_semaphores.pop(host, None)
+
+
+def get_host_semaphore(url: str) -> BoundedSemaphore:
+    """Returns the semaphore that caps the number of concurrent requests to the url's host"""
+    host = urlparse(url).netloc
+    with session_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = BoundedSemaphore(get_host_limit(host))
+        return host_semaphores[host]
+
+
+def set_host_rate_limiter(host: str, rate_limiter) -> None:
+    """Makes every request to a host wait for a rate limiter first, or stops waiting with None"""
+    with session_lock:
+        if rate_limiter is None:
+            host_rate_limiters.pop(host, None)
+        else:
+            host_rate_limiters[host] = rate_limiter
+
+
+def create_session() -> requests.Session:
+    """Creates a session that keeps connections alive and retries
+    rate limited or failed requests with an exponential backoff"""
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # the last response is returned like a plain requests.get
+    )
+    pool_size = max([DEFAULT_MAX_CONNECTIONS_PER_HOST, *HOST_CONNECTION_LIMITS.values()])
+    adapter = HTTPAdapter(
+        pool_connections=len(HOST_CONNECTION_LIMITS) + 1,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Returns the session shared by every scraper, creating it on first use"""
+    with session_lock:
+        if "default" not in sessions:
+            sessions["default"] = create_session()
+        return sessions["default"]
+
+
+def close_session() -> None:
+    """Closes the shared session and its pooled connections"""
+    with session_lock:
+        session = sessions.pop("default", None)
+    if session is not None:
+        session.close()
+
+
+def release_on_close(response: requests.Response, semaphore: BoundedSemaphore) -> None:
+    """Keeps the host's slot taken by a streamed response until the response is closed,
+    as its body is still being downloaded after the headers are returned"""
+    close = response.close
+    released = Lock()
+
+    def close_and_release() -> None:
+        try:
+            close()
+        finally:
+            if released.acquire(blocking=False):  # only the first close frees the slot
+                semaphore.release()
+
+    response.close = close_and_release
+
+
+def get(url: str, timeout: float, **kwargs) -> requests.Response:
+    """Sends a GET request through the shared session, waiting for the host's rate limiter
+    if it has one and for a free slot on the host. The slot of a streamed response is only
+    freed once the response is closed"""
+    rate_limiter = host_rate_limiters.get(urlparse(url).netloc)
+    if rate_limiter is not None:
+        rate_limiter.acquire(0)  # counts requests only
+    semaphore = get_host_semaphore(url)
+    semaphore.acquire()
+    try:
+        response = get_session().get(url, timeout=timeout, **kwargs)
+    except BaseException:
+        semaphore.release()
+        raise
+    if kwargs.get("stream"):
+        release_on_close(response, semaphore)
+    else:
+        semaphore.release()
+    return response
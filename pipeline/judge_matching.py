@@ -1,71 +1,27 @@
 """Python script to match judges names and standardise the judge names"""
 
-from os import getenv
+from os import getenv, cpu_count
+from collections import defaultdict
+from threading import Lock
+import re
+import numpy as np
 from rapidfuzz import process, fuzz
 import psycopg2
 from psycopg2.extensions import connection
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from name_normalisation import standardise_name, standardise_names
 
 MATCHING_PERCENT = 95
-
-COMMON_JUDGE_WORDS = (
-    "Senior",
-    "(Magistrates’",
-    " His",
-    "Master",
-    "King’s",
-    "(The",
-    "The",
-    "King's",
-    "Remembrancer)",
-    "Bench",
-    "Chief",
-    "Chancery",
-    "Costs",
-    "Judge",
-    "(Chief",
-    "Taxing",
-    "Master)",
-    "Insolvency",
-    "and",
-    "Companies",
-    "Court",
-    "Registrar",
-    "District",
-    "(MC)",
-    "His",
-    "Her",
-    "Honour",
-    "Tribunal",
-    "Employment",
-    "Deputy",
-    "Magistrate)",
-    "CBE",
-    "DL",
-    "(Deputy",
-    "Lead",
-    "DCRJ)",
-    "Upper",
-    "Recorder",
-    "of",
-    "London,",
-    "Regional",
-    "ICC",
-    "(Magistrates",
-    "(Magistrates'",
-    "Court)",
-    "KC",
-    "Assistant",
-    "Advocate",
-    "General",
-    "Lieutenant",
-    "Colonel",
-    "(Retired)",
-    "JP",
-    "",
-    "OBE",
-)
+CDIST_WORKERS = cpu_count() or 1
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
 
 
 def get_connection() -> connection:
@@ -101,12 +57,7 @@ def standardise_judge_name(judge: str) -> str:
     """
     Makes the judges name just the personal name and returns a string
     """
-    name_parts = judge.split(" ")
-    good_parts = []
-    for part in name_parts:
-        if part not in COMMON_JUDGE_WORDS and part[0].isalpha():
-            good_parts.append(part)
-    return " ".join(good_parts)
+    return standardise_name(judge)
 
 
 def match_judge(judge: str, current_judges: list) -> tuple | None:
@@ -124,6 +75,186 @@ def match_judge(judge: str, current_judges: list) -> tuple | None:
     return standardise_judge_name(judge)
 
 
+def match_judges(judges: list[str], current_judges: list, workers: int = -1) -> list[str]:
+    """
+    Matches a batch of judges to the ones from the database in a single cdist call using
+    every core, each judge gets the same match or standardised name as match_judge gives
+    """
+    if not judges:
+        return []
+    if not current_judges:
+        return standardise_names(judges)
+    scores = process.cdist(
+        judges,
+        current_judges,
+        scorer=fuzz.token_set_ratio,
+        score_cutoff=MATCHING_PERCENT,
+        dtype=np.float64,
+        workers=workers,
+    )
+    best = scores.argmax(axis=1)  # the first of equal scores, like extractOne
+    return [
+        current_judges[best[i]]
+        if scores[i, best[i]] >= MATCHING_PERCENT
+        else standardise_judge_name(judge)
+        for i, judge in enumerate(judges)
+    ]
+
+
+def soundex(word: str) -> str:
+    """Returns the Soundex code of a word, the same for words that sound alike"""
+    letters = re.sub(r"[^a-z]", "", word.lower())
+    if not letters:
+        return ""
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+        if letter not in "hw":
+            previous = digit
+    return (code + "000")[:4]
+
+
+def get_block_keys(name: str) -> set[tuple[str, str]]:
+    """Returns the buckets a name is filed under: each of its words and their Soundex codes"""
+    keys = set()
+    for token in name.split():
+        keys.add(("word", token.lower()))
+        code = soundex(token)
+        if code:
+            keys.add(("soundex", code))
+    return keys
+
+
+class JudgeIndex:
+    """Candidate blocking index over the judge roster, so an incoming name is only fuzzy
+    scored against the judges sharing a word or the sound of a word with it.
+    Results are memoised until the roster changes"""
+
+    def __init__(self, judges: list[str] = ()):
+        self.judges = []
+        self.buckets = defaultdict(list)
+        self.memo = {}
+        self.add(judges)
+
+    def add(self, judges: list[str]) -> None:
+        """Adds judges to the end of the roster"""
+        for judge in judges:
+            position = len(self.judges)
+            self.judges.append(judge)
+            for key in get_block_keys(judge):
+                self.buckets[key].append(position)
+        if judges:
+            self.memo.clear()
+
+    def get_positions(self, judge: str) -> set[int]:
+        """Returns the roster positions of the judges sharing a bucket with a name"""
+        positions = set()
+        for key in get_block_keys(judge):
+            positions.update(self.buckets.get(key, ()))
+        return positions
+
+    def get_candidates(self, judge: str) -> list[str]:
+        """Returns the judges sharing a bucket with a name, in roster order so that
+        ties are broken like a scan of the whole roster"""
+        return [self.judges[position] for position in sorted(self.get_positions(judge))]
+
+    def match(self, judge: str) -> str:
+        """Matches a name like match_judge does but against its candidates only"""
+        if judge not in self.memo:
+            self.memo[judge] = match_judge(judge, self.get_candidates(judge))
+        return self.memo[judge]
+
+    def match_all(self, judges: list[str]) -> list[str]:
+        """Matches a batch of names not seen before either in one multi-threaded cdist call
+        against the candidates of all of them, or name by name against its own candidates,
+        whichever scores fewer pairs per core"""
+        new_judges = [judge for judge in dict.fromkeys(judges) if judge not in self.memo]
+        if new_judges:
+            judge_positions = [self.get_positions(judge) for judge in new_judges]
+            all_positions = set().union(*judge_positions)
+            blocked_pairs = sum(len(positions) for positions in judge_positions)
+            if len(new_judges) * len(all_positions) <= blocked_pairs * CDIST_WORKERS:
+                candidates = [self.judges[position] for position in sorted(all_positions)]
+                self.memo.update(zip(new_judges, match_judges(new_judges, candidates)))
+            else:
+                for judge, positions in zip(new_judges, judge_positions):
+                    self.memo[judge] = match_judge(
+                        judge, [self.judges[position] for position in sorted(positions)]
+                    )
+        return [self.memo[judge] for judge in judges]
+
+
+class JudgeResolver:
+    """Resolves judge names against the judge roster, which is read from the database
+    once and then only topped up with the judges added since"""
+
+    def __init__(self):
+        self.roster = {}
+        self.last_judge_id = 0
+        self.index = JudgeIndex()
+        self.lock = Lock()
+
+    @property
+    def judges(self) -> list[str]:
+        """The roster names in id order"""
+        return self.index.judges
+
+    def update_roster(self, judge_ids: dict) -> None:
+        """Adds judges by id to the roster, kept in id order like the judge table.
+        The index is only rebuilt when a judge lands before the end of the roster"""
+        new_ids = sorted(judge_ids.keys() - self.roster.keys())
+        if not new_ids:
+            return
+        in_order = not self.roster or new_ids[0] > max(self.roster)
+        self.roster.update({judge_id: judge_ids[judge_id] for judge_id in new_ids})
+        if in_order:
+            self.index.add([judge_ids[judge_id] for judge_id in new_ids])
+        else:
+            self.index = JudgeIndex([self.roster[judge_id] for judge_id in sorted(self.roster)])
+
+    def refresh(self, conn: connection) -> None:
+        """Reads only the judges added to the table since the last refresh. Loaders can commit
+        out of id order, leaving judges below the last id read, so the judges up to it are
+        counted too and the whole roster is read again when the count is not the roster's"""
+        query = """
+                SELECT judge_id, judge_name FROM judge WHERE judge_id > %s ORDER BY judge_id;
+        """
+        count_query = """
+                SELECT COUNT(*) AS judges FROM judge WHERE judge_id <= %s;
+        """
+        with self.lock:
+            last_judge_id = self.last_judge_id
+            known = sum(judge_id <= last_judge_id for judge_id in self.roster)
+        with conn.cursor(cursor_factory=RealDictCursor) as curs:
+            curs.execute(query, (last_judge_id,))
+            result = curs.fetchall()
+            if last_judge_id:
+                curs.execute(count_query, (last_judge_id,))
+                if curs.fetchone()["judges"] != known:
+                    curs.execute(query, (0,))
+                    result = curs.fetchall()
+        judge_ids = {row["judge_id"]: row["judge_name"] for row in result}
+        with self.lock:
+            self.update_roster(judge_ids)
+            if judge_ids:
+                self.last_judge_id = max(self.last_judge_id, *judge_ids)
+
+    def add_judges(self, judge_map: dict) -> None:
+        """Adds judges the loader has inserted, given as a map of name to id, once their
+        transaction has committed"""
+        with self.lock:
+            self.update_roster({judge_id: name for name, judge_id in judge_map.items()})
+
+    def resolve(self, conn: connection, judge_names: list[str]) -> list[str]:
+        """Matches a batch of judge names to the roster, each distinct name once"""
+        self.refresh(conn)
+        with self.lock:
+            return self.index.match_all(judge_names)
+
+
 if __name__ == "__main__":
     load_dotenv()
     db_conn = get_connection()
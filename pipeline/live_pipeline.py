@@ -1,25 +1,33 @@
 """Python script to run the live pipeline on AWS Lambda to add new court cases to the database"""
 
 from os import getenv
+from datetime import datetime
 import json
-from datetime import datetime, date
+from itertools import chain
+from threading import Lock
 import logging
 import boto3
 from botocore import client
-import nltk
-from extract import get_listing_data, get_max_page_num
-from transform import get_data, assemble_data
-from load import get_connection, insert_to_database
-from send_emails import get_sns_client, send_emails
+from extract import construct_search_url, get_judgments
+from crawler import LOG_DATE_FORMAT, HighWaterMark, crawl_new_listings
+
+# transform, load and send_emails import OpenAI, tiktoken, psycopg2 and rapidfuzz, which take
+# most of the start up time, so they are only imported once an invocation finds new cases
 
 FILE_NAME = "log.json"
 BUCKET_NAME = "c12-court-transcripts"
 
+# clients and the database connection are kept for the warm invocations of the container
+client_lock = Lock()
+clients = {}
+
 
 def initialise_logger() -> logging.Logger:
     """Initialise the logger to log to console."""
     logger = logging.getLogger("pipeline")
     logger.setLevel(logging.INFO)
+    if logger.handlers:  # already set up by an earlier invocation of the container
+        return logger
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
@@ -28,14 +36,35 @@ def initialise_logger() -> logging.Logger:
     return logger
 
 
+def get_shared(name: str, create):
+    """Returns a client kept for the warm invocations of the container, creating it on first use"""
+    with client_lock:
+        if name not in clients:
+            clients[name] = create()
+        return clients[name]
+
+
 def get_client() -> client:
     """Initiates a connection to the S3 AWS Cloud using required credentials."""
-    aws_client = boto3.client(
+    return get_shared(
         "s3",
-        aws_access_key_id=getenv("ACCESS_KEY_ID"),
-        aws_secret_access_key=getenv("SECRET_ACCESS_KEY"),
+        lambda: boto3.client(
+            "s3",
+            aws_access_key_id=getenv("ACCESS_KEY_ID"),
+            aws_secret_access_key=getenv("SECRET_ACCESS_KEY"),
+        ),
     )
-    return aws_client
+
+
+def get_db_connection():
+    """Returns the database connection of the container, reconnecting if it was closed"""
+    from load import get_connection  # pylint: disable=import-outside-toplevel
+
+    with client_lock:
+        conn = clients.get("db")
+        if conn is None or conn.closed:
+            conn = clients["db"] = get_connection()
+        return conn
 
 
 def read_from_json(aws_client: client) -> dict:
@@ -46,31 +75,15 @@ def read_from_json(aws_client: client) -> dict:
     return log_json
 
 
-def extract_log_and_date(log_json: dict) -> tuple[str, list]:
-    """Retrieve the key and value from dictionary"""
-    log_date, log = log_json.popitem()
-    return log_date, log
-
-
 def construct_live_url(log_date: str) -> str:
-    """Constructs the URL to scrape based on the log date"""
-    day, month, year = log_date.split("-")
-    return f"""https://caselaw.nationalarchives.gov.uk/judgments/search?per_page=50&order=date&query=&from_date_0={day}&from_date_1={month}&from_date_2={year}&to_date_0=&to_date_1=&to_date_2=&court=uksc&court=ukpc&court=ewca%2Fciv&court=ewca%2Fcrim&court=ewhc%2Fadmin&court=ewhc%2Fadmlty&court=ewhc%2Fch&court=ewhc%2Fcomm&court=ewhc%2Ffam&court=ewhc%2Fipec&court=ewhc%2Fkb&court=ewhc%2Fmercantile&court=ewhc%2Fpat&court=ewhc%2Fscco&court=ewhc%2Ftcc&party=&judge=&page="""
-
+    """Constructs the URL to scrape, newest judgments first, based on the log date"""
+    return construct_search_url(datetime.strptime(log_date, LOG_DATE_FORMAT).date(), order="-date")
 
-def update_log_date_and_log(log_date: str, log: list) -> tuple[str, list]:
-    """Updates the log date and log list"""
-    if datetime.strptime(log_date, "%d-%m-%Y").date() < date.today():
-        log_date = date.today().strftime("%d-%m-%Y")
-        log = []
-    return log_date, log
 
-
-def save_log_to_file(log_date: str, log: list) -> None:
-    """Saves the log to a json file"""
-    json_dict = {log_date: log}
+def save_log_to_file(mark: HighWaterMark) -> None:
+    """Saves the high-water mark to a json file"""
     with open("/tmp/" + FILE_NAME, "w", encoding="utf-8") as f:
-        json.dump(json_dict, f)
+        json.dump(mark.to_json(), f)
 
 
 def upload_log_to_s3(aws_client: client) -> None:
@@ -82,36 +95,35 @@ def upload_log_to_s3(aws_client: client) -> None:
 
 def handler(event: dict, context) -> None:
     """Main function to run the live pipeline on AWS Lambda"""
-    nltk.data.path.append("./tmp")
     logger = initialise_logger()
     aws_client = get_client()
-    sns_client = get_sns_client()
-    log_json = read_from_json(aws_client)
-    log_date, log = extract_log_and_date(log_json)
-    live_url = construct_live_url(log_date)
+    mark = HighWaterMark.from_json(read_from_json(aws_client))
+    live_url = construct_live_url(mark.get_log_date())
 
-    max_page_num = get_max_page_num(live_url)
-    if max_page_num == 0:
+    pages = crawl_new_listings(live_url, mark)
+    first_page = next(pages, None)
+    if first_page is None:
         logger.info("No new data to insert, exiting")
         return None
 
-    cases_count = 0
-    for page_num in range(1, max_page_num + 1):
-        gpt_response = []
-        data = get_listing_data(live_url, page_num, log)
-        cases_count += len(data)
-        for index, _ in enumerate(data):
-            gpt_response.append(get_data(data, index))
+    # pylint: disable=import-outside-toplevel
+    from transform import get_all_data, assemble_data
+    from load import insert_to_database
+    from send_emails import get_sns_client, send_emails
+
+    sns_client = get_shared("sns", get_sns_client)
+    loaded = []
+    for page_num, listings in chain([first_page], pages):
+        data = get_judgments(listings)
+        gpt_response = get_all_data(data)
         table_data = assemble_data(gpt_response)
-        send_emails(table_data, log,  sns_client)
-        conn = get_connection()
-        insert_to_database(conn, table_data)
-        log += [d.get("citation") for d in data]
-        logger.info(
-            "Page {page_num} inserted to database, {count} records in total")
-
-    log_date, log = update_log_date_and_log(log_date, log)
-    save_log_to_file(log_date, log)
+        send_emails(table_data, mark.citations, sns_client)
+        insert_to_database(get_db_connection(), table_data)
+        loaded += data
+        logger.info("Page %s inserted to database, %s records in total", page_num, len(loaded))
+
+    mark.add(loaded)
+    save_log_to_file(mark)
     upload_log_to_s3(aws_client)
 
     logger.info("Live data pipeline trigger completed")
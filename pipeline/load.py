@@ -6,51 +6,17 @@ from psycopg2 import connect
 from psycopg2.extras import RealDictCursor, execute_values
 from psycopg2.extensions import connection
 from dotenv import load_dotenv
-import nltk
-from nltk.corpus import wordnet
-from Levenshtein import jaro_winkler
-from judge_matching import match_judge, get_judges
+from judge_matching import JudgeResolver
+from tag_canonicalisation import TagCanonicaliser, get_tag_canonicaliser
 
-
-def synonym_extractor(phrase: str) -> set[str]:
-    """Uses the wordnet module from the nltk library to find synonyms of a word"""
-    if not isinstance(phrase, str):
-        return set()
-    synonyms = []
-    for word in phrase.split(" "):
-        for syn in wordnet.synsets(word):
-            for l in syn.lemmas():
-                synonyms.append(l.name())
-        synonyms = {word.capitalize() for word in synonyms}
-        if word in synonyms:
-            synonyms.remove(str(word))
-        synonyms = list(synonyms)
-    return set(synonyms)
-
-
-def replace_word_in_list(words: list[str], old_word: str, new_word: str) -> list[str]:
-    """Replaces all occurrences of old_word with new_word in the list."""
-    return [new_word if word == old_word else word for word in words]
+# the judge roster is kept between pages and warm Lambda invocations
+judge_resolver = JudgeResolver()
 
 
 def replace_synonyms(words: list[str]) -> list[str]:
     """Replaces any synonym in a list of words with its original word.
-    Based on the above synonym function or if it has a high jaro winkler match"""
-    for word in words:  # replace any synonyms
-        synonyms = synonym_extractor(word)
-        if synonyms:
-            for syn in synonyms:
-                if str(syn) in set(words):
-                    words = replace_word_in_list(words, word, syn)
-
-        for word2 in words:  # replace any too-similar words
-            if not isinstance(word2, str):
-                words.remove(word2)
-            if not word == word2:
-                jw = jaro_winkler(word, word2)
-                if jw > 0.9:
-                    words = replace_word_in_list(words, word, word2)
-    return words
+    Based on synonym_extractor or if it has a high jaro winkler match"""
+    return TagCanonicaliser().canonicalise(words)
 
 
 def get_connection() -> connection:
@@ -65,6 +31,20 @@ def get_connection() -> connection:
     )
 
 
+def get_loaded_citations(conn: connection, citations: list[str]) -> set[str]:
+    """Returns the citations of a page that are already in the court_case table, in one query"""
+    citations = sorted({citation for citation in citations if citation})
+    if not citations:
+        return set()
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT court_case_id FROM court_case WHERE court_case_id = ANY(%s);", (citations,)
+        )
+        loaded = {row["court_case_id"] for row in cur.fetchall()}
+    conn.commit()  # ends the read-only transaction so the connection is not left idle in one
+    return loaded
+
+
 def return_single_ids(mapping: dict, to_convert: tuple[str]) -> tuple[int]:
     """Based on a dict, will convert values (=keys of the dict) to their corresponding value"""
     to_return = []
@@ -94,97 +74,96 @@ def get_verdict_mapping(conn: connection) -> dict:
     return {row["verdict"]: row["verdict_id"] for row in rows}
 
 
-def get_court_mapping(conn: connection) -> dict:
-    """To map each court to its id"""
-    with conn.cursor() as cur:
-        cur.execute("SELECT court_name, court_id FROM court")
-        rows = cur.fetchall()
-    return {row["court_name"]: row["court_id"] for row in rows}
-
-
-def get_judge_mapping(conn: connection) -> dict:
-    """To map each judge to its id"""
-    with conn.cursor() as cur:
-        cur.execute("SELECT judge_name, judge_id FROM judge")
-        rows = cur.fetchall()
-    return {row["judge_name"]: row["judge_id"] for row in rows}
-
-
-def get_tag_mapping(conn: connection) -> dict:
-    """To map each tag to its id"""
-    with conn.cursor() as cur:
-        cur.execute("SELECT tag_name, tag_id FROM tag")
-        rows = cur.fetchall()
-    return {row["tag_name"]: row["tag_id"] for row in rows}
-
-
-def get_law_firm_mapping(conn: connection) -> dict:
-    """To map each law firm to its id"""
-    with conn.cursor() as cur:
-        cur.execute("SELECT law_firm_name, law_firm_id FROM law_firm")
-        rows = cur.fetchall()
-    return {row["law_firm_name"]: row["law_firm_id"] for row in rows}
-
-
-def get_participant_mapping(conn: connection) -> dict:
-    """To map each participant to its id"""
-    with conn.cursor() as cur:
-        cur.execute("SELECT participant_name, participant_id FROM participant")
-        rows = cur.fetchall()
-    return {row["participant_name"]: row["participant_id"] for row in rows}
-
-
-def get_lawyer_mapping(conn: connection) -> dict:
-    """To map each lawyer (and consequently firm) to its id"""
+def get_unnamed_id(conn: connection, table: str, name_column: str, id_column: str) -> int:
+    """Returns the id of the row standing for an unknown name, adding it the first time.
+    Unique constraints never treat two NULLs as equal, so the first such row is reused"""
     with conn.cursor() as cur:
-        cur.execute("SELECT lawyer_name, lawyer_id FROM lawyer")
-        rows = cur.fetchall()
-    return {row["lawyer_name"]: row["lawyer_id"] for row in rows}
-
-
-def add_judges(conn: connection, all_judges_list: list[tuple[str]]) -> list[tuple[str]]:
-    """Adds new judges to the table judge and returns a list of all the ones it was able to match"""
-    matched_judges_list = [
-        (match_judge(judge_name[0], get_judges(conn)),)
-        for judge_name in all_judges_list
-    ]
-    query = """INSERT INTO judge(judge_name) VALUES %s ON CONFLICT DO NOTHING;"""
-    with conn.cursor() as cur:
-        execute_values(cur, query, matched_judges_list)
-    conn.commit()
-    return matched_judges_list
-
-
-def add_tags(conn: connection, all_tags_list: list[tuple[str]]):
-    """Adds new tags to the tag table"""
-    query = """INSERT INTO tag(tag_name) VALUES %s ON CONFLICT DO NOTHING;"""
-    with conn.cursor() as cur:
-        execute_values(cur, query, all_tags_list)
-    conn.commit()
+        cur.execute(
+            f"SELECT {id_column} FROM {table} WHERE {name_column} IS NULL ORDER BY {id_column} LIMIT 1;"
+        )
+        row = cur.fetchone()
+        if row is None:
+            cur.execute(f"INSERT INTO {table}({name_column}) VALUES (NULL) RETURNING {id_column};")
+            row = cur.fetchone()
+    return row[id_column]
 
 
-def add_law_firms(conn: connection, all_firm_names: list[tuple[str]]):
-    """Adds new law firm names to the law_firm table"""
-    query = """INSERT INTO law_firm(law_firm_name) VALUES %s ON CONFLICT DO NOTHING;"""
-    with conn.cursor() as cur:
-        execute_values(cur, query, all_firm_names)
-    conn.commit()
+def upsert_names(
+    conn: connection,
+    table: str,
+    name_column: str,
+    id_column: str,
+    names: list[str],
+    nullable: bool = False,
+) -> dict:
+    """Adds the names missing from a dimension table and returns the id of every name given,
+    reading only the rows of these names rather than the whole table"""
+    unique_names = sorted({name for name in names if name is not None})
+    ids = {}
+    if unique_names:
+        insert_query = f"""INSERT INTO {table}({name_column}) VALUES %s ON CONFLICT ({name_column}) DO NOTHING RETURNING {name_column}, {id_column};"""
+        with conn.cursor() as cur:
+            rows = execute_values(
+                cur,
+                insert_query,
+                [(name,) for name in unique_names],
+                page_size=len(unique_names),
+                fetch=True,
+            )
+            ids = {row[name_column]: row[id_column] for row in rows}
+            existing = [name for name in unique_names if name not in ids]
+            if existing:
+                cur.execute(
+                    f"SELECT {name_column}, {id_column} FROM {table} WHERE {name_column} = ANY(%s);",
+                    (existing,),
+                )
+                ids.update({row[name_column]: row[id_column] for row in cur.fetchall()})
+    if nullable and None in names:
+        ids[None] = get_unnamed_id(conn, table, name_column, id_column)
+    return ids
+
+
+def add_judges(
+    conn: connection,
+    all_judges_list: list[tuple[str]],
+    resolver: JudgeResolver = judge_resolver,
+) -> tuple[list[tuple[str]], dict]:
+    """Adds new judges to the table judge and returns a list of all the ones it was able to match
+    with the id of every matched name. The resolver is only given the new judges once the
+    transaction commits, as a rollback would leave it judges the table doesn't have"""
+    matched_names = resolver.resolve(conn, [judge_name[0] for judge_name in all_judges_list])
+    matched_judges_list = [(name,) for name in matched_names]
+    judge_map = upsert_names(conn, "judge", "judge_name", "judge_id", matched_names)
+    return matched_judges_list, judge_map
+
+
+def add_tags(conn: connection, all_tags_list: list[str]) -> dict:
+    """Adds new tags to the tag table and returns the id of every tag given"""
+    return upsert_names(conn, "tag", "tag_name", "tag_id", all_tags_list)
+
+
+def add_law_firms(conn: connection, all_firm_names: list[str]) -> dict:
+    """Adds new law firm names to the law_firm table and returns the id of every firm given"""
+    return upsert_names(
+        conn, "law_firm", "law_firm_name", "law_firm_id", all_firm_names, nullable=True
+    )
 
 
-def add_participants(conn: connection, all_participant_names: list[tuple[str]]):
-    """Adds people's names to the participants table"""
-    query = """INSERT INTO participant(participant_name) VALUES %s ON CONFLICT DO NOTHING;"""
-    with conn.cursor() as cur:
-        execute_values(cur, query, all_participant_names)
-    conn.commit()
+def add_participants(conn: connection, all_participant_names: list[str]) -> dict:
+    """Adds people's names to the participants table and returns the id of every name given"""
+    return upsert_names(
+        conn,
+        "participant",
+        "participant_name",
+        "participant_id",
+        all_participant_names,
+        nullable=True,
+    )
 
 
-def add_courts(conn: connection, all_court_names: list[tuple[str]]):
-    """Adds new court names to the court table"""
-    query = """INSERT INTO court(court_name) VALUES %s ON CONFLICT DO NOTHING;"""
-    with conn.cursor() as cur:
-        execute_values(cur, query, all_court_names)
-    conn.commit()
+def add_courts(conn: connection, all_court_names: list[str]) -> dict:
+    """Adds new court names to the court table and returns the id of every court given"""
+    return upsert_names(conn, "court", "court_name", "court_id", all_court_names)
 
 
 def populate_court_case(
@@ -216,45 +195,76 @@ def populate_court_case(
                 v_summmaries[i],
             )
         )
+    if not matched:
+        return
     query = """INSERT INTO court_case(court_case_id, summary, verdict_id, title, court_date, case_number, case_url, court_id, verdict_summary) VALUES %s ON CONFLICT DO NOTHING;"""
     with conn.cursor() as cur:
-        execute_values(cur, query, matched)
-    conn.commit()
+        execute_values(cur, query, matched, page_size=len(matched))
 
 
-def populate_judge_assignment(conn: connection, case_id: int, judge_id: tuple[int]):
-    """Populates the judge_assignment table base don case id and judge id"""
-    matched = []
-    for judge in judge_id:
-        matched.append((case_id, judge))
-    query = """INSERT INTO judge_assignment(court_case_id, judge_id) VALUES %s ON CONFLICT DO NOTHING;"""
+def insert_assignments(conn: connection, query: str, rows: list[tuple]):
+    """Inserts all the rows of a bridge table in a single statement"""
+    rows = list(dict.fromkeys(rows))
+    if not rows:
+        return
     with conn.cursor() as cur:
-        execute_values(cur, query, matched)
-    conn.commit()
+        execute_values(cur, query, rows, page_size=len(rows))
 
 
-def populate_tag_assignment(conn: connection, case_id: int, tags_ids: tuple[int]):
-    """Populates the tag assignment table based on a case id and its tag ids"""
-    matched = []
-    for tag in tags_ids:
-        matched.append((case_id, tag))
+def populate_judge_assignment(
+    conn: connection, case_ids: list[str], judge_ids: tuple[tuple[int]]
+):
+    """Populates the judge_assignment table for every case based on case id and judge ids"""
+    matched = [
+        (case_id, judge) for case_id, judges in zip(case_ids, judge_ids) for judge in judges
+    ]
+    query = """INSERT INTO judge_assignment(court_case_id, judge_id) VALUES %s ON CONFLICT DO NOTHING;"""
+    insert_assignments(conn, query, matched)
+
+
+def populate_tag_assignment(conn: connection, case_ids: list[str], tags_ids: tuple[tuple[int]]):
+    """Populates the tag assignment table for every case based on case id and its tag ids"""
+    matched = [(case_id, tag) for case_id, tags in zip(case_ids, tags_ids) for tag in tags]
     query = """INSERT INTO tag_assignment(court_case_id, tag_id) VALUES %s ON CONFLICT DO NOTHING;"""
-    with conn.cursor() as cur:
-        execute_values(cur, query, matched)
-    conn.commit()
+    insert_assignments(conn, query, matched)
 
 
 def populate_lawyer(
     conn: connection, all_lawyers: list[str], all_law_firm_ids: list[int]
-):
-    """Add data to the lawyer table that matches lawyers to their firm"""
-    matched = []
-    for i, value in enumerate(all_lawyers):
-        matched.append((value, all_law_firm_ids[i]))
-    query = """INSERT INTO lawyer(lawyer_name, law_firm_id) VALUES %s ON CONFLICT DO NOTHING;"""
+) -> dict:
+    """Add data to the lawyer table that matches lawyers to their firm,
+    returns the id of every (lawyer, law firm id) pair given"""
+    pairs = sorted(set(zip(all_lawyers, all_law_firm_ids)), key=str)
+    named = [pair for pair in pairs if pair[0] is not None]
+    unnamed_firms = sorted({firm for lawyer, firm in pairs if lawyer is None}, key=str)
+    ids = {}
     with conn.cursor() as cur:
-        execute_values(cur, query, matched)
-    conn.commit()
+        if named:
+            query = """INSERT INTO lawyer(lawyer_name, law_firm_id) VALUES %s ON CONFLICT (lawyer_name, law_firm_id) DO NOTHING RETURNING lawyer_name, law_firm_id, lawyer_id;"""
+            rows = execute_values(cur, query, named, page_size=len(named), fetch=True)
+            ids = {(row["lawyer_name"], row["law_firm_id"]): row["lawyer_id"] for row in rows}
+            existing = [pair for pair in named if pair not in ids]
+            if existing:
+                query = """SELECT lawyer.lawyer_name, lawyer.law_firm_id, lawyer.lawyer_id FROM lawyer JOIN (VALUES %s) AS pair(lawyer_name, law_firm_id) ON lawyer.lawyer_name = pair.lawyer_name AND lawyer.law_firm_id = pair.law_firm_id;"""
+                rows = execute_values(cur, query, existing, page_size=len(existing), fetch=True)
+                ids.update(
+                    {(row["lawyer_name"], row["law_firm_id"]): row["lawyer_id"] for row in rows}
+                )
+        if unnamed_firms:
+            # lawyers with no name are matched to a single row per firm, as NULLs are never unique
+            cur.execute(
+                """SELECT DISTINCT ON (law_firm_id) law_firm_id, lawyer_id FROM lawyer WHERE lawyer_name IS NULL AND law_firm_id = ANY(%s) ORDER BY law_firm_id, lawyer_id;""",
+                (unnamed_firms,),
+            )
+            ids.update({(None, row["law_firm_id"]): row["lawyer_id"] for row in cur.fetchall()})
+            missing = [(firm,) for firm in unnamed_firms if (None, firm) not in ids]
+            if missing:
+                query = """INSERT INTO lawyer(lawyer_name, law_firm_id) VALUES %s RETURNING law_firm_id, lawyer_id;"""
+                rows = execute_values(
+                    cur, query, missing, template="(NULL, %s)", page_size=len(missing), fetch=True
+                )
+                ids.update({(None, row["law_firm_id"]): row["lawyer_id"] for row in rows})
+    return ids
 
 
 def populate_participant_assignment(
@@ -270,9 +280,7 @@ def populate_participant_assignment(
             for person in people:
                 to_add.append(person)
 
-    with conn.cursor() as cur:
-        execute_values(cur, query, to_add)
-    conn.commit()
+    insert_assignments(conn, query, to_add)
 
 
 def process_people_data(people: list[tuple[tuple[str] | str | bool]]) -> list[tuple]:
@@ -307,13 +315,19 @@ def replace_data(
     return result
 
 
-def transform_tags(tags_to_convert: list[tuple[str]]) -> list[tuple[str]]:
+def transform_tags(
+    tags_to_convert: list[tuple[str]], canonicaliser: TagCanonicaliser | None = None
+) -> list[tuple[str]]:
     """Replaces all synonyms from tags and returns them in the same format they were inputted"""
+    canonicaliser = canonicaliser or TagCanonicaliser()
+    tags_to_convert = [
+        tuple(tag for tag in case if isinstance(tag, str)) for case in tags_to_convert
+    ]
     all_tags = []
     for case in tags_to_convert:
         for tag in case:
             all_tags.append(tag)
-    temp_tags = replace_synonyms(all_tags)
+    temp_tags = canonicaliser.canonicalise(all_tags)
 
     reconstructed = []
     i = 0
@@ -362,7 +376,10 @@ def people_id_in_right_format(
 
 def insert_to_database(conn: connection, transformed_data: dict) -> str:
     # pylint: disable=R0914
-    """Takes data from the transform, adds them to the database based on mappings created"""
+    """Takes data from the transform and adds a page of cases to the database in a single
+    transaction, getting the ids of only the names the page uses"""
+    if not transformed_data["case_ids"]:
+        return "no cases to upload"
 
     allowed_verdicts = (
         "Guilty",
@@ -382,73 +399,65 @@ def insert_to_database(conn: connection, transformed_data: dict) -> str:
         if verdict not in allowed_verdicts:
             transformed_data["verdicts"][i] = "Other"
 
-    verdict_map = get_verdict_mapping(conn)
-
-    add_courts(conn, [(court,) for court in transformed_data["courts"]])
-    court_map = get_court_mapping(conn)
-
     judges = transformed_data["judges"]
-    matched_judges_list = add_judges(
-        conn, [(judge,) for case in judges for judge in case]
-    )
-    updated_judge_names = replace_data(judges, matched_judges_list)
-    judges_map = get_judge_mapping(conn)
-
-    tags = transform_tags(transformed_data["tags"])
-    add_tags(conn, [(tag,) for case in tags for tag in case])
-    tag_map = get_tag_mapping(conn)
-
     lawyer_list, law_firm_list, people_list = process_people_data(
         transformed_data["people"]
     )
-    add_law_firms(conn, law_firm_list[0])
-    law_firm_map = get_law_firm_mapping(conn)
 
-    add_participants(conn, people_list[0])
-    participant_map = get_participant_mapping(conn)
-
-    court_ids = return_single_ids(court_map, transformed_data["courts"])
-    verdict_ids = return_single_ids(verdict_map, transformed_data["verdicts"])
-    j_ids = return_multiple_ids(judges_map, updated_judge_names)
-    tag_ids = return_multiple_ids(tag_map, tags)
-    law_firm_ids = return_single_ids(law_firm_map, law_firm_list[1])
-    participant_ids = return_single_ids(participant_map, people_list[1])
-
-    populate_lawyer(conn, lawyer_list[1], law_firm_ids)
-    lawyer_map = get_lawyer_mapping(conn)
-    lawyer_ids = return_single_ids(lawyer_map, lawyer_list[1])
-
-    populate_court_case(
-        conn,
-        transformed_data["case_ids"],
-        transformed_data["summ"],
-        verdict_ids,
-        transformed_data["title"],
-        transformed_data["date"],
-        transformed_data["number"],
-        transformed_data["url"],
-        court_ids,
-        transformed_data["v_sum"],
-    )
-    part_assign = people_id_in_right_format(
-        transformed_data["people"],
-        transformed_data["case_ids"],
-        participant_ids,
-        lawyer_ids,
-        lawyer_list[0],
-    )
+    with conn:  # commits the whole page at once, or rolls it back on an error
+        verdict_map = get_verdict_mapping(conn)
+        court_map = add_courts(conn, transformed_data["courts"])
+        tag_canonicaliser = get_tag_canonicaliser()
+        tag_canonicaliser.refresh(conn)
+        tags = transform_tags(transformed_data["tags"], tag_canonicaliser)
+        matched_judges_list, judges_map = add_judges(
+            conn, [(judge,) for case in judges for judge in case]
+        )
+        updated_judge_names = replace_data(judges, matched_judges_list)
+        tag_map = add_tags(conn, [tag for case in tags for tag in case])
+        law_firm_map = add_law_firms(conn, law_firm_list[1])
+        participant_map = add_participants(conn, people_list[1])
+
+        court_ids = return_single_ids(court_map, transformed_data["courts"])
+        verdict_ids = return_single_ids(verdict_map, transformed_data["verdicts"])
+        j_ids = return_multiple_ids(judges_map, updated_judge_names)
+        tag_ids = return_multiple_ids(tag_map, tags)
+        law_firm_ids = return_single_ids(law_firm_map, law_firm_list[1])
+        participant_ids = return_single_ids(participant_map, people_list[1])
+
+        lawyer_map = populate_lawyer(conn, lawyer_list[1], law_firm_ids)
+        lawyer_ids = return_single_ids(lawyer_map, tuple(zip(lawyer_list[1], law_firm_ids)))
+
+        populate_court_case(
+            conn,
+            transformed_data["case_ids"],
+            transformed_data["summ"],
+            verdict_ids,
+            transformed_data["title"],
+            transformed_data["date"],
+            transformed_data["number"],
+            transformed_data["url"],
+            court_ids,
+            transformed_data["v_sum"],
+        )
+        part_assign = people_id_in_right_format(
+            transformed_data["people"],
+            transformed_data["case_ids"],
+            participant_ids,
+            lawyer_ids,
+            lawyer_list[0],
+        )
 
-    populate_participant_assignment(conn, part_assign)
-    for i, case_id in enumerate(transformed_data["case_ids"]):
-        populate_judge_assignment(conn, case_id, j_ids[i])
-        populate_tag_assignment(conn, case_id, tag_ids[i])
+        populate_participant_assignment(conn, part_assign)
+        populate_judge_assignment(conn, transformed_data["case_ids"], j_ids)
+        populate_tag_assignment(conn, transformed_data["case_ids"], tag_ids)
 
+    judge_resolver.add_judges(judges_map)
     return "all files have been uploaded successfully"
 
 
 if __name__ == "__main__":
     load_dotenv()
-    nltk.download("wordnet")
     transform = {
         "verdicts": ["Dismissed", "Dismissed"],
         "courts": [
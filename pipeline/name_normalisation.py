@@ -0,0 +1,81 @@
+"""Python script to standardise judge names to just the personal name, shared by the judge
+matcher and the loader so names are stripped the same way everywhere. The judge seeder of the
+database folder keeps its own copy, which its tests check against this one"""
+
+from functools import lru_cache
+
+# titles, ranks and courts dropped from a judge's name, checked once per word
+TITLE_WORDS = frozenset(
+    (
+        "Senior",
+        "(Magistrates’",
+        "Master",
+        "King’s",
+        "(The",
+        "The",
+        "King's",
+        "Remembrancer)",
+        "Bench",
+        "Chief",
+        "Chancery",
+        "Costs",
+        "Judge",
+        "(Chief",
+        "Taxing",
+        "Master)",
+        "Insolvency",
+        "and",
+        "Companies",
+        "Court",
+        "Registrar",
+        "District",
+        "(MC)",
+        "His",
+        "Her",
+        "Honour",
+        "Tribunal",
+        "Employment",
+        "Deputy",
+        "Magistrate)",
+        "CBE",
+        "DL",
+        "(Deputy",
+        "Lead",
+        "DCRJ)",
+        "Upper",
+        "Recorder",
+        "of",
+        "London,",
+        "Regional",
+        "ICC",
+        "(Magistrates",
+        "(Magistrates'",
+        "Court)",
+        "KC",
+        "Assistant",
+        "Advocate",
+        "General",
+        "Lieutenant",
+        "Colonel",
+        "(Retired)",
+        "JP",
+        "OBE",
+    )
+)
+NAME_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def standardise_name(name: str) -> str:
+    """Returns a judge's name without titles and words not starting with a letter,
+    each distinct name is only split once"""
+    return " ".join(
+        part
+        for part in name.split(" ")
+        if part and part not in TITLE_WORDS and part[0].isalpha()
+    )
+
+
+def standardise_names(names) -> list[str]:
+    """Standardises a batch of names, in the same order"""
+    return [standardise_name(name) for name in names]
@@ -1,6 +1,12 @@
-"""Python script to initialise download of wordnet model for NLTK"""
+"""Python script to bake the data files the pipeline needs into the Docker image: the synonym table
+built from the WordNet model for NLTK and the tiktoken encoding, so a cold Lambda downloads neither"""
 
 import nltk
+from wordnet_synonyms import build_synonym_table
+from transform import get_encoder
 
 if __name__ == "__main__":
     nltk.download("wordnet", download_dir="./tmp")
+    nltk.data.path.append("./tmp")
+    print(f"Synonym table built with {build_synonym_table()} words")
+    print(f"Encoding {get_encoder().name} cached")
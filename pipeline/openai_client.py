@@ -0,0 +1,57 @@
+"""Python script providing the OpenAI client shared by every GPT call, so its connection
+pool is reused across calls, pipeline pages and warm Lambda invocations"""
+
+from os import getenv
+from threading import Lock
+import httpx
+from openai import OpenAI, DefaultHttpxClient
+
+OPENAI_TIMEOUT_SECONDS = float(getenv("OPENAI_TIMEOUT_SECONDS", "120"))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "10"))
+OPENAI_MAX_CONNECTIONS = int(getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+client_lock = Lock()
+clients = {}
+
+
+def create_openai_client(
+    timeout: float = OPENAI_TIMEOUT_SECONDS,
+    max_connections: int = OPENAI_MAX_CONNECTIONS,
+) -> OpenAI:
+    """Creates an OpenAI client with a persistent pool of keep-alive connections.
+    Retries are left to the callers, which know about the rate limits"""
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+        timeout=httpx.Timeout(timeout, connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+    )
+    return OpenAI(
+        api_key=getenv("OPENAI_API_KEY"),
+        base_url=getenv("OPENAI_BASE_URL"),
+        max_retries=0,
+        http_client=http_client,
+    )
+
+
+def get_openai_client() -> OpenAI:
+    """Returns the shared OpenAI client, creating it on first use"""
+    with client_lock:
+        if "default" not in clients:
+            clients["default"] = create_openai_client()
+        return clients["default"]
+
+
+def set_openai_client(client) -> None:
+    """Replaces the shared client, e.g. with a fake in tests"""
+    with client_lock:
+        clients["default"] = client
+
+
+def reset_openai_client() -> None:
+    """Closes the shared client so the next call creates a new one"""
+    with client_lock:
+        client = clients.pop("default", None)
+    if client is not None and hasattr(client, "close"):
+        client.close()
@@ -0,0 +1,323 @@
+"""Python script for the local archive of the raw pages scraped, stored compressed under the hash
+of their content with an index by URL of each page's hash, ETag and Last-Modified. Pages are
+fetched again with conditional GETs, and extraction can run offline from the archive alone"""
+
+from hashlib import sha256
+from os import getenv, replace
+from pathlib import Path
+from tempfile import mkstemp
+from threading import Lock
+import logging
+import sqlite3
+import time
+import zlib
+import requests
+import http_client
+
+logger = logging.getLogger("pipeline")
+
+PAGE_ARCHIVE_DIR = getenv("PAGE_ARCHIVE_DIR")  # no archive unless set
+PAGE_ARCHIVE_OFFLINE = getenv("PAGE_ARCHIVE_OFFLINE", "").lower() in ("1", "true", "yes")
+COMPRESSION_LEVEL = 6
+STREAM_CHUNK_BYTES = 64 * 1024
+INDEX_TIMEOUT_SECONDS = 30  # waits for the other backfill processes writing to the index
+
+
+class PageNotArchived(LookupError):
+    """Raised for a page missing from the archive when running offline"""
+
+
+class PageArchive:
+    """Raw pages compressed in files named by the SHA-256 of their content, so a page
+    saved under several URLs or fetched again unchanged is stored once, and a SQLite
+    index of the content hash and validators of every URL"""
+
+    def __init__(self, archive_dir: str):
+        self.objects_dir = Path(archive_dir) / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = Lock()
+        self.conn = sqlite3.connect(
+            Path(archive_dir) / "index.sqlite",
+            timeout=INDEX_TIMEOUT_SECONDS,
+            check_same_thread=False,
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS page (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def get_object_path(self, digest: str) -> Path:
+        """Returns the file of a page's content, in a folder per first two characters of its hash"""
+        return self.objects_dir / digest[:2] / f"{digest[2:]}.z"
+
+    def find(self, url: str) -> tuple | None:
+        """Returns the content hash, ETag and Last-Modified of an archived URL"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT digest, etag, last_modified FROM page WHERE url = ?", (url,)
+            ).fetchone()
+
+    def get_urls(self) -> list[str]:
+        """Returns every URL archived"""
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT url FROM page ORDER BY url")]
+
+    def read(self, url: str) -> bytes | None:
+        """Returns the archived content of a URL, or None if it was never archived"""
+        record = self.find(url)
+        if record is None:
+            return None
+        try:
+            return zlib.decompress(self.get_object_path(record[0]).read_bytes())
+        except FileNotFoundError:
+            return None
+
+    def read_stream(self, url: str):
+        """Returns an iterator over the archived content of a URL in chunks,
+        or None if it was never archived"""
+        record = self.find(url)
+        if record is None or not self.get_object_path(record[0]).exists():
+            return None
+        return self.iter_object(record[0])
+
+    def iter_object(self, digest: str):
+        """Yields the content of an object, decompressed a chunk at a time"""
+        decompressor = zlib.decompressobj()
+        with open(self.get_object_path(digest), "rb") as f:
+            while chunk := f.read(STREAM_CHUNK_BYTES):
+                yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+
+    def write(
+        self, url: str, content: bytes, etag: str | None = None, last_modified: str | None = None
+    ) -> str:
+        """Archives the content of a URL with its validators, returning its content hash"""
+        writer = self.open_writer(url, etag, last_modified)
+        writer.write(content)
+        return writer.commit()
+
+    def open_writer(
+        self, url: str, etag: str | None = None, last_modified: str | None = None
+    ) -> "ArchiveWriter":
+        """Returns a writer archiving the content of a URL as it is downloaded"""
+        return ArchiveWriter(self, url, etag, last_modified)
+
+    def add(
+        self,
+        url: str,
+        digest: str,
+        etag: str | None,
+        last_modified: str | None,
+        temp_path: Path | None = None,
+    ) -> None:
+        """Points the index entry of a URL at an archived object, moving the object written to
+        temp_path into place first. The object the URL pointed at before is deleted once no URL
+        points at it. All of it holds the index's write lock, so another process can't be adding
+        the object that is deleted"""
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            if temp_path is not None:
+                path = self.get_object_path(digest)
+                path.parent.mkdir(exist_ok=True)
+                replace(temp_path, path)  # readers never see a partly written file
+            previous = self.conn.execute(
+                "SELECT digest FROM page WHERE url = ?", (url,)
+            ).fetchone()
+            self.conn.execute(
+                """INSERT OR REPLACE INTO page(url, digest, etag, last_modified, fetched_at)
+                VALUES (?, ?, ?, ?, ?)""",
+                (url, digest, etag, last_modified, time.time()),
+            )
+            if previous and previous[0] != digest:
+                still_used = self.conn.execute(
+                    "SELECT 1 FROM page WHERE digest = ? LIMIT 1", (previous[0],)
+                ).fetchone()
+                if still_used is None:
+                    self.get_object_path(previous[0]).unlink(missing_ok=True)
+
+    def mark_fresh(self, url: str) -> None:
+        """Records that the server confirmed the archived page is still current"""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE page SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def get_conditional_headers(self, url: str) -> dict:
+        """Returns the headers asking the server to send the page only if it has changed"""
+        record = self.find(url)
+        if record is None:
+            return {}
+        headers = {}
+        if record[1]:
+            headers["If-None-Match"] = record[1]
+        if record[2]:
+            headers["If-Modified-Since"] = record[2]
+        return headers
+
+
+class ArchiveWriter:
+    """Compresses and hashes a page as its chunks arrive, into a temporary file that only
+    becomes an object of the archive once the whole page was written"""
+
+    def __init__(self, archive: PageArchive, url: str, etag: str | None, last_modified: str | None):
+        self.archive = archive
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.hash = sha256()
+        self.compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        descriptor, temp_path = mkstemp(suffix=".tmp", dir=archive.objects_dir)
+        self.temp_path = Path(temp_path)
+        self.file = open(descriptor, "wb")  # pylint: disable=consider-using-with
+
+    def write(self, chunk: bytes) -> None:
+        """Adds the next chunk of the page"""
+        self.hash.update(chunk)
+        self.file.write(self.compressor.compress(chunk))
+
+    def commit(self) -> str:
+        """Moves the page into the archive under its content hash, returning the hash"""
+        self.file.write(self.compressor.flush())
+        self.file.close()
+        digest = self.hash.hexdigest()
+        self.archive.add(self.url, digest, self.etag, self.last_modified, self.temp_path)
+        return digest
+
+    def discard(self) -> None:
+        """Drops a page that was not downloaded in full"""
+        self.file.close()
+        self.temp_path.unlink(missing_ok=True)
+
+
+archive_lock = Lock()
+archives = {}
+
+
+def get_page_archive() -> PageArchive | None:
+    """Returns the archive shared by the process when PAGE_ARCHIVE_DIR is set, else None"""
+    if not PAGE_ARCHIVE_DIR:
+        return None
+    with archive_lock:
+        if "default" not in archives:
+            archives["default"] = PageArchive(PAGE_ARCHIVE_DIR)
+        return archives["default"]
+
+
+def fetch(
+    url: str,
+    timeout: float,
+    archive: PageArchive | None = None,
+    offline: bool = PAGE_ARCHIVE_OFFLINE,
+) -> bytes:
+    """Returns the content of a page. Without an archive it is downloaded, offline it is read
+    from the archive, otherwise it is downloaded only if it changed since it was archived"""
+    archive = archive or get_page_archive()
+    if archive is None:
+        return http_client.get(url, timeout=timeout).content
+    if offline:
+        content = archive.read(url)
+        if content is None:
+            raise PageNotArchived(url)
+        return content
+
+    page = http_client.get(url, timeout=timeout, headers=archive.get_conditional_headers(url))
+    if page.status_code == 304:
+        content = archive.read(url)
+        if content is not None:
+            archive.mark_fresh(url)
+            return content
+        page = http_client.get(url, timeout=timeout)  # the archived file was lost
+    if page.status_code == 200:
+        archive.write(url, page.content, page.headers.get("ETag"), page.headers.get("Last-Modified"))
+    return page.content
+
+
+def read_rest(page, chunks, received: int, max_bytes: int | None, writer: ArchiveWriter) -> bool:
+    """Writes the rest of a body the reader stopped reading to the archive, returning whether
+    all of it was written within max_bytes"""
+    try:
+        for chunk in chunks:
+            received += len(chunk)
+            if max_bytes is not None and received > max_bytes:
+                return False
+            writer.write(chunk)
+    except requests.RequestException as error:
+        logger.warning("Stopped archiving %s: %s", page.url, error)
+        return False
+    return True
+
+
+def stream_response(page, max_bytes: int | None = None, writer: ArchiveWriter | None = None):
+    """Yields the body of a response in chunks, stopping after max_bytes, and archives it with the
+    writer once complete. If the reader stops early the rest of the body is still read into the
+    archive, a body cut short by max_bytes or by an error is not archived"""
+    received = 0
+    complete = False
+    chunks = page.iter_content(STREAM_CHUNK_BYTES)
+    try:
+        for chunk in chunks:
+            received += len(chunk)
+            if max_bytes is not None and received > max_bytes:
+                logger.warning("Stopped reading %s after %s bytes", page.url, max_bytes)
+                return
+            if writer is not None:
+                writer.write(chunk)
+            yield chunk
+        complete = True
+    except GeneratorExit:
+        if writer is not None:
+            complete = read_rest(page, chunks, received, max_bytes, writer)
+        raise
+    finally:
+        if writer is not None:
+            if complete:
+                writer.commit()
+            else:
+                writer.discard()
+        page.close()
+
+
+def fetch_stream(
+    url: str,
+    timeout: float,
+    archive: PageArchive | None = None,
+    offline: bool = PAGE_ARCHIVE_OFFLINE,
+    max_bytes: int | None = None,
+):
+    """Yields the content of a page in chunks like fetch returns it, so a page is never held
+    in memory whole, reading at most max_bytes of a download"""
+    archive = archive or get_page_archive()
+    if archive is None:
+        yield from stream_response(http_client.get(url, timeout=timeout, stream=True), max_bytes)
+        return
+    if offline:
+        archived = archive.read_stream(url)
+        if archived is None:
+            raise PageNotArchived(url)
+        yield from archived
+        return
+
+    headers = archive.get_conditional_headers(url)
+    page = http_client.get(url, timeout=timeout, headers=headers, stream=True)
+    if page.status_code == 304:
+        page.close()
+        archived = archive.read_stream(url)
+        if archived is not None:
+            archive.mark_fresh(url)
+            yield from archived
+            return
+        page = http_client.get(url, timeout=timeout, stream=True)  # the archived file was lost
+    writer = None
+    try:
+        if page.status_code == 200:
+            writer = archive.open_writer(
+                url, page.headers.get("ETag"), page.headers.get("Last-Modified")
+            )
+    except BaseException:
+        page.close()  # stream_response would have closed it, freeing the host's slot
+        raise
+    yield from stream_response(page, max_bytes, writer)
@@ -5,26 +5,25 @@ SYSTEM_MESSAGE = """
     Your primary role is to distill essential insights from these court transcripts such as a summary on the ruling of the court case,
     the different entities in the case such as the judges, the opposing sides (e.g. claimant, defendant, appellant, representatives on each side, the firms they come from,etc).
 
-    I also want you to generate a python list of tags, these tags include keywords related to the transcript, including not only words that show up but also ones that are semantically related, not repetitive, avoid tags that are too specific like people and company names.
+    I also want you to generate a list of tags, these tags include keywords related to the transcript, including not only words that show up but also ones that are semantically related, not repetitive, avoid tags that are too specific like people and company names.
 
     tags example: ["fraud", "appeal", "supreme court", "corporation", "guilty"]
 
     Generate between 5 to 10 tags that are relevant to the transcript.
 
-    I only want an unnamed python dictionary that gives the key information of the transcript as such:
+    Reply with a JSON object that gives the key information of the transcript as such:
 
     {
-    "case_number": "EA-2022-000822-AS", might also be called claim number in the text
+    "case_number": "EA-2022-000822-AS", might also be called claim number in the text, null if there is none
     "judge": ["THE HONOURABLE MRS. JUSTICE EADY DBE, PRESIDENT"],
-    "first_side": {first_side_name: {first_side_lawyer: first_side_law_firm}}, if there are multiple first_side add them as an additional dict key, there can be multiple claimants. If you are unable to find a first_side name, make sure to also add None (of type nonetype not string) in the nested dictionary for lawyer and law firm. For criminal cases the first_side usually says R which should be Rex or Regina depending on the monarch at the time.
-    "second_side": {second_side_name: {second_side_lawyer: second_side_law_firm}}, if there are multiple second_side add them as an additional dict key, there can be multiple defendants. If you are unable to find a second_side name, make sure to also add None (of type nonetype not string) in the nested dictionary for lawyer and law firm such as {lawyer_name: {None: None}} or {None: {None: None}} if there is no lawyer either.
-    "verdict" : "Dismissed", this MUST ONLY be from this list OR the word 'Other' if none of the words are a correct match and no other words [Guilty, Not Guilty, Dismissed, Acquitted, Hung Jury, Claimant Wins, Defendant Wins, Settlement, Struck Out, Appeal Allowed, Appeal Dismissed]
-    "verdict_summary":'<text>', This is an easy to understand summary around 50 words of the judgment decision and verdict.
-    "summary":'<text>', This is an easy to understand summary around 100 words of what the case was about and should not be similar to the verdict summary.
-    "tags":[('<text>', ...), ('Murder', 'Self-Defence'), ...], use guidelines as mentioned above
+    "first_side": [{"name": first_side_name, "lawyer": first_side_lawyer, "law_firm": first_side_law_firm}], if there are multiple first_side add them as additional objects in the list, there can be multiple claimants. Use null for a name, lawyer or law firm you are unable to find. For criminal cases the first_side usually says R which should be Rex or Regina depending on the monarch at the time.
+    "second_side": [{"name": second_side_name, "lawyer": second_side_lawyer, "law_firm": second_side_law_firm}], if there are multiple second_side add them as additional objects in the list, there can be multiple defendants. Use null for a name, lawyer or law firm you are unable to find.
+    "verdict": "Dismissed", this MUST ONLY be from this list OR the word 'Other' if none of the words are a correct match and no other words [Guilty, Not Guilty, Dismissed, Acquitted, Hung Jury, Claimant Wins, Defendant Wins, Settlement, Struck Out, Appeal Allowed, Appeal Dismissed]
+    "verdict_summary": "<text>", This is an easy to understand summary around 50 words of the judgment decision and verdict.
+    "summary": "<text>", This is an easy to understand summary around 100 words of what the case was about and should not be similar to the verdict summary.
+    "tags": ["<text>", ...], use guidelines as mentioned above
     }
-    You must return all the data that has been asked for, if you can't find a value, use None (of type nonetype not string) unless otherwise specified.
-    The returned prompt must have no newline characters \n and not in markdown, it should be in plain raw text.
+    You must return all the data that has been asked for, if you can't find a value, use null unless otherwise specified.
 
     Sometimes the judges name has extra titles such as Deputy Senior District Judge (Chief Magistrate) Tan
     weer Ikram CBE DL (Deputy Lead DCRJ) or THE HONOURABLE MR JUSTICE JACOB, remove the titles and keep their names so that they will for example
@@ -38,3 +37,6 @@ SYSTEM_MESSAGE = """
 USER_MESSAGE = """
     Here is the entire court transcript:\n
 """
+
+REPAIR_MESSAGE = """
+    Some fields of your reply were missing or invalid. Reply again with only these fields, following the same instructions: """
@@ -0,0 +1,128 @@
+"""Python script with a token bucket rate limiter to keep the GPT calls
+under the requests per minute and tokens per minute limits of the API, and a server
+sharing the rate limiters between processes on this machine or others"""
+
+from multiprocessing.managers import BaseManager
+from os import getenv
+from threading import Lock
+import time
+
+GPT_REQUESTS_PER_MINUTE = int(getenv("GPT_REQUESTS_PER_MINUTE", "500"))
+GPT_TOKENS_PER_MINUTE = int(getenv("GPT_TOKENS_PER_MINUTE", "200000"))
+ARCHIVE_REQUESTS_PER_MINUTE = int(getenv("ARCHIVE_REQUESTS_PER_MINUTE", "600"))
+# requests and tokens per minute of the limiters served to other processes
+SHARED_LIMITS = {
+    "gpt": (GPT_REQUESTS_PER_MINUTE, GPT_TOKENS_PER_MINUTE),
+    "archive": (ARCHIVE_REQUESTS_PER_MINUTE, ARCHIVE_REQUESTS_PER_MINUTE),
+}
+
+
+class TokenBucket:
+    """Bucket holding up to a minute's worth of capacity that refills continuously"""
+
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.refill_per_second = per_minute / 60
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self) -> None:
+        """Adds the capacity regained since the last update"""
+        now = self.clock()
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.refill_per_second
+        )
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Returns the number of seconds until the amount will be available"""
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0
+        return (amount - self.available) / self.refill_per_second
+
+    def take(self, amount: float) -> None:
+        """Removes an amount from the bucket, it can go negative to pay back usage
+        that was higher than estimated"""
+        self.refill()
+        self.available -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        """Returns capacity that was taken but not used"""
+        self.refill()
+        self.available = min(self.capacity, self.available + amount)
+
+
+class RateLimiter:
+    """Limits calls by both requests per minute and tokens per minute"""
+
+    def __init__(
+        self,
+        requests_per_minute: int = GPT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = GPT_TOKENS_PER_MINUTE,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.sleep = sleep
+        self.lock = Lock()
+
+    def acquire(self, tokens: int) -> None:
+        """Blocks until one request using the estimated number of tokens can be sent"""
+        while True:
+            with self.lock:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait == 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+            self.sleep(wait)
+
+    def record_usage(self, estimated_tokens: int, used_tokens: int) -> None:
+        """Corrects the token bucket once the real usage of a request is known"""
+        with self.lock:
+            if used_tokens > estimated_tokens:
+                self.tokens.take(used_tokens - estimated_tokens)
+            else:
+                self.tokens.give_back(estimated_tokens - used_tokens)
+
+
+served_lock = Lock()
+served_limiters = {}
+
+
+def get_served_limiter(name: str) -> RateLimiter:
+    """Returns a limiter of SHARED_LIMITS in the process serving them, creating it on first use"""
+    with served_lock:
+        if name not in served_limiters:
+            served_limiters[name] = RateLimiter(*SHARED_LIMITS[name])
+        return served_limiters[name]
+
+
+class RateLimiterManager(BaseManager):
+    """Serves the shared rate limiters, every process given a limiter by the same server
+    (on this machine or over the network) waits on the same buckets"""
+
+
+RateLimiterManager.register("get_limiter", callable=get_served_limiter)
+
+
+def serve_rate_limiters(
+    address: tuple[str, int] = ("127.0.0.1", 0), authkey: bytes | None = None
+) -> RateLimiterManager:
+    """Starts a process serving the shared rate limiters, on a free port unless one is given"""
+    manager = RateLimiterManager(address, authkey)
+    manager.start()  # pylint: disable=consider-using-with
+    return manager
+
+
+def connect_rate_limiters(
+    address: tuple[str, int], authkey: bytes | None = None
+) -> RateLimiterManager:
+    """Connects to the rate limiters served by serve_rate_limiters"""
+    manager = RateLimiterManager(address, authkey)
+    manager.connect()
+    return manager
@@ -0,0 +1,104 @@
+"""Python script to run a sequence of processing steps as concurrent stages,
+each in its own thread and linked to the next by a bounded queue"""
+
+from queue import Queue, Empty, Full
+from threading import Event, Thread
+from typing import Any, Callable, Iterable, Iterator
+
+STAGE_QUEUE_SIZE = 2
+QUEUE_POLL_SECONDS = 0.1
+
+
+class EndOfStream:  # pylint: disable=too-few-public-methods
+    """Marker put on a queue once every item has passed through it"""
+
+
+class StageFailure:  # pylint: disable=too-few-public-methods
+    """Carries an exception raised by a stage down to the consumer"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def put_item(queue: Queue, item: Any, stop: Event) -> bool:
+    """Puts an item on a queue, waiting while it is full,
+    returns False if the stream was stopped before there was room"""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def get_item(queue: Queue, stop: Event) -> Any:
+    """Gets the next item from a queue, returns EndOfStream if the stream was stopped"""
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=QUEUE_POLL_SECONDS)
+        except Empty:
+            continue
+    return EndOfStream()
+
+
+def feed_source(source: Iterable, out_queue: Queue, stop: Event) -> None:
+    """Puts every item of the source on the first queue"""
+    try:
+        for item in source:
+            if not put_item(out_queue, item, stop):
+                return
+    except Exception as err:  # pylint: disable=broad-except
+        put_item(out_queue, StageFailure(err), stop)
+        return
+    put_item(out_queue, EndOfStream(), stop)
+
+
+def run_stage(step: Callable, in_queue: Queue, out_queue: Queue, stop: Event) -> None:
+    """Applies a step to every item of the in queue and puts the results on the out queue"""
+    while True:
+        item = get_item(in_queue, stop)
+        if isinstance(item, (EndOfStream, StageFailure)):
+            put_item(out_queue, item, stop)
+            return
+        try:
+            result = step(item)
+        except Exception as err:  # pylint: disable=broad-except
+            put_item(out_queue, StageFailure(err), stop)
+            return
+        if not put_item(out_queue, result, stop):
+            return
+
+
+def run_stages(
+    source: Iterable, steps: list[Callable], queue_size: int = STAGE_QUEUE_SIZE
+) -> Iterator:
+    """Streams every item of the source through the steps and yields the results in order.
+    Each step runs in its own thread so all steps work on different items at the same time,
+    a step blocks once queue_size of its results are waiting for the next step"""
+    stop = Event()
+    queues = [Queue(maxsize=queue_size) for _ in range(len(steps) + 1)]
+    threads = [Thread(target=feed_source, args=(source, queues[0], stop), daemon=True)]
+    for i, step in enumerate(steps):
+        threads.append(
+            Thread(
+                target=run_stage,
+                args=(step, queues[i], queues[i + 1], stop),
+                daemon=True,
+            )
+        )
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = get_item(queues[-1], stop)
+            if isinstance(item, EndOfStream):
+                return
+            if isinstance(item, StageFailure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
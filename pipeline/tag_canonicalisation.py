@@ -0,0 +1,177 @@
+"""Python script to canonicalise the tags GPT gives each case, mapping synonyms and near
+duplicates onto a single tag. Tags already in the tag table are preferred, and every decision
+is kept in a local SQLite file so each distinct tag is only worked out once"""
+
+from os import getenv
+from threading import Lock
+import sqlite3
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import JaroWinkler
+from psycopg2.extensions import connection
+from psycopg2.extras import RealDictCursor
+from wordnet_synonyms import get_synonym_table
+
+SIMILARITY_CUTOFF = 0.9
+TAG_CACHE_PATH = getenv("TAG_CACHE_PATH", "tag_cache.sqlite")
+
+
+def synonym_extractor(phrase: str) -> set[str]:
+    """Uses the WordNet synonym table to find synonyms of a word"""
+    if not isinstance(phrase, str):
+        return set()
+    synonym_table = get_synonym_table()
+    synonyms = []
+    for word in phrase.split(" "):
+        synonyms.extend(synonym_table.get_lemmas(word))
+        synonyms = {word.capitalize() for word in synonyms}
+        if word in synonyms:
+            synonyms.remove(str(word))
+        synonyms = list(synonyms)
+    return set(synonyms)
+
+
+class TagDecisionCache:
+    """The canonical tag chosen for every tag seen so far, stored in a SQLite file
+    (or in memory with ':memory:')"""
+
+    def __init__(self, cache_path: str = TAG_CACHE_PATH):
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS tag_decision (
+                tag TEXT PRIMARY KEY,
+                canonical TEXT NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def get_all(self) -> dict[str, str]:
+        """Returns every decision made so far as a map of tag to canonical tag"""
+        return dict(self.conn.execute("SELECT tag, canonical FROM tag_decision"))
+
+    def set_many(self, decisions: dict[str, str]) -> None:
+        """Stores new decisions"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO tag_decision(tag, canonical) VALUES (?, ?)",
+            decisions.items(),
+        )
+        self.conn.commit()
+
+
+class TagCanonicaliser:
+    """Maps each tag onto a canonical tag: itself if it is already known, else a known synonym,
+    else a known tag with a Jaro-Winkler similarity above the cutoff, else it becomes a known
+    tag itself. Known tags are the tag table's, read once and then topped up like the judge
+    roster, and the ones chosen before"""
+
+    def __init__(self, cache: TagDecisionCache | None = None, synonyms=synonym_extractor):
+        self.cache = cache
+        self.synonyms = synonyms
+        self.decisions = cache.get_all() if cache else {}
+        self.tags = []
+        self.positions = {}
+        self.tag_ids = set()
+        self.last_tag_id = 0
+        self.lock = Lock()
+        self.add_tags(self.decisions.values())
+
+    def add_tags(self, tags) -> None:
+        """Adds tags to the known tags, in the order they are preferred"""
+        for tag in tags:
+            if tag not in self.positions:
+                self.positions[tag] = len(self.tags)
+                self.tags.append(tag)
+
+    def refresh(self, conn: connection) -> None:
+        """Reads only the tags added to the table since the last refresh, and all of them again
+        when the tags up to the last id read are not all known, like the judge roster"""
+        query = """
+                SELECT tag_id, tag_name FROM tag WHERE tag_id > %s ORDER BY tag_id;
+        """
+        count_query = """
+                SELECT COUNT(*) AS tags FROM tag WHERE tag_id <= %s;
+        """
+        with self.lock:
+            last_tag_id = self.last_tag_id
+            known = len(self.tag_ids)
+        with conn.cursor(cursor_factory=RealDictCursor) as curs:
+            curs.execute(query, (last_tag_id,))
+            result = curs.fetchall()
+            if last_tag_id:
+                curs.execute(count_query, (last_tag_id,))
+                if curs.fetchone()["tags"] != known:
+                    curs.execute(query, (0,))
+                    result = curs.fetchall()
+        tag_ids = {row["tag_id"]: row["tag_name"] for row in result}
+        with self.lock:
+            self.tag_ids.update(tag_ids)
+            self.add_tags(tag_ids.values())
+            if tag_ids:
+                self.last_tag_id = max(self.last_tag_id, *tag_ids)
+
+    def find_similar(self, tag: str, candidates: list[str]) -> str | None:
+        """Returns the first of the most similar candidates if it is similar enough"""
+        match = process.extractOne(
+            tag, candidates, scorer=JaroWinkler.normalized_similarity, score_cutoff=SIMILARITY_CUTOFF
+        )
+        if match and match[1] > SIMILARITY_CUTOFF:
+            return match[0]
+        return None
+
+    def decide(self, tag: str, similar: str | None, page_start: int) -> str:
+        """Picks the canonical tag of a tag not seen before, given the most similar known tag
+        from the batched search. Tags added by this page are past page_start and were not
+        part of that search"""
+        if tag in self.positions:
+            return tag
+        known_synonyms = [synonym for synonym in self.synonyms(tag) if synonym in self.positions]
+        if known_synonyms:
+            return min(known_synonyms, key=self.positions.get)
+        similar = similar or self.find_similar(tag, self.tags[page_start:])
+        if similar is None:
+            self.add_tags([tag])
+            return tag
+        return similar
+
+    def canonicalise(self, tags: list[str]) -> list[str]:
+        """Returns the canonical tag of every tag, dropping any that are not strings.
+        New tags are compared to the known tags in one cdist call, and a later tag of
+        the list is kept over an earlier synonym of it"""
+        tags = [tag for tag in tags if isinstance(tag, str)]
+        with self.lock:
+            new_tags = [tag for tag in reversed(dict.fromkeys(tags)) if tag not in self.decisions]
+            if new_tags:
+                known = list(self.tags)
+                similar = [None] * len(new_tags)
+                if known:
+                    scores = process.cdist(
+                        new_tags,
+                        known,
+                        scorer=JaroWinkler.normalized_similarity,
+                        score_cutoff=SIMILARITY_CUTOFF,
+                        dtype=np.float64,
+                        workers=-1,
+                    )
+                    for i, position in enumerate(scores.argmax(axis=1)):
+                        if scores[i, position] > SIMILARITY_CUTOFF:
+                            similar[i] = known[position]
+                decisions = {
+                    tag: self.decide(tag, similar_tag, len(known))
+                    for tag, similar_tag in zip(new_tags, similar)
+                }
+                self.decisions.update(decisions)
+                if self.cache:
+                    self.cache.set_many(decisions)
+            return [self.decisions[tag] for tag in tags]
+
+
+cache_lock = Lock()
+canonicalisers = {}
+
+
+def get_tag_canonicaliser() -> TagCanonicaliser:
+    """Returns the tag canonicaliser shared by the process, opening its decision file on first use"""
+    with cache_lock:
+        if "default" not in canonicalisers:
+            canonicalisers["default"] = TagCanonicaliser(TagDecisionCache())
+        return canonicalisers["default"]
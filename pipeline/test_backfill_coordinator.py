@@ -0,0 +1,76 @@
+"Script that will test the functioning of the backfill_coordinator script"
+from datetime import date
+from unittest.mock import patch
+import pytest
+from backfill_coordinator import get_date_ranges, get_shards, get_machine_shards, parse_address
+from backfill_coordinator import run_shard, merge_report, format_report
+from extract import COURTS
+
+
+class TestShards:
+
+    def test_date_ranges_cover_every_day_once(self):
+        ranges = get_date_ranges(date(2020, 1, 1), date(2020, 3, 1), 30)
+        assert ranges == [
+            (date(2020, 1, 1), date(2020, 1, 30)),
+            (date(2020, 1, 31), date(2020, 2, 29)),
+            (date(2020, 3, 1), date(2020, 3, 1)),
+        ]
+
+    def test_date_ranges_invalid(self):
+        with pytest.raises(ValueError):
+            get_date_ranges(date(2020, 1, 1), date(2020, 3, 1), 0)
+
+    def test_date_shards_search_every_court(self):
+        shards = get_shards(date(2020, 1, 1), date(2020, 1, 10), 5)
+        assert [shard["name"] for shard in shards] == [
+            "2020-01-01..2020-01-05", "2020-01-06..2020-01-10"]
+        assert all(shard["url"].count("&court=") == len(COURTS) for shard in shards)
+        assert "from_date_0=6&from_date_1=1&from_date_2=2020" in shards[1]["url"]
+
+    def test_court_shards(self):
+        shards = get_shards(date(2020, 1, 1), date(2020, 1, 10), 10, by_court=True)
+        assert len(shards) == len(COURTS)
+        assert shards[2]["name"] == "2020-01-01..2020-01-10 ewca/civ"
+        assert shards[2]["url"].count("&court=") == 1
+
+    def test_machine_shards_split_without_overlap(self):
+        shards = [{"name": str(i)} for i in range(5)]
+        first = get_machine_shards(shards, "0/2")
+        second = get_machine_shards(shards, "1/2")
+        assert len(first) + len(second) == 5
+        assert not {s["name"] for s in first} & {s["name"] for s in second}
+
+    def test_parse_address(self):
+        assert parse_address("10.0.0.5:50000") == ("10.0.0.5", 50000)
+        with pytest.raises(ValueError):
+            parse_address("10.0.0.5")
+
+
+class TestReport:
+
+    @patch("backfill_coordinator.run_backfill")
+    def test_run_shard(self, mock_run_backfill):
+        mock_run_backfill.return_value = {"pages": 2, "cases": 90}
+        result = run_shard({"name": "a", "url": "url"}, True)
+        mock_run_backfill.assert_called_once_with("url", True, show_progress=False)
+        assert result["pages"] == 2 and result["cases"] == 90 and result["error"] is None
+
+    @patch("backfill_coordinator.run_backfill")
+    def test_failed_shard_reported(self, mock_run_backfill):
+        mock_run_backfill.side_effect = ConnectionError("down")
+        result = run_shard({"name": "a", "url": "url"})
+        assert result["error"] == "ConnectionError: down"
+        assert result["cases"] == 0
+
+    def test_merge_report(self):
+        results = [
+            {"name": "b", "pages": 2, "cases": 90, "error": None},
+            {"name": "a", "pages": 1, "cases": 10, "error": "ValueError: bad"},
+        ]
+        report = merge_report(results)
+        assert report["shards"] == 2
+        assert report["pages"] == 3
+        assert report["cases"] == 100
+        assert [result["name"] for result in report["failed"]] == ["a"]
+        assert "a: ValueError: bad" in format_report(report, 12)
@@ -0,0 +1,48 @@
+"Script that will test the functioning of the checkpoint script"
+import pytest
+from checkpoint import BackfillCheckpoint, get_shard_pages, parse_shard
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return BackfillCheckpoint(str(tmp_path / "checkpoint.sqlite"))
+
+
+class TestShards:
+
+    def test_parse_shard(self):
+        assert parse_shard("1/4") == (1, 4)
+
+    @pytest.mark.parametrize("shard", ["4/4", "-1/2", "1", "a/b", "0/0"])
+    def test_invalid_shard(self, shard):
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+    def test_shards_cover_every_page_once(self):
+        shards = [get_shard_pages(10, index, 3) for index in range(3)]
+        assert shards[0] == [1, 4, 7, 10]
+        assert sorted(page for shard in shards for page in shard) == list(range(1, 11))
+
+    def test_single_shard(self):
+        assert get_shard_pages(3) == [1, 2, 3]
+
+
+class TestBackfillCheckpoint:
+
+    def test_pages_and_cases_recorded(self, checkpoint):
+        checkpoint.mark_page_loaded("url", 1, ["[2020] A 1", "[2020] A 2"])
+        checkpoint.mark_page_loaded("url", 2, [])
+        checkpoint.mark_page_loaded("other", 5, ["[2020] A 3"])
+        assert checkpoint.get_loaded_pages("url") == {1, 2}
+        assert checkpoint.count_loaded_cases("url") == 2
+
+    def test_checkpoint_survives_restart(self, tmp_path):
+        BackfillCheckpoint(str(tmp_path / "checkpoint.sqlite")).mark_page_loaded("url", 3, ["a"])
+        assert BackfillCheckpoint(str(tmp_path / "checkpoint.sqlite")).get_loaded_pages("url") == {3}
+
+    def test_reset_only_given_pages(self, checkpoint):
+        checkpoint.mark_page_loaded("url", 1, ["a"])
+        checkpoint.mark_page_loaded("url", 2, ["b"])
+        checkpoint.reset("url", [1])
+        assert checkpoint.get_loaded_pages("url") == {2}
+        assert checkpoint.count_loaded_cases("url") == 1
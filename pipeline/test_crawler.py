@@ -0,0 +1,81 @@
+"Script that will test the functioning of the crawler script"
+from datetime import date
+from unittest.mock import patch
+import pytest
+from crawler import HighWaterMark, crawl_new_listings, get_listing_date
+
+
+def listing(citation, listing_date):
+    return (f"/{citation}", {"citation": citation, "date": listing_date})
+
+
+@pytest.fixture
+def mark():
+    return HighWaterMark(date(2024, 8, 12), ["[2024] EWHC 1 (Ch)"])
+
+
+class TestListingDate:
+
+    def test_listing_format(self):
+        assert get_listing_date({"date": "3 Feb 2003, midnight"}) == date(2003, 2, 3)
+
+    def test_iso_format(self):
+        assert get_listing_date({"date": "2003-02-03"}) == date(2003, 2, 3)
+
+    def test_missing_or_invalid(self):
+        assert get_listing_date({"date": None}) is None
+        assert get_listing_date({"date": "yesterday"}) is None
+
+
+class TestHighWaterMark:
+
+    def test_old_log_format(self):
+        mark = HighWaterMark.from_json({"12-08-2024": ["[2024] EWHC 1 (Ch)"]})
+        assert mark.date == date(2024, 8, 12)
+        assert mark.citations == {"[2024] EWHC 1 (Ch)"}
+
+    def test_json_round_trip(self, mark):
+        assert HighWaterMark.from_json(mark.to_json()).to_json() == {
+            "date": "2024-08-12", "citations": ["[2024] EWHC 1 (Ch)"]}
+        assert mark.get_log_date() == "12-08-2024"
+
+    def test_is_new(self, mark):
+        assert mark.is_new(listing("[2024] EWHC 2 (Ch)", "12 Aug 2024, midnight")[1])
+        assert mark.is_new(listing("[2024] EWHC 3 (Ch)", "13 Aug 2024, midnight")[1])
+        assert not mark.is_new(listing("[2024] EWHC 1 (Ch)", "12 Aug 2024, midnight")[1])
+        assert not mark.is_new(listing("[2024] EWHC 4 (Ch)", "11 Aug 2024, midnight")[1])
+        assert not mark.is_new(listing(None, "13 Aug 2024, midnight")[1])
+
+    def test_add_moves_mark(self, mark):
+        mark.add([listing("[2024] EWHC 2 (Ch)", "12 Aug 2024, midnight")[1],
+                  listing("[2024] EWHC 5 (Ch)", "14 Aug 2024, midnight")[1],
+                  listing("[2024] EWHC 6 (Ch)", "13 Aug 2024, midnight")[1]])
+        assert mark.date == date(2024, 8, 14)
+        assert mark.citations == {"[2024] EWHC 5 (Ch)"}
+
+
+class TestCrawl:
+
+    @patch("crawler.get_listing_items")
+    def test_stops_at_first_page_without_new(self, mock_get_listing_items, mark):
+        mock_get_listing_items.side_effect = [
+            [listing("[2024] EWHC 3 (Ch)", "13 Aug 2024, midnight"),
+             listing("[2024] EWHC 2 (Ch)", "12 Aug 2024, midnight")],
+            [listing("[2024] EWHC 1 (Ch)", "12 Aug 2024, midnight")],
+            [listing("[2024] EWHC 9 (Ch)", "12 Aug 2024, midnight")],
+        ]
+        pages = list(crawl_new_listings("url&page=", mark))
+        assert [page_num for page_num, _ in pages] == [1]
+        assert [item[1]["citation"] for item in pages[0][1]] == [
+            "[2024] EWHC 3 (Ch)", "[2024] EWHC 2 (Ch)"]
+        assert mock_get_listing_items.call_count == 2
+
+    @patch("crawler.get_listing_items", return_value=[])
+    def test_no_results(self, mock_get_listing_items, mark):
+        assert not list(crawl_new_listings("url&page=", mark))
+        mock_get_listing_items.assert_called_once_with("url&page=", 1)
+
+    @patch("crawler.get_listing_items")
+    def test_max_pages(self, mock_get_listing_items, mark):
+        mock_get_listing_items.return_value = [listing("[2024] EWHC 3 (Ch)", "13 Aug 2024, midnight")]
+        assert len(list(crawl_new_listings("url&page=", mark, max_pages=2))) == 2
@@ -0,0 +1,31 @@
+"Script that will test that the Dockerfile copies the modules the live pipeline needs"
+import re
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent
+
+
+def copied_files():
+    dockerfile = (PIPELINE_DIR / "Dockerfile").read_text(encoding="utf-8")
+    return re.findall(r"^COPY (\S+) \.$", dockerfile, re.MULTILINE)
+
+
+def local_imports(file_name):
+    source = (PIPELINE_DIR / file_name).read_text(encoding="utf-8")
+    modules = re.findall(r"^\s*(?:from|import) (\w+)", source, re.MULTILINE)
+    return {module for module in modules if (PIPELINE_DIR / f"{module}.py").exists()}
+
+
+class TestDockerfile:
+
+    def test_copied_files_exist(self):
+        assert [name for name in copied_files() if not (PIPELINE_DIR / name).exists()] == []
+
+    def test_local_imports_copied(self):
+        copied = set(copied_files())
+        missing = {
+            f"{module}.py"
+            for name in copied if name.endswith(".py")
+            for module in local_imports(name)
+        } - copied
+        assert missing == set()
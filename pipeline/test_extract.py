@@ -1,7 +1,12 @@
 "Script that will test the functioning of the extract script"
+import time
+from datetime import date
+from unittest.mock import MagicMock, patch
 import pytest
 from bs4 import BeautifulSoup
 from extract import get_article_data, get_max_page_num, validate_html_data, extract_judgment_data, get_listing_data
+from extract import get_articles_data, parse_judgment_listing, construct_search_url
+from http_client import DEFAULT_MAX_CONNECTIONS_PER_HOST, get_host_semaphore, set_host_limit
 
 #assuming the cases don't not get deleted
 class TestGetData:
@@ -127,4 +132,110 @@ class TestExtractingData:
     def test_extract_judgment_data_works(self, html_str, base_url):
         soup = BeautifulSoup(html_str, 'html.parser')
         tags = soup.find_all('li')
-        assert isinstance(extract_judgment_data(tags[0], base_url, []), dict)
\ No newline at end of file
+        assert isinstance(extract_judgment_data(tags[0], base_url, []), dict)
+
+    def test_parse_judgment_listing(self, html_str, base_url):
+        soup = BeautifulSoup(html_str, 'html.parser')
+        href, listing = parse_judgment_listing(soup.find('li'), base_url)
+        assert href == "/ewhc/ch/2003/13"
+        assert listing == {"title": "Cibc Mellon Trust Company & Ors v Stolzenberg & Ors",
+                           "url": "https://caselaw.nationalarchives.gov.uk/ewhc/ch/2003/13",
+                           "court": "High Court (Chancery Division)",
+                           "citation": "[2003] EWHC 13 (Ch)",
+                           "date": "3 Feb 2003, midnight"}
+
+
+class TestConcurrentArticles:
+
+    @pytest.fixture
+    def hrefs(self):
+        return [f'/ewhc/ch/2003/{i}' for i in range(10)]
+
+    @patch("extract.get_article_data")
+    def test_articles_keep_order(self, mock_get_article_data, hrefs):
+        def slow_article(href):
+            time.sleep(0.01 * (10 - int(href.split('/')[-1])))
+            return f'text of {href}'
+        mock_get_article_data.side_effect = slow_article
+        assert get_articles_data(hrefs, 5) == [f'text of {href}' for href in hrefs]
+
+    @patch("extract.get_article_data")
+    def test_articles_one_worker(self, mock_get_article_data, hrefs):
+        mock_get_article_data.side_effect = lambda href: href
+        assert get_articles_data(hrefs, 1) == hrefs
+
+
+class TestStreamedArticle:
+
+    @patch("extract.ARTICLE_STREAMING", True)
+    @patch("page_archive.PAGE_ARCHIVE_DIR", None)
+    @patch("page_archive.http_client.get")
+    def test_article_text_streamed(self, mock_get):
+        page = b"<html><nav>Menu</nav><article><p>1.</p> Judgment &amp; order</article><footer>x</footer></html>"
+        mock_get.return_value.iter_content.return_value = iter([page[:30], page[30:]])
+        assert get_article_data('/ewhc/ch/2003/13') == "1. Judgment & order"
+        assert mock_get.call_args.kwargs["stream"] is True
+
+    @patch("extract.ARTICLE_STREAMING", True)
+    @patch("page_archive.PAGE_ARCHIVE_DIR", None)
+    @patch("http_client.get_session")
+    def test_host_slot_freed_when_parsing_fails(self, mock_get_session):
+        host = "caselaw.nationalarchives.gov.uk"
+        mock_get_session.return_value.get.return_value.iter_content.return_value = iter(
+            [b"<html><article>", b"Judgment</article></html>"])
+
+        def failing_parse(chunks):
+            next(iter(chunks))
+            raise ValueError("Unparsable page")
+        set_host_limit(host, 1)
+        try:
+            with patch("extract.stream_article_text", side_effect=failing_parse), \
+                    pytest.raises(ValueError) as error:
+                get_article_data('/ewhc/ch/2003/13')
+            semaphore = get_host_semaphore(f"https://{host}/")
+            assert semaphore.acquire(blocking=False)
+            semaphore.release()
+            assert error.traceback
+        finally:
+            set_host_limit(host, DEFAULT_MAX_CONNECTIONS_PER_HOST)
+
+
+class TestConcurrentListingData:
+
+    @pytest.fixture
+    def listing_html(self):
+        items = "".join(f"""<li><span class="judgment-listing__title"><a href="/ewhc/ch/2003/{i}">Case {i}</a></span>
+        <span class="judgment-listing__court">High Court (Chancery Division)</span>
+        <span class="judgment-listing__neutralcitation">[2003] EWHC {i} (Ch)</span>
+        <time class="judgment-listing__date" datetime="3 Feb 2003, midnight">03 Feb 2003</time></li>""" for i in range(4))
+        return f'<html><ul class="judgment-listing__list">{items}</ul></html>'.encode()
+
+    @patch("extract.get_articles_data")
+    @patch("page_archive.http_client.get")
+    def test_listing_keeps_order_and_filters(self, mock_get, mock_get_articles_data, listing_html):
+        mock_get.return_value = MagicMock(content=listing_html)
+        mock_get_articles_data.side_effect = lambda hrefs, workers: [
+            '' if href.endswith('2') else f'text {href}' for href in hrefs]
+        result = get_listing_data('url&page=', 1, ['[2003] EWHC 0 (Ch)'], 4)
+        assert [case['citation'] for case in result] == ['[2003] EWHC 1 (Ch)', '[2003] EWHC 3 (Ch)']
+        assert mock_get_articles_data.call_args[0][0] == ['/ewhc/ch/2003/1', '/ewhc/ch/2003/2', '/ewhc/ch/2003/3']
+        assert list(result[0].keys()) == ["title", "url", "court", "citation", "date", "text_raw"]
+
+
+class TestSearchUrl:
+
+    def test_date_range(self):
+        url = construct_search_url(date(2020, 1, 1), date(2024, 8, 11))
+        assert "order=date&" in url
+        assert "from_date_0=1&from_date_1=1&from_date_2=2020" in url
+        assert "to_date_0=11&to_date_1=8&to_date_2=2024" in url
+        assert url.endswith("&party=&judge=&page=")
+
+    def test_open_ended_newest_first(self):
+        url = construct_search_url(date(2024, 2, 3), order="-date")
+        assert "order=-date&" in url
+        assert "to_date_0=&to_date_1=&to_date_2=&" in url
+
+    def test_courts_encoded(self):
+        url = construct_search_url(date(2024, 2, 3), courts=("uksc", "ewca/civ"))
+        assert "&court=uksc&court=ewca%2Fciv&party=" in url
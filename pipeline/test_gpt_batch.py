@@ -0,0 +1,357 @@
+"Script that will test the functioning of the gpt_batch script against a fake Batch API"
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import pytest
+from gpt_batch import (
+    build_batch_request,
+    write_batch_files,
+    submit_batch_file,
+    wait_for_batches,
+    read_batch_results,
+    combine_results,
+    run_batch_backfill,
+    load_manifest,
+)
+from gpt_cache import LocalCache, set_gpt_cache
+from openai import OpenAI
+
+
+VALID_REPLY = {
+    "case_number": None,
+    "judge": ["Judge A"],
+    "first_side": [{"name": "A", "lawyer": None, "law_firm": None}],
+    "second_side": [{"name": "B", "lawyer": None, "law_firm": None}],
+    "verdict": "Dismissed",
+    "verdict_summary": "Dismissed",
+    "summary": "Summary",
+    "tags": ["Appeal"],
+}
+
+
+class FakeBatchAPI:
+    """Stands in for the files and batches endpoints of the OpenAI API,
+    batches complete after being polled a set number of times"""
+
+    def __init__(self, polls_until_done=1, failing_ids=(), failures=None):
+        self.uploads = {}
+        self.batch_inputs = {}
+        self.polls = {}
+        self.polls_until_done = polls_until_done
+        self.failing_ids = failing_ids
+        self.failures = failures  # times each failing request fails, every time if None
+        self.failed = {}
+        self.files = SimpleNamespace(create=self.create_file, content=self.file_content)
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve_batch)
+
+    def create_file(self, file, purpose, timeout=None):
+        file_id = f"file-{len(self.uploads)}"
+        self.uploads[file_id] = file.read().decode("utf-8")
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch-{len(self.polls)}"
+        self.polls[batch_id] = 0
+        self.batch_inputs[batch_id] = input_file_id
+        return SimpleNamespace(id=batch_id, status="validating")
+
+    def retrieve_batch(self, batch_id):
+        self.polls[batch_id] += 1
+        if self.polls[batch_id] < self.polls_until_done:
+            return SimpleNamespace(id=batch_id, status="in_progress", output_file_id=None)
+        output_id = f"output-{batch_id}"
+        lines = []
+        for line in self.uploads[self.batch_inputs[batch_id]].splitlines():
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            if custom_id in self.failing_ids and (
+                    self.failures is None or self.failed.get(custom_id, 0) < self.failures):
+                self.failed[custom_id] = self.failed.get(custom_id, 0) + 1
+                lines.append(json.dumps({"custom_id": request["custom_id"], "response": None,
+                                         "error": {"message": "failed"}}))
+                continue
+            content = json.dumps(VALID_REPLY | {"case_number": request["custom_id"]})
+            lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": {
+                    "choices": [{"message": {"content": content}}],
+                    "usage": {"completion_tokens": 10, "prompt_tokens": 100, "total_tokens": 110}}},
+                "error": None}))
+        self.uploads[output_id] = "\n".join(lines)
+        return SimpleNamespace(id=batch_id, status="completed", output_file_id=output_id)
+
+    def file_content(self, file_id):
+        return SimpleNamespace(text=self.uploads[file_id])
+
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    """Serves the files and batches endpoints of the OpenAI API over HTTP from a FakeBatchAPI,
+    so the real client's multipart upload, JSON parsing and file download are exercised"""
+
+    api = None
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def send_json(self, body, status=200):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_batch(self, batch):
+        self.send_json({
+            "id": batch.id, "object": "batch", "status": batch.status,
+            "endpoint": "/v1/chat/completions", "completion_window": "24h",
+            "input_file_id": self.api.batch_inputs[batch.id], "created_at": int(time.time()),
+            "output_file_id": getattr(batch, "output_file_id", None),
+        })
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/v1/files":
+            form = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body)
+            fields = {part.get_param("name", header="content-disposition"): part.get_content()
+                      for part in form.iter_parts()}
+            content = fields["file"]
+            uploaded = self.api.create_file(
+                BytesIO(content if isinstance(content, bytes) else content.encode("utf-8")),
+                fields["purpose"])
+            self.send_json({
+                "id": uploaded.id, "object": "file", "purpose": uploaded.purpose, "bytes": len(content),
+                "created_at": int(time.time()), "filename": "requests.jsonl", "status": "processed",
+            })
+        elif self.path == "/v1/batches":
+            request = json.loads(body)
+            self.send_batch(self.api.create_batch(
+                request["input_file_id"], request["endpoint"], request["completion_window"]))
+        else:
+            self.send_json({"error": {"message": f"No route {self.path}"}}, 404)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        parts = self.path.strip("/").split("/")
+        if parts[:2] == ["v1", "batches"]:
+            self.send_batch(self.api.retrieve_batch(parts[2]))
+        elif parts[:2] == ["v1", "files"] and parts[3:] == ["content"]:
+            content = self.api.file_content(parts[2]).text.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self.send_json({"error": {"message": f"No route {self.path}"}}, 404)
+
+
+@pytest.fixture
+def local_batch_endpoint():
+    """An OpenAI client pointed at a FakeBatchAPI served on a local port"""
+    api = FakeBatchAPI()
+    handler = type("Handler", (FakeBatchHandler,), {"api": api})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                    max_retries=0)
+    yield client, api
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pages():
+    return [
+        (1, [{"citation": "[2020] A 1", "title": "A", "text_raw": "text a"},
+             {"citation": "[2020] A 2", "title": "B", "text_raw": "text b"}]),
+        (2, [{"citation": "[2020] A 3", "title": "C", "text_raw": "text c"}]),
+    ]
+
+
+@pytest.fixture(autouse=True)
+def cache():
+    memory_cache = LocalCache(":memory:")
+    set_gpt_cache(memory_cache)
+    return memory_cache
+
+
+@pytest.fixture(autouse=True)
+def no_tokenizer():
+    with patch("gpt_batch.build_user_message", side_effect=lambda text: "User: " + text):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def readable_cache_keys():
+    """Keys cases by their user message, which is also their custom id"""
+    with patch("gpt_batch.get_cache_key", side_effect=lambda *args: args[1]):
+        yield
+
+
+class TestBatchRequests:
+
+    def test_request_shape(self):
+        request = build_batch_request("[2020] A 1", "User: text")
+        assert request["custom_id"] == "[2020] A 1"
+        assert request["method"] == "POST"
+        assert request["url"] == "/v1/chat/completions"
+        assert request["body"]["model"] == "gpt-4o-mini"
+        assert request["body"]["messages"][1]["content"] == "User: text"
+        assert request["body"]["response_format"]["json_schema"]["strict"] is True
+
+    def test_write_batch_files(self, pages, tmp_path):
+        files = write_batch_files(pages, str(tmp_path))
+        assert len(files) == 1
+        with open(files[0], encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert [line["custom_id"] for line in lines] == ["User: text a", "User: text b", "User: text c"]
+        with open(tmp_path / "cases.jsonl", encoding="utf-8") as f:
+            cases = [json.loads(line) for line in f]
+        assert cases[0]["page"] == 1
+        assert cases[0]["case"] == {"citation": "[2020] A 1", "title": "A"}
+
+    def test_cached_cases_left_out(self, pages, tmp_path, cache):
+        cache.set("User: text b", {"reply": VALID_REPLY})
+        files = write_batch_files(pages, str(tmp_path))
+        with open(files[0], encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert [line["custom_id"] for line in lines] == ["User: text a", "User: text c"]
+
+    def test_judgment_on_two_pages_requested_once(self, pages, tmp_path):
+        pages.append((3, [{"citation": "[2020] A 3", "title": "C", "text_raw": "text c"}]))
+        files = write_batch_files(pages, str(tmp_path))
+        with open(files[0], encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert [line["custom_id"] for line in lines] == ["User: text a", "User: text b", "User: text c"]
+        with open(tmp_path / "cases.jsonl", encoding="utf-8") as f:
+            assert [json.loads(line)["page"] for line in f] == [1, 1, 2, 3]
+
+    def test_files_split_at_request_limit(self, pages, tmp_path):
+        with patch("gpt_batch.MAX_REQUESTS_PER_FILE", 2):
+            files = write_batch_files(pages, str(tmp_path))
+        assert len(files) == 2
+
+
+class TestBatchSubmission:
+
+    def test_submit_and_wait(self, pages, tmp_path):
+        api = FakeBatchAPI(polls_until_done=3)
+        files = write_batch_files(pages, str(tmp_path))
+        batch_id = submit_batch_file(api, files[0])
+        sleep = MagicMock()
+        batches = wait_for_batches(api, [batch_id], 5, sleep)
+        assert batches[0].status == "completed"
+        assert sleep.call_count == 2
+
+    def test_read_results_skips_failed_requests(self, pages, tmp_path):
+        api = FakeBatchAPI(failing_ids=("User: text b",))
+        files = write_batch_files(pages, str(tmp_path))
+        batch = wait_for_batches(api, [submit_batch_file(api, files[0])], 0, MagicMock())[0]
+        results = read_batch_results(api, batch)
+        assert set(results) == {"User: text a", "User: text c"}
+        assert json.loads(results["User: text a"])["case_number"] == "User: text a"
+
+    def test_read_results_no_output(self):
+        batch = SimpleNamespace(id="batch-0", status="failed", output_file_id=None)
+        assert read_batch_results(MagicMock(), batch) == {}
+
+    def test_combine_results(self, cache):
+        records = [{"cache_key": "key-a", "case": {"citation": "a"}},
+                   {"cache_key": "key-b", "case": {"citation": "b"}}]
+        assert combine_results(records, {"key-a": json.dumps(VALID_REPLY)}) == [
+            {"citation": "a"} | VALID_REPLY, None]
+        assert cache.get("key-a") == {"reply": VALID_REPLY}
+
+    def test_invalid_reply_not_cached(self, cache):
+        records = [{"cache_key": "key-a", "case": {"citation": "a"}}]
+        assert combine_results(records, {"key-a": '{"verdict": "Guilty"}'}) == [
+            {"citation": "a", "verdict": "Guilty"}]
+        assert cache.get("key-a") is None
+
+    def test_combine_results_from_cache(self, cache):
+        cache.set("key-b", {"reply": VALID_REPLY})
+        records = [{"cache_key": "key-b", "case": {"citation": "b"}}]
+        assert combine_results(records, {}) == [{"citation": "b"} | VALID_REPLY]
+
+
+class TestBatchBackfill:
+
+    def test_backfill_loads_every_page(self, pages, tmp_path):
+        api = FakeBatchAPI()
+        loaded = {}
+        with patch("gpt_batch.time.sleep"):
+            count = run_batch_backfill(pages, str(tmp_path), loaded.__setitem__, api)
+        assert count == 3
+        assert sorted(loaded) == [1, 2]
+        assert loaded[1][0]["title"] == "A"
+        assert loaded[1][0]["verdict"] == "Dismissed"
+        assert "text_raw" not in loaded[2][0]
+
+    def test_backfill_rerun_uses_cache(self, pages, tmp_path):
+        run_batch_backfill(pages, str(tmp_path / "first"), MagicMock(), FakeBatchAPI())
+        pages[0][1][0]["text_raw"] = "text a"
+        pages[0][1][1]["text_raw"] = "text b"
+        pages[1][1][0]["text_raw"] = "text c"
+        api = FakeBatchAPI()
+        loaded = {}
+        assert run_batch_backfill(pages, str(tmp_path / "second"), loaded.__setitem__, api) == 3
+        assert not api.uploads
+        assert loaded[2][0]["verdict"] == "Dismissed"
+
+    def test_backfill_resumes_without_resubmitting(self, pages, tmp_path):
+        api = FakeBatchAPI()
+        run_batch_backfill(pages, str(tmp_path), MagicMock(), api)
+        manifest = load_manifest(str(tmp_path))
+        assert manifest["loaded"] == [1, 2]
+        load_page = MagicMock()
+        with patch("gpt_batch.submit_batch_file") as mock_submit:
+            assert run_batch_backfill(iter([]), str(tmp_path), load_page, api) == 0
+            mock_submit.assert_not_called()
+        load_page.assert_not_called()
+
+    def test_failed_requests_resubmitted(self, pages, tmp_path):
+        api = FakeBatchAPI(failing_ids=("User: text b",), failures=1)
+        loaded = {}
+        with patch("gpt_batch.time.sleep"):
+            assert run_batch_backfill(pages, str(tmp_path), loaded.__setitem__, api) == 3
+        resubmitted = [json.loads(line) for line in api.uploads[api.batch_inputs["batch-1"]].splitlines()]
+        assert [request["custom_id"] for request in resubmitted] == ["User: text b"]
+        assert loaded[1][1]["case_number"] == "User: text b"
+        assert load_manifest(str(tmp_path))["loaded"] == [1, 2]
+
+    def test_page_with_failed_cases_left_for_rerun(self, pages, tmp_path):
+        api = FakeBatchAPI(failing_ids=("User: text b",))
+        loaded = {}
+        with patch("gpt_batch.time.sleep"):
+            assert run_batch_backfill(pages, str(tmp_path), loaded.__setitem__, api) == 2
+        assert loaded[1][1] is None
+        assert load_manifest(str(tmp_path))["loaded"] == [2]
+        api.failing_ids = ()
+        loaded = {}
+        with patch("gpt_batch.time.sleep"):
+            assert run_batch_backfill(iter([]), str(tmp_path), loaded.__setitem__, api) == 2
+        assert sorted(loaded) == [1]
+        assert loaded[1][1]["case_number"] == "User: text b"
+        assert load_manifest(str(tmp_path))["loaded"] == [2, 1]
+
+
+class TestLocalBatchEndpoint:
+
+    def test_backfill_through_openai_client(self, pages, tmp_path, local_batch_endpoint):
+        client, api = local_batch_endpoint
+        loaded = {}
+        count = run_batch_backfill(pages, str(tmp_path), loaded.__setitem__, client)
+        assert count == 3
+        uploaded = [json.loads(line) for line in api.uploads["file-0"].splitlines()]
+        assert [request["custom_id"] for request in uploaded] == ["User: text a", "User: text b", "User: text c"]
+        assert api.polls == {"batch-0": 1}
+        assert loaded[1][1]["case_number"] == "User: text b"
+        assert loaded[2][0]["verdict"] == "Dismissed"
@@ -0,0 +1,99 @@
+"Script that will test the functioning of the gpt_cache script"
+from unittest.mock import MagicMock, patch
+import sqlite3
+import redis
+from gpt_cache import get_cache_key, RedisCache, LocalCache, create_gpt_cache
+
+
+class TestCacheKey:
+
+    def test_same_request_same_key(self):
+        assert get_cache_key("system", "user", "gpt-4o-mini", 0.1) == get_cache_key(
+            "system", "user", "gpt-4o-mini", 0.1)
+
+    def test_key_changes_with_every_part(self):
+        key = get_cache_key("system", "user", "gpt-4o-mini", 0.1)
+        assert key != get_cache_key("new system", "user", "gpt-4o-mini", 0.1)
+        assert key != get_cache_key("system", "new user", "gpt-4o-mini", 0.1)
+        assert key != get_cache_key("system", "user", "gpt-4o", 0.1)
+        assert key != get_cache_key("system", "user", "gpt-4o-mini", 0.2)
+
+
+class TestLocalCache:
+
+    def test_set_and_get(self):
+        cache = LocalCache(":memory:")
+        cache.set("key", {"content": "{'verdict': 'Guilty'}"})
+        assert cache.get("key") == {"content": "{'verdict': 'Guilty'}"}
+        assert cache.get("missing") is None
+
+    def test_expired_entry(self):
+        cache = LocalCache(":memory:", ttl=10)
+        with patch("gpt_cache.time.time", return_value=100):
+            cache.set("key", {"content": "a"})
+        with patch("gpt_cache.time.time", return_value=111):
+            assert cache.get("key") is None
+
+    def test_least_recently_used_evicted(self):
+        cache = LocalCache(":memory:", ttl=10**12, max_entries=2)
+        with patch("gpt_cache.time.time", side_effect=[1, 2, 3, 4]):
+            cache.set("a", {"content": "a"})
+            cache.set("b", {"content": "b"})
+            cache.get("a")
+            cache.set("c", {"content": "c"})
+        assert cache.get("b") is None
+        assert cache.get("a") == {"content": "a"}
+
+    def test_persists_to_file(self, tmp_path):
+        LocalCache(str(tmp_path / "cache.sqlite")).set("key", {"content": "a"})
+        assert LocalCache(str(tmp_path / "cache.sqlite")).get("key") == {"content": "a"}
+
+
+    def test_locked_file_is_a_miss(self):
+        cache = LocalCache(":memory:")
+        cache.set("key", {"content": "a"})
+        cache.conn = MagicMock()
+        cache.conn.execute.side_effect = sqlite3.OperationalError("database is locked")
+        assert cache.get("key") is None
+        cache.set("key", {"content": "b"})
+        cache.conn.rollback.assert_called()
+
+
+class TestRedisCache:
+
+    def test_set_uses_ttl(self):
+        client = MagicMock()
+        RedisCache(client, ttl=60).set("key", {"content": "a"})
+        client.set.assert_called_once_with("key", '{"content": "a"}', ex=60)
+
+    def test_get(self):
+        client = MagicMock()
+        client.get.return_value = '{"content": "a"}'
+        assert RedisCache(client).get("key") == {"content": "a"}
+
+    def test_redis_error_is_a_miss(self):
+        client = MagicMock()
+        client.get.side_effect = redis.exceptions.ConnectionError
+        assert RedisCache(client).get("key") is None
+
+
+class TestCreateCache:
+
+    @patch("gpt_cache.redis.Redis")
+    def test_uses_redis_when_reachable(self, mock_redis):
+        assert isinstance(create_gpt_cache(), RedisCache)
+
+    @patch("gpt_cache.LOCAL_CACHE_PATH", ":memory:")
+    @patch("gpt_cache.redis.Redis")
+    def test_falls_back_to_local(self, mock_redis):
+        mock_redis.return_value.ping.side_effect = redis.exceptions.ConnectionError
+        with patch("gpt_cache.LocalCache") as mock_local:
+            create_gpt_cache()
+        mock_local.assert_called_once()
+
+    @patch("gpt_cache.redis.Redis")
+    def test_falls_back_to_local_on_timeout(self, mock_redis):
+        mock_redis.return_value.ping.side_effect = redis.exceptions.TimeoutError
+        with patch("gpt_cache.LocalCache") as mock_local:
+            create_gpt_cache()
+        mock_local.assert_called_once()
@@ -0,0 +1,44 @@
+"Script that will test the functioning of the gpt_schema script"
+from gpt_schema import compile_schema, get_invalid_fields, get_response_format, CASE_SCHEMA
+
+
+class TestCompiledSchema:
+
+    def test_nullable_string(self):
+        check = compile_schema({"type": ["string", "null"]})
+        assert check("text") and check(None)
+        assert not check(123)
+
+    def test_blank_string_rejected(self):
+        check = compile_schema({"type": "string", "minLength": 1})
+        assert not check("  ")
+
+    def test_participant_missing_field(self):
+        check = compile_schema(CASE_SCHEMA["properties"]["first_side"])
+        assert check([{"name": None, "lawyer": None, "law_firm": None}])
+        assert not check([{"name": "A", "lawyer": "B"}])
+        assert not check({"A": {"B": None}})
+
+
+class TestInvalidFields:
+
+    def test_names_failing_fields(self):
+        reply = {"verdict": "Unknown", "summary": "Summary", "judge": []}
+        assert get_invalid_fields(reply) == [
+            "case_number", "judge", "first_side", "second_side",
+            "verdict", "verdict_summary", "tags"]
+
+
+class TestResponseFormat:
+
+    def test_strict_schema_without_validator_keywords(self):
+        schema = get_response_format()["json_schema"]["schema"]
+        assert "minItems" not in schema["properties"]["judge"]
+        assert "minLength" not in schema["properties"]["summary"]
+        assert schema["required"] == CASE_SCHEMA["required"]
+
+    def test_subset_of_fields(self):
+        schema = get_response_format(["tags"])["json_schema"]["schema"]
+        assert list(schema["properties"]) == ["tags"]
+        assert schema["required"] == ["tags"]
+        assert "minItems" in CASE_SCHEMA["properties"]["tags"]
@@ -0,0 +1,149 @@
+"Script that will test the functioning of the html_parsing script"
+import pytest
+from bs4 import BeautifulSoup
+from html_parsing import OMITTED_TEXT_MARKER, TextWindow, get_article_text, parse_only
+from html_parsing import stream_article_text
+
+PARSERS = ["html.parser", "lxml"]
+
+
+@pytest.fixture
+def judgment_page():
+    return """<!DOCTYPE html><html><head><meta charset="utf-8"><script>var a = "<article>";</script>
+    <style>p {}</style></head><body><nav><a href="/">Home</a></nav>
+    <article><header><h1>[2024] EWHC 1 (Ch)</h1></header>
+    <p><span>1.</span> The claim&nbsp;&amp; the <em>appeal</em> &ldquo;fail&rdquo;.</p>
+    <table><tr><td>Lord Justice Café</td></tr></table><!-- comment --><script>track()</script>
+    <template>hidden</template><p>2. Costs follow.</p></article>
+    <footer>Not part of the judgment</footer></body></html>""".encode("utf-8")
+
+
+class TestArticleText:
+
+    @pytest.mark.parametrize("parser", PARSERS)
+    def test_same_text_as_whole_page(self, judgment_page, parser):
+        expected = BeautifulSoup(judgment_page, "html.parser").article.get_text()
+        assert get_article_text(judgment_page, parser) == expected
+
+    @pytest.mark.parametrize("page", [
+        b"<article>\n   <p>Indented</p>\n\n  <div> <b>bold</b>\t</div></article>",
+        b"<article><pre>  <b>  </b>\n  </pre>\n  </article>",
+    ])
+    def test_whitespace_kept_like_beautifulsoup(self, page):
+        expected = BeautifulSoup(page, "html.parser").article.get_text()
+        assert get_article_text(page, "lxml") == expected
+
+    def test_leaves_out_scripts_and_comments(self, judgment_page):
+        text = get_article_text(judgment_page, "lxml")
+        assert "track()" not in text and "comment" not in text and "hidden" not in text
+        assert "Not part" not in text
+
+    @pytest.mark.parametrize("parser", PARSERS)
+    def test_no_article(self, parser):
+        with pytest.raises(AttributeError):
+            get_article_text(b"<html><body><p>Not found</p></body></html>", parser)
+
+    def test_empty_page(self):
+        with pytest.raises(AttributeError):
+            get_article_text(b"", "lxml")
+
+    def test_declared_encoding(self):
+        page = '<html><head><meta charset="windows-1252"></head><body><article>Café “Q”</article>'
+        assert get_article_text(page.encode("windows-1252"), "lxml") == "Café “Q”"
+
+    def test_first_article_with_nested_article(self):
+        page = b"<article>outer <article>inner</article> tail</article><article>second</article>"
+        assert get_article_text(page, "lxml") == "outer inner tail"
+
+
+class TestParseOnly:
+
+    @pytest.mark.parametrize("parser", PARSERS)
+    def test_only_target_element_parsed(self, parser):
+        page = b"""<html><ul class="nav"><li>Menu</li></ul>
+        <ul class="judgment-listing__list"><li>Case 1</li><li>Case 2</li></ul></html>"""
+        soup = parse_only(page, "ul", {"class": "judgment-listing__list"}, parser)
+        assert [li.get_text() for li in soup.find_all("li")] == ["Case 1", "Case 2"]
+        assert soup.find("ul", class_="judgment-listing__list") is not None
+
+
+def in_chunks(content, size):
+    return (content[i:i + size] for i in range(0, len(content), size))
+
+
+class TestTextWindow:
+
+    def test_short_text_kept_whole(self):
+        window = TextWindow(10, 10)
+        for piece in ["abc", "def", "ghi"]:
+            window.add(piece)
+        assert window.get_text() == "abcdefghi"
+
+    def test_keeps_head_and_tail(self):
+        text = "".join(str(i % 10) for i in range(1000))
+        window = TextWindow(15, 20)
+        for piece in in_chunks(text, 7):
+            window.add(piece)
+        assert window.get_text() == text[:15] + OMITTED_TEXT_MARKER + text[-20:]
+        assert window.tail_size < 20 + 7
+
+    def test_text_just_fitting_not_marked(self):
+        window = TextWindow(10, 10)
+        for piece in in_chunks("abcdefghij0123456789", 3):
+            window.add(piece)
+        assert window.get_text() == "abcdefghij0123456789"
+
+    def test_dropped_middle_keeps_paragraphs_apart(self):
+        paragraphs = [f"{i}. Paragraph {i} of the judgment." for i in range(1, 101)]
+        window = TextWindow(60, 60)
+        for paragraph in paragraphs:
+            window.add(paragraph + "\n")
+        lines = window.get_text().split("\n")
+        assert "[...]" in lines
+        marker = lines.index("[...]")
+        assert lines[marker - 1] == lines[marker + 1] == ""
+        assert paragraphs[-1] in lines
+
+
+class TestStreamArticleText:
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+    def test_same_text_as_whole_page(self, judgment_page, chunk_size):
+        expected = BeautifulSoup(judgment_page, "html.parser").article.get_text()
+        assert stream_article_text(in_chunks(judgment_page, chunk_size)) == expected
+
+    @pytest.mark.parametrize("page", [
+        b"<article>\n   <p>Indented</p>\n\n  <div> <b>bold</b>\t</div></article>",
+        b"<article><pre>  <b>  </b>\n  </pre>\n  </article>",
+        b"<article>a<br>b</br><p/>c<![CDATA[d]]>&#150;&bogus;<ruby>e<rt>f</rt></ruby></article>",
+        b"<div><article>unclosed <p>tags</div> after",
+        b"\xef\xbb\xbf<article>byte order mark</article>",
+    ])
+    def test_parsed_like_beautifulsoup(self, page):
+        expected = BeautifulSoup(page, "html.parser").article.get_text()
+        assert stream_article_text(in_chunks(page, 3)) == expected
+
+    def test_long_article_windowed(self, judgment_page):
+        full = BeautifulSoup(judgment_page, "html.parser").article.get_text()
+        assert stream_article_text([judgment_page], 20, 30) == (
+            full[:20] + OMITTED_TEXT_MARKER + full[-30:])
+
+    def test_stops_reading_after_article(self):
+        read = []
+
+        def chunks():
+            for chunk in [b"<article>text</article>" + b" " * 4096, b"<footer>", b"rest</footer>"]:
+                read.append(chunk)
+                yield chunk
+
+        assert stream_article_text(chunks()) == "text"
+        assert len(read) == 1
+
+    def test_declared_encoding(self):
+        page = '<html><head><meta charset="windows-1252"></head><body><article>Café “Q”</article>'
+        assert stream_article_text(in_chunks(page.encode("windows-1252"), 5)) == "Café “Q”"
+
+    @pytest.mark.parametrize("page", [b"", b"<html><body><p>Not found</p></body></html>"])
+    def test_no_article(self, page):
+        with pytest.raises(AttributeError):
+            stream_article_text(in_chunks(page, 4))
@@ -0,0 +1,118 @@
+"Script that will test the functioning of the http_client script"
+import time
+from threading import Lock, Thread
+from unittest.mock import MagicMock, patch
+import pytest
+import http_client
+from http_client import create_session, get_session, close_session, get_host_semaphore, get_host_limit, set_host_limit, get
+from http_client import set_host_rate_limiter
+
+
+class TestSession:
+
+    def test_session_is_shared(self):
+        close_session()
+        assert get_session() is get_session()
+
+    def test_session_recreated_after_close(self):
+        first = get_session()
+        close_session()
+        assert get_session() is not first
+
+    def test_session_asks_for_gzip(self):
+        assert "gzip" in create_session().headers["Accept-Encoding"]
+
+    def test_session_retries_rate_limits_and_server_errors(self):
+        retry = create_session().get_adapter("https://caselaw.nationalarchives.gov.uk").max_retries
+        assert 429 in retry.status_forcelist
+        assert 503 in retry.status_forcelist
+        assert retry.total == http_client.MAX_RETRIES
+        assert retry.backoff_factor > 0
+
+    def test_session_pool_fits_host_limits(self):
+        adapter = create_session().get_adapter("https://caselaw.nationalarchives.gov.uk")
+        assert adapter._pool_maxsize >= max(http_client.HOST_CONNECTION_LIMITS.values())
+
+
+class TestHostLimits:
+
+    def test_same_semaphore_per_host(self):
+        first = get_host_semaphore("https://caselaw.nationalarchives.gov.uk/a")
+        second = get_host_semaphore("https://caselaw.nationalarchives.gov.uk/b")
+        assert first is second
+        assert first is not get_host_semaphore("https://www.judiciary.uk/a")
+
+    def test_unknown_host_gets_default_limit(self):
+        assert get_host_limit("example.com") == http_client.DEFAULT_MAX_CONNECTIONS_PER_HOST
+
+    def test_set_host_limit(self):
+        set_host_limit("limited.example.com", 1)
+        assert get_host_limit("limited.example.com") == 1
+
+    def test_set_host_limit_invalid(self):
+        with pytest.raises(ValueError):
+            set_host_limit("limited.example.com", 0)
+
+    @patch("http_client.get_session")
+    def test_host_concurrency_capped(self, mock_get_session):
+        set_host_limit("capped.example.com", 2)
+        lock = Lock()
+        in_flight = [0, 0]
+
+        def fake_get(url, timeout):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+            return MagicMock()
+        mock_get_session.return_value.get.side_effect = fake_get
+        threads = [Thread(target=get, args=(f"https://capped.example.com/{i}", 5)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert in_flight[1] == 2
+
+    @patch("http_client.get_session")
+    def test_get_passes_arguments(self, mock_get_session):
+        get("https://example.com/page", 10, stream=True).close()
+        mock_get_session.return_value.get.assert_called_once_with(
+            "https://example.com/page", timeout=10, stream=True)
+
+    @patch("http_client.get_session")
+    def test_streamed_response_holds_slot_until_closed(self, mock_get_session):
+        set_host_limit("streamed.example.com", 1)
+        semaphore = get_host_semaphore("https://streamed.example.com/")
+        close = mock_get_session.return_value.get.return_value.close
+        response = get("https://streamed.example.com/page", 10, stream=True)
+        assert not semaphore.acquire(blocking=False)
+        response.close()
+        response.close()
+        assert close.call_count == 2
+        assert semaphore.acquire(blocking=False)
+        semaphore.release()
+
+    @patch("http_client.get_session")
+    def test_slot_freed_when_request_fails(self, mock_get_session):
+        set_host_limit("failing.example.com", 1)
+        mock_get_session.return_value.get.side_effect = ConnectionError
+        with pytest.raises(ConnectionError):
+            get("https://failing.example.com/page", 10, stream=True)
+        assert get_host_semaphore("https://failing.example.com/").acquire(blocking=False)
+
+
+class TestHostRateLimiter:
+
+    @patch("http_client.get_session")
+    def test_waits_for_host_rate_limiter(self, mock_get_session):
+        limiter = MagicMock()
+        set_host_rate_limiter("limited.example.com", limiter)
+        try:
+            get("https://limited.example.com/page", 10)
+            get("https://other.example.com/page", 10)
+        finally:
+            set_host_rate_limiter("limited.example.com", None)
+        limiter.acquire.assert_called_once_with(0)
+        assert mock_get_session.return_value.get.call_count == 2
@@ -1,6 +1,6 @@
 import pytest
 from unittest.mock import MagicMock, patch
-from judge_matching import get_judges, standardise_judge_name, match_judge
+from judge_matching import get_judges, standardise_judge_name, match_judge, JudgeResolver, JudgeIndex, soundex, match_judges
 
 
 class TestGetJudges:
@@ -57,3 +57,113 @@ class TestMatchJudge:
     def test_match_judge_no_match_standardised(self):
         result = match_judge("Judge John", ["James", "Terrence"])
         assert result == "John"
+
+
+def roster_conn(*batches, counts=()):
+    fake_conn = MagicMock()
+    fake_cursor = fake_conn.cursor.return_value.__enter__.return_value
+    fake_cursor.fetchall.side_effect = list(batches)
+    fake_cursor.fetchone.side_effect = [{"judges": count} for count in counts]
+    return fake_conn, fake_cursor
+
+
+class TestJudgeResolver:
+    def test_roster_read_once_then_incrementally(self):
+        fake_conn, fake_cursor = roster_conn(
+            [{"judge_id": 1, "judge_name": "James"}, {"judge_id": 2, "judge_name": "Terrence"}],
+            [{"judge_id": 3, "judge_name": "Hamblen"}],
+            counts=[2],
+        )
+        resolver = JudgeResolver()
+        assert resolver.resolve(fake_conn, ["Justice James"]) == ["James"]
+        assert resolver.resolve(fake_conn, ["Lord Justice Hamblen"]) == ["Hamblen"]
+        assert fake_cursor.execute.call_args_list[0][0][1] == (0,)
+        assert fake_cursor.execute.call_args_list[1][0][1] == (2,)
+        assert fake_cursor.execute.call_count == 3
+
+    def test_judges_committed_out_of_order_reread(self):
+        fake_conn, fake_cursor = roster_conn(
+            [{"judge_id": 1, "judge_name": "James"}, {"judge_id": 3, "judge_name": "Terrence"}],
+            [],
+            [
+                {"judge_id": 1, "judge_name": "James"},
+                {"judge_id": 2, "judge_name": "Hamblen"},
+                {"judge_id": 3, "judge_name": "Terrence"},
+            ],
+            counts=[3],
+        )
+        resolver = JudgeResolver()
+        resolver.resolve(fake_conn, [])
+        assert resolver.resolve(fake_conn, ["Lord Justice Hamblen"]) == ["Hamblen"]
+        assert fake_cursor.execute.call_args_list[-1][0][1] == (0,)
+        assert resolver.judges == ["James", "Hamblen", "Terrence"]
+        assert resolver.last_judge_id == 3
+
+    def test_batch_keeps_order_and_falls_back(self):
+        fake_conn, _ = roster_conn([{"judge_id": 1, "judge_name": "James"}])
+        resolver = JudgeResolver()
+        assert resolver.resolve(fake_conn, ["Judge John", "Justice James", "Judge John"]) == [
+            "John", "James", "John"]
+
+    def test_inserted_judges_added_to_roster(self):
+        fake_conn, _ = roster_conn([], [], counts=[0])
+        resolver = JudgeResolver()
+        resolver.resolve(fake_conn, [])
+        resolver.add_judges({"Terrence": 5, "James": 4})
+        assert resolver.judges == ["James", "Terrence"]
+        assert resolver.resolve(fake_conn, ["Justice James"]) == ["James"]
+
+
+class TestJudgeIndex:
+    def test_soundex(self):
+        assert soundex("Smith") == soundex("Smyth") == "S530"
+        assert soundex("Pfister") == "P236"
+        assert soundex("123") == ""
+
+    def test_candidates_share_a_word_or_sound(self):
+        index = JudgeIndex(["James", "Terrence Smyth", "Terrence Bond", "Hamblen"])
+        assert index.get_candidates("John Smith") == ["Terrence Smyth"]
+        assert index.get_candidates("Terrence Bond") == ["Terrence Smyth", "Terrence Bond"]
+
+    def test_same_result_as_full_scan(self):
+        roster = ["James", "Terrence", "Peter Jackson", "Nicola Davies", "Jackson"]
+        index = JudgeIndex(roster)
+        for name in ["Justice James", "John", "Lord Justice Peter Jackson", "Judge Jackson"]:
+            assert index.match(name) == match_judge(name, roster)
+
+    def test_memo_cleared_when_roster_changes(self):
+        index = JudgeIndex(["James"])
+        assert index.match("Justice Terrence") == "Justice Terrence"
+        index.add(["Terrence"])
+        assert index.match("Justice Terrence") == "Terrence"
+
+
+class TestMatchJudges:
+    def test_same_results_as_match_judge(self):
+        roster = ["James", "Terrence", "Peter Jackson", "Jackson", "Nicola Davies"]
+        names = ["Justice James", "John", "Judge John", "Lord Justice Peter Jackson",
+                 "Judge Jackson", "Dame Nicola Davies"]
+        assert match_judges(names, roster) == [match_judge(name, roster) for name in names]
+
+    def test_ties_take_first_in_roster(self):
+        assert match_judges(["Justice James"], ["James", "James Smith"]) == ["James"]
+
+    def test_empty_roster_and_names(self):
+        assert match_judges(["Judge John"], []) == ["John"]
+        assert match_judges([], ["James"]) == []
+
+    def test_index_batch_matches_like_single(self):
+        roster = ["James", "Terrence Smyth", "Peter Jackson", "Jackson"]
+        names = ["Justice James", "Judge Smith", "Lord Justice Peter Jackson", "Justice James"]
+        index = JudgeIndex(roster)
+        assert index.match_all(names) == [JudgeIndex(roster).match(name) for name in names]
+
+    @patch("judge_matching.match_judges", side_effect=match_judges)
+    def test_index_batch_uses_cdist_when_cheaper(self, mock_match_judges):
+        index = JudgeIndex(["James", "Terrence", "Jackson"])
+        with patch("judge_matching.CDIST_WORKERS", 1):
+            index.match_all(["Justice James", "Judge Terrence"])
+        mock_match_judges.assert_not_called()
+        with patch("judge_matching.CDIST_WORKERS", 8):
+            index.match_all(["Justice Jackson", "Judge Jackson"])
+        mock_match_judges.assert_called_once()
@@ -4,8 +4,9 @@ import unittest
 from datetime import datetime
 from unittest.mock import MagicMock, patch
 from psycopg2.extensions import connection
-from load import synonym_extractor, replace_synonyms, return_single_ids, return_multiple_ids
-from load import get_verdict_mapping, get_court_mapping, get_tag_mapping, get_judge_mapping, get_law_firm_mapping, get_lawyer_mapping, get_participant_mapping
+from load import replace_synonyms, return_single_ids, return_multiple_ids
+from tag_canonicalisation import synonym_extractor, TagCanonicaliser
+from load import get_verdict_mapping, get_unnamed_id, upsert_names, get_loaded_citations
 from load import add_judges, add_tags, add_law_firms, add_participants, add_courts, process_people_data, replace_data, insert_to_database
 from load import populate_court_case, populate_judge_assignment, populate_tag_assignment, populate_lawyer, populate_participant_assignment
 import nltk
@@ -13,6 +14,11 @@ import nltk
 
 nltk.download("wordnet")
 
+@pytest.fixture(autouse=True)
+def tag_canonicaliser():
+    with patch("load.get_tag_canonicaliser", return_value=TagCanonicaliser()):
+        yield
+
 @pytest.fixture
 def fake_conn():
     return MagicMock()
@@ -142,95 +148,106 @@ class TestGetMapping:
         assert get_verdict_mapping(fake_conn) == {'guilty':1}
         assert fake_cur.execute.call_count == 1
     
-    def test_court_mapping(self, fake_conn, fake_cur):
+    def test_unnamed_row_reused(self, fake_conn, fake_cur):
         fake_conn.cursor.return_value.__enter__.return_value = fake_cur
-        fake_cur.fetchall.return_value = [{'court_name':'high court', 'court_id':1}]
-        assert get_court_mapping(fake_conn) == {'high court':1}
+        fake_cur.fetchone.return_value = {'participant_id': 4}
+        assert get_unnamed_id(fake_conn, 'participant', 'participant_name', 'participant_id') == 4
         assert fake_cur.execute.call_count == 1
 
-    def test_judge_mapping(self, fake_conn, fake_cur):
-        fake_conn.cursor.return_value.__enter__.return_value = fake_cur
-        fake_cur.fetchall.return_value = [{'judge_name':'John Doe', 'judge_id':1}]
-        assert get_judge_mapping(fake_conn) == {'John Doe':1}
-        assert fake_cur.execute.call_count == 1
-    
-    def test_tag_mapping(self, fake_conn, fake_cur):
+    def test_unnamed_row_added(self, fake_conn, fake_cur):
         fake_conn.cursor.return_value.__enter__.return_value = fake_cur
-        fake_cur.fetchall.return_value = [{'tag_name':'breach', 'tag_id':1}]
-        assert get_tag_mapping(fake_conn) == {'breach':1}
-        assert fake_cur.execute.call_count == 1
+        fake_cur.fetchone.side_effect = [None, {'participant_id': 5}]
+        assert get_unnamed_id(fake_conn, 'participant', 'participant_name', 'participant_id') == 5
+        assert 'INSERT INTO participant' in fake_cur.execute.call_args[0][0]
+
+
+class TestUpsertNames:
 
-    def test_law_firm_mapping(self, fake_conn, fake_cur):
+    @patch("load.execute_values")
+    def test_ids_of_new_and_existing_names(self, mock_execute_values, fake_conn, fake_cur):
         fake_conn.cursor.return_value.__enter__.return_value = fake_cur
-        fake_cur.fetchall.return_value = [{'law_firm_name':'Solicitors XYZ', 'law_firm_id':1}]
-        assert get_law_firm_mapping(fake_conn) == {'Solicitors XYZ':1}
-        assert fake_cur.execute.call_count == 1
-    
-    def test_lawyer_mapping(self, fake_conn, fake_cur):
+        mock_execute_values.return_value = [{'tag_name': 'Fraud', 'tag_id': 2}]
+        fake_cur.fetchall.return_value = [{'tag_name': 'Appeal', 'tag_id': 1}]
+        ids = upsert_names(fake_conn, 'tag', 'tag_name', 'tag_id', ['Fraud', 'Appeal', 'Fraud'])
+        assert ids == {'Appeal': 1, 'Fraud': 2}
+        assert mock_execute_values.call_args[0][2] == [('Appeal',), ('Fraud',)]
+        assert fake_cur.execute.call_args[0][1] == (['Appeal'],)
+
+    @patch("load.execute_values")
+    def test_only_new_names_no_select(self, mock_execute_values, fake_conn, fake_cur):
         fake_conn.cursor.return_value.__enter__.return_value = fake_cur
-        fake_cur.fetchall.return_value = [{'lawyer_name':'Jane Smith', 'lawyer_id':1}]
-        assert get_lawyer_mapping(fake_conn) == {'Jane Smith':1}
-        assert fake_cur.execute.call_count == 1
+        mock_execute_values.return_value = [{'court_name': 'Court', 'court_id': 1}]
+        assert upsert_names(fake_conn, 'court', 'court_name', 'court_id', ['Court']) == {'Court': 1}
+        fake_cur.execute.assert_not_called()
 
-    def test_lawyer_mapping(self, fake_conn, fake_cur):
+    @patch("load.get_unnamed_id", return_value=9)
+    @patch("load.execute_values")
+    def test_unknown_names(self, mock_execute_values, mock_unnamed, fake_conn):
+        assert upsert_names(fake_conn, 'participant', 'participant_name', 'participant_id',
+                            [None], nullable=True) == {None: 9}
+        mock_execute_values.assert_not_called()
+        assert upsert_names(fake_conn, 'tag', 'tag_name', 'tag_id', [None]) == {}
+
+
+
+class TestLoadedCitations:
+
+    def test_one_query_for_page(self, fake_conn, fake_cur):
         fake_conn.cursor.return_value.__enter__.return_value = fake_cur
-        fake_cur.fetchall.return_value = [{'participant_name':'Sigma Labs', 'participant_id':1}]
-        assert get_participant_mapping(fake_conn) == {'Sigma Labs':1}
-        assert fake_cur.execute.call_count == 1
+        fake_cur.fetchall.return_value = [{'court_case_id': '[2020] A 1'}]
+        loaded = get_loaded_citations(fake_conn, ['[2020] A 2', '[2020] A 1', None, '[2020] A 1'])
+        assert loaded == {'[2020] A 1'}
+        fake_cur.execute.assert_called_once()
+        assert fake_cur.execute.call_args[0][1] == (['[2020] A 1', '[2020] A 2'],)
 
+    def test_no_citations_no_query(self, fake_conn):
+        assert get_loaded_citations(fake_conn, [None]) == set()
+        fake_conn.cursor.assert_not_called()
 
-class TestInsertions(unittest.TestCase):
+    def test_empty_page_not_inserted(self, fake_conn):
+        assert insert_to_database(fake_conn, {'case_ids': []}) == "no cases to upload"
+        fake_conn.cursor.assert_not_called()
 
-    @patch("load.execute_values")
-    def test_adding_judges(self, mock_execute_values):
-        mock_conn = MagicMock(spec=connection)
-        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
-        judge_list = [("Judge1",), ("Judge2",), ("Judge3",)]
-        result = add_judges(mock_conn, judge_list)
-        query = """INSERT INTO judge(judge_name) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, judge_list)
-        mock_conn.commit.assert_called_once()
-        assert len(result) == len(judge_list)
 
-    @patch("load.execute_values")
-    def test_adding_tags(self, mock_execute_values):
-        mock_conn = MagicMock(spec=connection)
-        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
-        tags_list = [("Tag1",), ("Tag2",), ("Tag3",)]
-        add_tags(mock_conn, tags_list)
-        query = """INSERT INTO tag(tag_name) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, tags_list)
-        mock_conn.commit.assert_called_once()
-    
-    @patch("load.execute_values")
-    def test_adding_law_firms(self, mock_execute_values):
-        mock_conn = MagicMock(spec=connection)
-        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
-        firms_list = [("Firm1",), ("Firm2",), ("Firm3",)]
-        add_law_firms(mock_conn, firms_list)
-        query = """INSERT INTO law_firm(law_firm_name) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, firms_list)
-        mock_conn.commit.assert_called_once()
+ONE_CASE = {
+    "verdicts": ["Dismissed"], "courts": ["Court of Appeal"], "case_ids": ["[2009] EWCA Civ 309"],
+    "summ": ["Summary"], "title": ["A v B"], "date": [datetime(2009, 4, 7).date()],
+    "number": ["A2/2008/2870"], "url": ["https://caselaw.nationalarchives.gov.uk/ewca/civ/2009/309"],
+    "v_sum": ["Dismissed"], "judges": [("Lord Justice James",)], "tags": [()],
+    "people": [(("A", ("Counsel", "Firm")), ("B", ("Other Counsel", "Other Firm")))],
+}
 
-    @patch("load.execute_values")
-    def test_adding_participants(self, mock_execute_values):
-        mock_conn = MagicMock(spec=connection)
-        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
-        participants_list = [("Participant1",), ("Participant2",), ("Participant3",)]
-        add_participants(mock_conn, participants_list)
-        query = """INSERT INTO participant(participant_name) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, participants_list)
-        mock_conn.commit.assert_called_once()
 
-    @patch("load.execute_values")
-    def test_adding_courts(self, mock_execute_values):
+class TestInsertions(unittest.TestCase):
+
+    @patch("load.upsert_names", return_value={"Judge One": 1, "Two": 2})
+    def test_adding_judges(self, mock_upsert_names):
         mock_conn = MagicMock(spec=connection)
-        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
-        courts_list = [("Court1",), ("Court2",), ("Court3",)]
-        add_courts(mock_conn, courts_list)
-        query = """INSERT INTO court(court_name) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, courts_list)
-        mock_conn.commit.assert_called_once()
+        resolver = MagicMock()
+        resolver.resolve.return_value = ["Judge One", "Two", "Judge One"]
+        judge_list = [("Judge One",), ("Judge Two",), ("Judge One",)]
+        result, judge_map = add_judges(mock_conn, judge_list, resolver)
+        resolver.resolve.assert_called_once_with(mock_conn, ["Judge One", "Judge Two", "Judge One"])
+        assert result == [("Judge One",), ("Two",), ("Judge One",)]
+        assert judge_map == {"Judge One": 1, "Two": 2}
+        resolver.add_judges.assert_not_called()
+        mock_conn.commit.assert_not_called()
+
+    @patch("load.upsert_names")
+    def test_adding_dimensions(self, mock_upsert_names):
+        mock_conn = MagicMock(spec=connection)
+        add_tags(mock_conn, ["Tag1"])
+        mock_upsert_names.assert_called_with(mock_conn, "tag", "tag_name", "tag_id", ["Tag1"])
+        add_courts(mock_conn, ["Court1"])
+        mock_upsert_names.assert_called_with(mock_conn, "court", "court_name", "court_id", ["Court1"])
+        add_law_firms(mock_conn, ["Firm1"])
+        mock_upsert_names.assert_called_with(
+            mock_conn, "law_firm", "law_firm_name", "law_firm_id", ["Firm1"], nullable=True)
+        add_participants(mock_conn, ["Participant1"])
+        mock_upsert_names.assert_called_with(
+            mock_conn, "participant", "participant_name", "participant_id", ["Participant1"],
+            nullable=True)
+        mock_conn.commit.assert_not_called()
 
     @patch("load.execute_values")
     def test_populating_court_cases(self, mock_execute_values):
@@ -251,53 +268,46 @@ class TestInsertions(unittest.TestCase):
         to_insert = (a,b,c,d,e,f,g,h,i)
         populate_court_case(mock_conn,*to_insert)
         query = """INSERT INTO court_case(court_case_id, summary, verdict_id, title, court_date, case_number, case_url, court_id, verdict_summary) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, matched)
-        mock_conn.commit.assert_called_once()
+        mock_execute_values.assert_called_once_with(mock_cursor, query, matched, page_size=1)
+        mock_conn.commit.assert_not_called()
 
     @patch("load.execute_values")
     def test_populate_judge_assignment(self, mock_execute_values):
         mock_conn = MagicMock(spec=connection)
         mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
-        a = '[2003]'
-        b = (1,)
-        matched = []
-        for item in b:
-            matched.append((a, item))
-        to_insert = (a,b)
-        populate_judge_assignment(mock_conn,*to_insert)
+        populate_judge_assignment(mock_conn, ['[2003]', '[2004]'], ((1, 2), (1,)))
         query = """INSERT INTO judge_assignment(court_case_id, judge_id) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, matched)
-        mock_conn.commit.assert_called_once()
-    
+        mock_execute_values.assert_called_once_with(
+            mock_cursor, query, [('[2003]', 1), ('[2003]', 2), ('[2004]', 1)], page_size=3)
+        mock_conn.commit.assert_not_called()
+
     @patch("load.execute_values")
     def test_populate_tag_assignment(self, mock_execute_values):
         mock_conn = MagicMock(spec=connection)
         mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
-        a = 1
-        b = (1,)
-        matched = []
-        for item in b:
-            matched.append((a, item))
-        to_insert = (a,b)
-        populate_tag_assignment(mock_conn,*to_insert)
+        populate_tag_assignment(mock_conn, ['[2003]', '[2004]'], ((1, 1), (2,)))
         query = """INSERT INTO tag_assignment(court_case_id, tag_id) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, matched)
-        mock_conn.commit.assert_called_once()
+        mock_execute_values.assert_called_once_with(
+            mock_cursor, query, [('[2003]', 1), ('[2004]', 2)], page_size=2)
 
     @patch("load.execute_values")
-    def test_populate_lawyer_assignment(self, mock_execute_values):
+    def test_empty_assignment_not_sent(self, mock_execute_values):
+        populate_tag_assignment(MagicMock(spec=connection), ['[2003]'], ((),))
+        mock_execute_values.assert_not_called()
+
+    @patch("load.execute_values")
+    def test_populate_lawyer(self, mock_execute_values):
         mock_conn = MagicMock(spec=connection)
         mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
-        a = ['John Smith']
-        b = [1]
-        matched = []
-        for i, value in enumerate(a):
-            matched.append((value, b[i]))
-        to_insert = (a,b)
-        populate_lawyer(mock_conn,*to_insert)
-        query = """INSERT INTO lawyer(lawyer_name, law_firm_id) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, matched)
-        mock_conn.commit.assert_called_once()
+        mock_execute_values.side_effect = [
+            [{'lawyer_name': 'John Smith', 'law_firm_id': 1, 'lawyer_id': 7}],
+            [{'law_firm_id': 2, 'lawyer_id': 8}],
+        ]
+        mock_cursor.fetchall.return_value = []
+        ids = populate_lawyer(mock_conn, ['John Smith', None, 'John Smith'], [1, 2, 1])
+        assert ids == {('John Smith', 1): 7, (None, 2): 8}
+        assert mock_execute_values.call_args_list[0][0][2] == [('John Smith', 1)]
+        assert mock_execute_values.call_args_list[1][1]['template'] == '(NULL, %s)'
 
     @patch("load.execute_values")
     def test_populate_participant_assignment(self, mock_execute_values):
@@ -311,8 +321,8 @@ class TestInsertions(unittest.TestCase):
                     matched.append(person)
         populate_participant_assignment(mock_conn,a)
         query = """INSERT INTO participant_assignment(court_case_id, participant_id, lawyer_id, is_defendant) VALUES %s ON CONFLICT DO NOTHING;"""
-        mock_execute_values.assert_called_once_with(mock_cursor, query, matched)
-        mock_conn.commit.assert_called_once()
+        mock_execute_values.assert_called_once_with(mock_cursor, query, matched, page_size=len(matched))
+        mock_conn.commit.assert_not_called()
 
     @patch("load.execute_values")
     def test_all_data_insertion(self, mock_execute_values):
@@ -342,6 +352,28 @@ class TestInsertions(unittest.TestCase):
         ]}
         result = insert_to_database(mock_conn, example_data)
         assert result == "all files have been uploaded successfully"
+        mock_conn.__enter__.assert_called_once()
+        mock_conn.__exit__.assert_called_once()
+
+    @patch("load.execute_values")
+    @patch("load.add_judges", return_value=([("James",)], {"James": 1}))
+    @patch("load.judge_resolver")
+    def test_judges_added_to_resolver_after_commit(self, mock_resolver, *mocks):
+        mock_conn = MagicMock(spec=connection)
+        mock_conn.__exit__.side_effect = lambda *args: mock_resolver.add_judges.assert_not_called()
+        insert_to_database(mock_conn, ONE_CASE)
+        mock_resolver.add_judges.assert_called_once_with({"James": 1})
+
+    @patch("load.execute_values")
+    @patch("load.populate_tag_assignment", side_effect=ValueError)
+    @patch("load.add_judges", return_value=([("James",)], {"James": 1}))
+    @patch("load.judge_resolver")
+    def test_judges_not_added_on_rollback(self, mock_resolver, *mocks):
+        mock_conn = MagicMock(spec=connection)
+        mock_conn.__exit__.return_value = False
+        with pytest.raises(ValueError):
+            insert_to_database(mock_conn, ONE_CASE)
+        mock_resolver.add_judges.assert_not_called()
 
 
 class TestDataProcessing:
@@ -0,0 +1,25 @@
+"Script that will test the functioning of the name_normalisation script"
+from name_normalisation import standardise_name, standardise_names
+
+
+class TestStandardiseName:
+
+    def test_titles_removed(self):
+        assert standardise_name("His Honour Judge Bond") == "Bond"
+
+    def test_words_not_starting_with_letter_removed(self):
+        assert standardise_name("District Judge (MC) Jane Smith 2") == "Jane Smith"
+
+    def test_repeated_spaces_ignored(self):
+        assert standardise_name("Judge  Bond") == "Bond"
+
+    def test_only_titles(self):
+        assert standardise_name("Deputy District Judge") == ""
+
+    def test_repeat_names_cached(self):
+        standardise_name.cache_clear()
+        standardise_names(["Judge Bond", "Judge Bond", "Master Jones"])
+        assert standardise_name.cache_info().hits == 1
+
+    def test_bulk_keeps_order(self):
+        assert standardise_names(["Master Jones", "Judge Bond"]) == ["Jones", "Bond"]
@@ -0,0 +1,38 @@
+"Script that will test the functioning of the openai_client script"
+from unittest.mock import MagicMock, patch
+import openai_client
+from openai_client import create_openai_client, get_openai_client, set_openai_client, reset_openai_client
+
+
+class TestOpenAIClient:
+
+    def test_client_is_shared(self):
+        reset_openai_client()
+        with patch("openai_client.create_openai_client") as mock_create:
+            assert get_openai_client() is get_openai_client()
+            mock_create.assert_called_once()
+        reset_openai_client()
+
+    def test_fake_client_injected(self):
+        fake = MagicMock()
+        set_openai_client(fake)
+        assert get_openai_client() is fake
+        reset_openai_client()
+        fake.close.assert_called_once()
+
+    @patch("openai_client.DefaultHttpxClient")
+    @patch("openai_client.OpenAI")
+    def test_client_pool_and_timeouts(self, MockOpenAI, MockHttpxClient):
+        create_openai_client(timeout=30, max_connections=7)
+        limits = MockHttpxClient.call_args.kwargs["limits"]
+        assert limits.max_connections == 7
+        assert limits.max_keepalive_connections == 7
+        assert MockHttpxClient.call_args.kwargs["timeout"].read == 30
+        assert MockOpenAI.call_args.kwargs["http_client"] is MockHttpxClient.return_value
+        assert MockOpenAI.call_args.kwargs["max_retries"] == 0
+
+    def test_real_client_created(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        client = create_openai_client()
+        assert client.api_key == "test-key"
+        client.close()
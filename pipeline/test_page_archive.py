@@ -0,0 +1,206 @@
+"Script that will test the functioning of the page_archive script"
+from unittest.mock import MagicMock, patch
+import pytest
+import requests
+from page_archive import PageArchive, PageNotArchived, fetch, fetch_stream
+
+URL = "https://caselaw.nationalarchives.gov.uk/ewhc/ch/2003/13"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return PageArchive(str(tmp_path))
+
+
+def make_response(status_code=200, content=b"<article>Judgment</article>", headers=None):
+    return MagicMock(status_code=status_code, content=content, headers=headers or {})
+
+
+def make_streamed_response(status_code=200, chunks=(b"<article>", b"Judgment</article>"), headers=None):
+    response = MagicMock(status_code=status_code, headers=headers or {}, url=URL)
+    response.iter_content.return_value = iter(chunks)
+    return response
+
+
+def failing_chunks():
+    yield b"<article>"
+    raise requests.ConnectionError("Connection reset")
+
+
+class TestPageArchive:
+
+    def test_read_written_page(self, archive):
+        archive.write(URL, b"<article>Judgment</article>", '"abc"', "Mon, 03 Feb 2003 00:00:00 GMT")
+        assert archive.read(URL) == b"<article>Judgment</article>"
+
+    def test_unknown_url(self, archive):
+        assert archive.read(URL) is None
+        assert archive.get_conditional_headers(URL) == {}
+
+    def test_compressed_and_stored_once(self, archive):
+        content = b"<p>The same paragraph again.</p>" * 1000
+        first = archive.write(URL, content)
+        second = archive.write(URL + "/data.html", content)
+        assert first == second
+        objects = list(archive.objects_dir.rglob("*.z"))
+        assert len(objects) == 1
+        assert objects[0].stat().st_size < len(content) / 10
+
+    def test_conditional_headers(self, archive):
+        archive.write(URL, b"page", '"abc"', "Mon, 03 Feb 2003 00:00:00 GMT")
+        assert archive.get_conditional_headers(URL) == {
+            "If-None-Match": '"abc"', "If-Modified-Since": "Mon, 03 Feb 2003 00:00:00 GMT"}
+
+    def test_archived_urls(self, archive):
+        archive.write(URL + "/2", b"second")
+        archive.write(URL, b"first")
+        assert archive.get_urls() == [URL, URL + "/2"]
+
+    def test_replaced_object_removed(self, archive):
+        old_digest = archive.write(URL, b"first version")
+        archive.write(URL, b"second version")
+        assert not archive.get_object_path(old_digest).exists()
+        assert archive.read(URL) == b"second version"
+        assert len(list(archive.objects_dir.rglob("*.z"))) == 1
+
+    def test_replaced_object_kept_while_referenced(self, archive):
+        old_digest = archive.write(URL, b"same page")
+        archive.write(URL + "/data.html", b"same page")
+        archive.write(URL, b"new page")
+        assert archive.read(URL + "/data.html") == b"same page"
+        assert archive.get_object_path(old_digest).exists()
+
+    def test_lost_object_reads_as_missing(self, archive):
+        digest = archive.write(URL, b"page")
+        archive.get_object_path(digest).unlink()
+        assert archive.read(URL) is None
+
+
+class TestFetch:
+
+    @patch("page_archive.http_client.get")
+    def test_without_archive_downloads(self, mock_get):
+        mock_get.return_value = make_response()
+        with patch("page_archive.PAGE_ARCHIVE_DIR", None):
+            assert fetch(URL, 30) == b"<article>Judgment</article>"
+        mock_get.assert_called_once_with(URL, timeout=30)
+
+    @patch("page_archive.http_client.get")
+    def test_new_page_archived(self, mock_get, archive):
+        mock_get.return_value = make_response(headers={"ETag": '"v1"'})
+        assert fetch(URL, 30, archive) == b"<article>Judgment</article>"
+        mock_get.assert_called_once_with(URL, timeout=30, headers={})
+        assert archive.get_conditional_headers(URL) == {"If-None-Match": '"v1"'}
+
+    @patch("page_archive.http_client.get")
+    def test_unchanged_page_read_from_archive(self, mock_get, archive):
+        archive.write(URL, b"archived", '"v1"')
+        mock_get.return_value = make_response(304, b"")
+        assert fetch(URL, 30, archive) == b"archived"
+        mock_get.assert_called_once_with(URL, timeout=30, headers={"If-None-Match": '"v1"'})
+
+    @patch("page_archive.http_client.get")
+    def test_changed_page_replaced(self, mock_get, archive):
+        archive.write(URL, b"old", '"v1"')
+        mock_get.return_value = make_response(200, b"new", {"ETag": '"v2"'})
+        assert fetch(URL, 30, archive) == b"new"
+        assert archive.read(URL) == b"new"
+
+    @patch("page_archive.http_client.get")
+    def test_error_page_not_archived(self, mock_get, archive):
+        mock_get.return_value = make_response(404, b"Not found")
+        assert fetch(URL, 30, archive) == b"Not found"
+        assert archive.read(URL) is None
+
+    @patch("page_archive.http_client.get")
+    def test_offline_never_downloads(self, mock_get, archive):
+        archive.write(URL, b"archived")
+        assert fetch(URL, 30, archive, offline=True) == b"archived"
+        with pytest.raises(PageNotArchived):
+            fetch(URL + "/other", 30, archive, offline=True)
+        mock_get.assert_not_called()
+
+
+class TestFetchStream:
+
+    @patch("page_archive.http_client.get")
+    def test_without_archive_streams(self, mock_get):
+        response = make_streamed_response()
+        mock_get.return_value = response
+        with patch("page_archive.PAGE_ARCHIVE_DIR", None):
+            assert b"".join(fetch_stream(URL, 30)) == b"<article>Judgment</article>"
+        mock_get.assert_called_once_with(URL, timeout=30, stream=True)
+        response.close.assert_called_once()
+
+    @patch("page_archive.http_client.get")
+    def test_new_page_archived(self, mock_get, archive):
+        mock_get.return_value = make_streamed_response(headers={"ETag": '"v1"'})
+        assert b"".join(fetch_stream(URL, 30, archive)) == b"<article>Judgment</article>"
+        assert archive.read(URL) == b"<article>Judgment</article>"
+        assert archive.get_conditional_headers(URL) == {"If-None-Match": '"v1"'}
+
+    @patch("page_archive.http_client.get")
+    def test_unchanged_page_streamed_from_archive(self, mock_get, archive):
+        archive.write(URL, b"archived" * 100000, '"v1"')
+        mock_get.return_value = make_streamed_response(304, [])
+        chunks = list(fetch_stream(URL, 30, archive))
+        assert b"".join(chunks) == b"archived" * 100000
+        assert len(chunks) > 1
+
+    @patch("page_archive.http_client.get")
+    def test_page_archived_when_reader_stops_early(self, mock_get, archive):
+        mock_get.return_value = make_streamed_response(chunks=[b"<article>", b"text</article>", b"rest"])
+        stream = fetch_stream(URL, 30, archive)
+        assert next(stream) == b"<article>"
+        stream.close()
+        assert archive.read(URL) == b"<article>text</article>rest"
+
+    @patch("page_archive.http_client.get")
+    def test_page_not_archived_when_download_fails(self, mock_get, archive):
+        response = make_streamed_response()
+        response.iter_content.return_value = failing_chunks()
+        mock_get.return_value = response
+        stream = fetch_stream(URL, 30, archive)
+        assert next(stream) == b"<article>"
+        with pytest.raises(requests.ConnectionError):
+            next(stream)
+        assert archive.read(URL) is None
+        assert not list(archive.objects_dir.rglob("*.tmp"))
+        response.close.assert_called_once()
+
+    @patch("page_archive.http_client.get")
+    def test_page_not_archived_when_rest_fails(self, mock_get, archive):
+        response = make_streamed_response()
+        response.iter_content.return_value = failing_chunks()
+        mock_get.return_value = response
+        stream = fetch_stream(URL, 30, archive)
+        assert next(stream) == b"<article>"
+        stream.close()
+        assert archive.read(URL) is None
+        assert not list(archive.objects_dir.rglob("*.tmp"))
+
+    @patch("page_archive.http_client.get")
+    def test_response_closed_when_writer_fails(self, mock_get, archive):
+        response = make_streamed_response()
+        mock_get.return_value = response
+        with patch.object(archive, "open_writer", side_effect=OSError("No space left on device")):
+            with pytest.raises(OSError):
+                list(fetch_stream(URL, 30, archive))
+        response.close.assert_called_once()
+
+    @patch("page_archive.http_client.get")
+    def test_page_over_limit_cut_and_not_archived(self, mock_get, archive):
+        response = make_streamed_response(chunks=[b"12345", b"67890", b"12345"])
+        mock_get.return_value = response
+        assert b"".join(fetch_stream(URL, 30, archive, max_bytes=10)) == b"1234567890"
+        assert archive.read(URL) is None
+        assert not list(archive.objects_dir.rglob("*.tmp"))
+        response.close.assert_called_once()
+
+    @patch("page_archive.http_client.get")
+    def test_offline_never_downloads(self, mock_get, archive):
+        archive.write(URL, b"archived")
+        assert b"".join(fetch_stream(URL, 30, archive, offline=True)) == b"archived"
+        with pytest.raises(PageNotArchived):
+            list(fetch_stream(URL + "/other", 30, archive, offline=True))
+        mock_get.assert_not_called()
@@ -0,0 +1,104 @@
+"Script that will test the functioning of the rate_limiter script"
+import pytest
+from rate_limiter import TokenBucket, RateLimiter, serve_rate_limiters, connect_rate_limiters
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestTokenBucket:
+
+    def test_starts_full(self, clock):
+        bucket = TokenBucket(60, clock)
+        assert bucket.wait_time(60) == 0
+
+    def test_wait_time_when_empty(self, clock):
+        bucket = TokenBucket(60, clock)
+        bucket.take(60)
+        assert bucket.wait_time(1) == pytest.approx(1)
+
+    def test_refills_over_time(self, clock):
+        bucket = TokenBucket(60, clock)
+        bucket.take(60)
+        clock.sleep(30)
+        assert bucket.wait_time(30) == 0
+
+    def test_never_above_capacity(self, clock):
+        bucket = TokenBucket(60, clock)
+        clock.sleep(600)
+        bucket.refill()
+        assert bucket.available == 60
+
+    def test_amount_larger_than_capacity_is_clamped(self, clock):
+        bucket = TokenBucket(60, clock)
+        assert bucket.wait_time(1000) == 0
+
+    def test_give_back(self, clock):
+        bucket = TokenBucket(60, clock)
+        bucket.take(50)
+        bucket.give_back(20)
+        assert bucket.available == 30
+
+
+class TestRateLimiter:
+
+    def test_requests_per_minute(self, clock):
+        limiter = RateLimiter(2, 1_000_000, clock, clock.sleep)
+        for _ in range(4):
+            limiter.acquire(1)
+        # two requests straight away then one every 30 seconds
+        assert clock.now == pytest.approx(60)
+
+    def test_tokens_per_minute(self, clock):
+        limiter = RateLimiter(1000, 10000, clock, clock.sleep)
+        limiter.acquire(10000)
+        limiter.acquire(5000)
+        assert clock.now == pytest.approx(30)
+
+    def test_usage_higher_than_estimate_slows_down(self, clock):
+        limiter = RateLimiter(1000, 10000, clock, clock.sleep)
+        limiter.acquire(5000)
+        limiter.record_usage(5000, 10000)
+        limiter.acquire(5000)
+        assert clock.now == pytest.approx(30)
+
+    def test_usage_lower_than_estimate_gives_back(self, clock):
+        limiter = RateLimiter(1000, 10000, clock, clock.sleep)
+        limiter.acquire(10000)
+        limiter.record_usage(10000, 5000)
+        limiter.acquire(5000)
+        assert clock.now == 0
+
+
+class TestSharedRateLimiters:
+
+    def test_processes_share_one_limiter(self):
+        manager = serve_rate_limiters()
+        try:
+            first = connect_rate_limiters(manager.address).get_limiter("gpt")
+            second = connect_rate_limiters(manager.address).get_limiter("gpt")
+            first.acquire(10)
+            second.record_usage(10, 5)
+            assert first._id == second._id
+        finally:
+            manager.shutdown()
+
+    def test_limiters_by_name(self):
+        manager = serve_rate_limiters()
+        try:
+            assert manager.get_limiter("gpt")._id != manager.get_limiter("archive")._id
+        finally:
+            manager.shutdown()
@@ -0,0 +1,67 @@
+"Script that will test the functioning of the stages script"
+import time
+from threading import Lock
+import pytest
+from stages import run_stages
+
+
+class TestRunStages:
+
+    def test_results_in_order(self):
+        result = list(run_stages(range(10), [lambda x: x + 1, lambda x: x * 2]))
+        assert result == [(x + 1) * 2 for x in range(10)]
+
+    def test_no_steps(self):
+        assert list(run_stages([1, 2, 3], [])) == [1, 2, 3]
+
+    def test_empty_source(self):
+        assert list(run_stages([], [lambda x: x])) == []
+
+    def test_stages_overlap(self):
+        def slow(x):
+            time.sleep(0.05)
+            return x
+        start = time.perf_counter()
+        list(run_stages(range(6), [slow, slow, slow]))
+        # 18 steps of 0.05s in a row would take 0.9s, overlapping stages take about 0.4s
+        assert time.perf_counter() - start < 0.7
+
+    def test_backpressure(self):
+        lock = Lock()
+        produced = []
+
+        def source():
+            for i in range(20):
+                with lock:
+                    produced.append(i)
+                yield i
+
+        results = run_stages(source(), [lambda x: x], queue_size=1)
+        next(results)
+        time.sleep(0.2)
+        with lock:
+            # the source can only run a few items ahead of the consumer
+            assert len(produced) <= 5
+        assert list(results) == list(range(1, 20))
+
+    def test_step_error_raised(self):
+        def failing(x):
+            if x == 3:
+                raise ValueError("bad page")
+            return x
+        results = run_stages(range(10), [failing, lambda x: x])
+        assert [next(results) for _ in range(3)] == [0, 1, 2]
+        with pytest.raises(ValueError):
+            next(results)
+
+    def test_source_error_raised(self):
+        def source():
+            yield 1
+            raise KeyError("broken source")
+        with pytest.raises(KeyError):
+            list(run_stages(source(), [lambda x: x]))
+
+    def test_consumer_stops_early(self):
+        results = run_stages(range(1000), [lambda x: x])
+        assert next(results) == 0
+        results.close()
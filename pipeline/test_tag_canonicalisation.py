@@ -0,0 +1,97 @@
+"Script that will test the functioning of the tag_canonicalisation script"
+import time
+from unittest.mock import MagicMock
+import pytest
+from tag_canonicalisation import TagCanonicaliser, TagDecisionCache
+
+SYNONYMS = {"Scarlet": {"Red"}, "Red": {"Scarlet"}, "Lawsuit": {"Suit", "Case"}}
+
+
+def fake_synonyms(tag):
+    return SYNONYMS.get(tag, set())
+
+
+@pytest.fixture
+def canonicaliser():
+    return TagCanonicaliser(synonyms=fake_synonyms)
+
+
+def fake_conn(rows, count=None):
+    conn = MagicMock()
+    conn.cursor.return_value.__enter__.return_value.fetchall.return_value = rows
+    conn.cursor.return_value.__enter__.return_value.fetchone.return_value = {"tags": count}
+    return conn
+
+
+class TestCanonicalise:
+
+    def test_later_synonym_kept(self, canonicaliser):
+        assert canonicaliser.canonicalise(["Scarlet", "Red"]) == ["Red", "Red"]
+
+    def test_near_duplicates_merged(self, canonicaliser):
+        assert canonicaliser.canonicalise(["Judicial review", "Judicial reviews"]) == [
+            "Judicial reviews", "Judicial reviews"]
+
+    def test_different_tags_kept(self, canonicaliser):
+        assert canonicaliser.canonicalise(["Able", "Unable", "Red", "Red"]) == [
+            "Able", "Unable", "Red", "Red"]
+
+    def test_non_strings_dropped(self, canonicaliser):
+        assert canonicaliser.canonicalise([3, False, "Red"]) == ["Red"]
+
+    def test_table_tags_preferred(self, canonicaliser):
+        canonicaliser.refresh(fake_conn([{"tag_id": 1, "tag_name": "Case"},
+                                         {"tag_id": 2, "tag_name": "Judicial review"}]))
+        assert canonicaliser.canonicalise(["Lawsuit", "Judicial reviews"]) == [
+            "Case", "Judicial review"]
+        assert canonicaliser.last_tag_id == 2
+
+    def test_refresh_reads_new_tags_only(self, canonicaliser):
+        canonicaliser.refresh(fake_conn([{"tag_id": 4, "tag_name": "Case"}]))
+        conn = fake_conn([], count=1)
+        canonicaliser.refresh(conn)
+        curs = conn.cursor.return_value.__enter__.return_value
+        assert [call[0][1] for call in curs.execute.call_args_list] == [(4,), (4,)]
+        assert canonicaliser.tags == ["Case"]
+
+    def test_tags_committed_out_of_order_reread(self, canonicaliser):
+        canonicaliser.refresh(fake_conn([{"tag_id": 4, "tag_name": "Case"}]))
+        conn = fake_conn([{"tag_id": 3, "tag_name": "Tort"}, {"tag_id": 4, "tag_name": "Case"}], 2)
+        canonicaliser.refresh(conn)
+        curs = conn.cursor.return_value.__enter__.return_value
+        assert curs.execute.call_args[0][1] == (0,)
+        assert canonicaliser.tags == ["Case", "Tort"]
+        assert canonicaliser.last_tag_id == 4
+
+    def test_decisions_reused(self):
+        synonyms = MagicMock(side_effect=fake_synonyms)
+        canonicaliser = TagCanonicaliser(synonyms=synonyms)
+        canonicaliser.canonicalise(["Scarlet", "Red"])
+        canonicaliser.canonicalise(["Scarlet", "Red", "Scarlet"])
+        assert synonyms.call_count == 2
+
+
+class TestDecisionCache:
+
+    def test_decisions_persisted(self, tmp_path):
+        cache_path = str(tmp_path / "tags.sqlite")
+        TagCanonicaliser(TagDecisionCache(cache_path), fake_synonyms).canonicalise(["Scarlet", "Red"])
+        synonyms = MagicMock(side_effect=fake_synonyms)
+        canonicaliser = TagCanonicaliser(TagDecisionCache(cache_path), synonyms)
+        assert canonicaliser.canonicalise(["Scarlet", "Crimson"]) == ["Red", "Crimson"]
+        assert synonyms.call_count == 1
+        assert canonicaliser.tags == ["Red", "Crimson"]
+
+
+class TestCanonicaliseBenchmark:
+    """Micro-benchmark of a page of tags against a large tag table, run with -s to see timings"""
+
+    def test_page_time(self, canonicaliser):
+        canonicaliser.refresh(fake_conn(
+            [{"tag_id": i, "tag_name": f"Known tag {i:05d}"} for i in range(1, 5001)]))
+        page = [f"Page tag {i}" for i in range(400)]
+        start = time.perf_counter()
+        canonicaliser.canonicalise(page)
+        seconds = time.perf_counter() - start
+        print(f"\n400 tags against 5000 known tags: {seconds * 1000:.1f} ms")
+        assert seconds < 1
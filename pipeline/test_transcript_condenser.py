@@ -0,0 +1,121 @@
+"Script that will test the functioning of the transcript_condenser script"
+import re
+import pytest
+from transcript_condenser import (
+    condense_transcript,
+    get_header_size,
+    score_body,
+    score_paragraph,
+    split_paragraphs,
+)
+
+HEADER = """Neutral Citation Number: [2024] EWHC 2177 (Admin)
+Case No: AC-2024-LON-001234
+IN THE HIGH COURT OF JUSTICE
+Before :
+THE HONOURABLE MR JUSTICE SMITH
+Between :
+JOHN DOE
+Claimant
+- and -
+SECRETARY OF STATE FOR THE HOME DEPARTMENT
+Defendant
+Jane Roe KC (instructed by Bindmans LLP) for the Claimant
+Hearing dates: 1 August 2024"""
+
+
+class WordEncoder:
+    """Tokenises on words so the budget can be tested without tiktoken data"""
+
+    def encode(self, text):
+        return re.findall(r"\s*\S+|\s+", text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+class CountingEncoder(WordEncoder):
+    """Counts the characters encoded"""
+
+    def __init__(self):
+        self.encoded_chars = 0
+
+    def encode(self, text):
+        self.encoded_chars += len(text)
+        return super().encode(text)
+
+
+def make_judgment(paragraphs, middle="Conclusion"):
+    body = [f"{i}.The tribunal heard evidence about the contract and the scheme " + "at length " * 30
+            for i in range(1, paragraphs)]
+    body.insert(paragraphs // 2, middle)
+    body.append(f"{paragraphs}.For these reasons the claim is dismissed with costs.")
+    return HEADER + "\n" + "\n".join(body)
+
+
+class TestCondenseTranscript:
+
+    def test_short_transcript_unchanged(self):
+        text = make_judgment(3)
+        assert condense_transcript(text, 10000, WordEncoder()) == text
+
+    @pytest.mark.parametrize("budget", [500, 1500, 4000])
+    def test_within_budget(self, budget):
+        condensed = condense_transcript(make_judgment(200), budget, WordEncoder())
+        assert len(WordEncoder().encode(condensed)) <= budget
+
+    def test_keeps_header_and_disposal(self):
+        condensed = condense_transcript(make_judgment(200), 800, WordEncoder())
+        assert condensed.startswith(HEADER)
+        assert condensed.endswith("200.For these reasons the claim is dismissed with costs.")
+        assert "Conclusion\n101.The tribunal" in condensed
+
+    def test_gaps_marked_once(self):
+        condensed = condense_transcript(make_judgment(200), 800, WordEncoder(), "[gap]")
+        lines = condensed.split("\n")
+        assert "[gap]" in lines
+        assert all(not (a == b == "[gap]") for a, b in zip(lines, lines[1:]))
+
+    def test_single_long_paragraph_cut_to_budget(self):
+        condensed = condense_transcript("word " * 10000, 3000, WordEncoder())
+        assert condensed.startswith("word word")
+        assert condensed.endswith("\n[...]")
+        assert 2900 <= len(WordEncoder().encode(condensed)) <= 3000
+
+    def test_long_paragraph_fills_rest_of_budget(self):
+        body = [f"{i}.The evidence " + "at length " * 1000 for i in range(1, 6)]
+        text = HEADER + "\n" + "\n".join(body)
+        condensed = condense_transcript(text, 3000, WordEncoder())
+        assert condensed.startswith(HEADER)
+        assert 2900 <= len(WordEncoder().encode(condensed)) <= 3000
+
+    def test_long_judgment_not_all_encoded(self):
+        text = make_judgment(5000)
+        encoder = CountingEncoder()
+        condensed = condense_transcript(text, 3000, encoder)
+        assert len(WordEncoder().encode(condensed)) <= 3000
+        assert condensed.endswith("5000.For these reasons the claim is dismissed with costs.")
+        assert encoder.encoded_chars < 50000 < len(text)
+
+    def test_unscored_paragraphs_taken_from_ends(self):
+        condensed = condense_transcript(make_judgment(200, "Midway"), 2000, WordEncoder())
+        assert "1.The tribunal" in condensed and "199.The tribunal" in condensed
+        assert "100.The tribunal" not in condensed
+
+
+class TestScoring:
+
+    def test_header_ends_at_first_numbered_paragraph(self):
+        paragraphs = split_paragraphs(make_judgment(5))
+        assert get_header_size(paragraphs) == len(HEADER.split("\n"))
+
+    def test_disposal_scores_higher(self):
+        assert score_paragraph("For these reasons the appeal is dismissed.") > score_paragraph(
+            "The tribunal heard evidence about the contract.")
+
+    def test_repeated_words_scored_up_to_limit(self):
+        assert score_paragraph("costs " * 3) == score_paragraph("costs " * 30)
+
+    def test_heading_scores_next_paragraph(self):
+        scores = score_body(["a", "b", "c", "d", "Conclusion", "e", "f", "g", "h", "i", "j", "k"])
+        assert scores[5] > scores[6]
@@ -1,4 +1,8 @@
 "Script that will test the functioning of the transform script"
+import json
+import os
+import re
+import time
 import pytest
 import unittest
 from unittest.mock import MagicMock, mock_open, patch
@@ -6,18 +10,27 @@ from datetime import date
 from extract import get_listing_data
 from transform import (
     shorten_text_by_tokens,
+    get_encoder,
     format_date,
-    convert_dict_to_tuple,
+    convert_participants_to_tuple,
     assemble_data,
     get_data,
+    get_all_data,
     get_summary,
-    is_valid_participant,
     validate_gpt_response,
+    get_gpt_reply,
+    build_user_message,
 )
+from gpt_cache import LocalCache, set_gpt_cache
 
 # --cov-report term-missing
 
 
+@pytest.fixture(autouse=True)
+def memory_gpt_cache():
+    set_gpt_cache(LocalCache(":memory:"))
+
+
 @pytest.fixture
 def example_data():
     test_url = "https://caselaw.nationalarchives.gov.uk/judgments/search?per_page=10&order=-date&query=&from_date_0=2&from_date_1=2&from_date_2=2003&to_date_0=3&to_date_1=2&to_date_2=2003&party=&judge=&page="
@@ -45,16 +58,18 @@ def example_dict():
 @pytest.fixture
 def example_gpt_dict():
     return {
-        "verdict": "My verdict",
+        "verdict": "Dismissed",
         "summary": "My summary",
         "case_number": "My case number",
         "verdict_summary": "My verdict summary",
         "judge": ["Judge A"],
         "tags": ["Tag A"],
-        "first_side": {"MICHAEL WILSON & PARTNERS LIMITED": {"David Holland QC": None}},
-        "second_side": {
-            "SOME OTHER WILSON & PARTNERS LIMITED": {"James Holland QC": None}
-        },
+        "first_side": [
+            {"name": "MICHAEL WILSON & PARTNERS LIMITED", "lawyer": "David Holland QC", "law_firm": None}
+        ],
+        "second_side": [
+            {"name": "SOME OTHER WILSON & PARTNERS LIMITED", "lawyer": "James Holland QC", "law_firm": None}
+        ],
     }
 
 
@@ -71,6 +86,116 @@ class TestShorterTranscript:
         assert len(shorten_text_by_tokens("")) == 0
 
 
+class FakeEncoder:
+    """Tokenises on words so the windowed truncation can be tested without tiktoken data"""
+
+    def __init__(self):
+        self.encoded_chars = 0
+
+    def encode(self, text):
+        self.encoded_chars += len(text)
+        return re.findall(r"\s*\S+|\s+", text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def make_judgment(paragraphs):
+    return "".join(
+        f"{i}. The appellant submits that the judge erred in law at paragraph {i * 7}; "
+        f"the respondent's counsel, instructed by Smith & Co LLP, disagrees.\n"
+        for i in range(paragraphs)
+    )
+
+
+class TestShortenTextWindows:
+
+    @pytest.fixture
+    def encoder(self):
+        encoder = FakeEncoder()
+        with patch("transform.get_encoder", return_value=encoder):
+            yield encoder
+
+    def test_long_text_matches_full_encoding(self, encoder):
+        text = make_judgment(20000)
+        tokens = encoder.encode(text)
+        expected = "".join(tokens[:4000]) + "[...]" + "".join(tokens[-4000:])
+        encoder.encoded_chars = 0
+        assert shorten_text_by_tokens(text) == expected
+        # only the two windows are tokenised, not the whole judgment
+        assert encoder.encoded_chars < len(text) / 10
+
+    def test_short_text_unchanged(self, encoder):
+        text = make_judgment(100)
+        assert shorten_text_by_tokens(text) == text
+
+    def test_just_over_limit_matches_full_encoding(self, encoder):
+        text = make_judgment(400)
+        tokens = encoder.encode(text)
+        assert len(tokens) > 8000
+        expected = "".join(tokens[:4000]) + "[...]" + "".join(tokens[-4000:])
+        assert shorten_text_by_tokens(text) == expected
+
+    def test_long_tokens_fall_back_to_full_encoding(self, encoder):
+        text = "x" * 100000
+        assert shorten_text_by_tokens(text, 10, 10) == text
+
+
+class TestUserMessage:
+
+    @pytest.fixture
+    def encoder(self):
+        with patch("transform.get_encoder", return_value=FakeEncoder()) as mock_get_encoder:
+            yield mock_get_encoder.return_value
+
+    @patch("transform.prompts.USER_MESSAGE", "User: ")
+    def test_truncated_without_budget(self, encoder):
+        text = make_judgment(400)
+        assert build_user_message(text, 0) == "User: " + shorten_text_by_tokens(text)
+
+    @patch("transform.prompts.USER_MESSAGE", "User: ")
+    def test_condensed_within_budget(self, encoder):
+        message = build_user_message(make_judgment(400), 2000)
+        assert message.startswith("User: 0. The appellant")
+        assert len(encoder.encode(message)) <= 2002
+
+
+class TestEncoderCache:
+
+    @patch("transform.tiktoken.encoding_for_model")
+    def test_encoder_loaded_once(self, mock_encoding_for_model):
+        get_encoder.cache_clear()
+        assert get_encoder() is get_encoder()
+        mock_encoding_for_model.assert_called_once_with("gpt-4o-mini")
+        get_encoder.cache_clear()
+
+
+@pytest.mark.skipif(
+    not os.getenv("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1, needs the tiktoken encoding"
+)
+class TestShortenTextBenchmark:
+    """Micro-benchmark of the truncation on large synthetic judgments with the real tokeniser,
+    run with RUN_BENCHMARKS=1 and -s to see timings"""
+
+    @pytest.mark.parametrize("paragraphs", [2000, 20000, 100000])
+    def test_per_transcript_time(self, paragraphs):
+        encoder = get_encoder()
+        text = make_judgment(paragraphs)
+
+        start = time.perf_counter()
+        shortened = shorten_text_by_tokens(text)
+        windowed_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tokens = encoder.encode(text)
+        expected = encoder.decode(tokens[:4000]) + "[...]" + encoder.decode(tokens[-4000:])
+        full_seconds = time.perf_counter() - start
+
+        print(f"\n{len(text) / 1e6:.1f} MB judgment: windowed {windowed_seconds * 1000:.1f} ms, "
+              f"full encoding {full_seconds * 1000:.1f} ms")
+        assert shortened == expected
+
+
 class TestDateFormat:
 
     def test_date_no_input(self):
@@ -86,32 +211,22 @@ class TestDateFormat:
         assert isinstance(format_date("5 Feb 2022, midnight"), date)
 
 
-class TestDictConversion:
-
-    def test_dict_converted_to_tuple(self, example_dict):
-        example_dict = {"first_side": example_dict, "second_side": example_dict}
-        assert isinstance(convert_dict_to_tuple(example_dict), tuple)
+class TestParticipantConversion:
 
-    def test_dict_converted_no_claimant(self, example_dict):
-        example_dict = {
-            "first_side": None,
-            "second_side": {
-                "MICHAEL WILSON & PARTNERS LIMITED": {"David Holland QC": None}
-            },
-        }
-        assert isinstance(convert_dict_to_tuple(example_dict), tuple)
+    def test_participants_converted_to_tuple(self, example_gpt_dict):
+        assert convert_participants_to_tuple(example_gpt_dict["first_side"]) == (
+            "MICHAEL WILSON & PARTNERS LIMITED", ("David Holland QC", None))
 
-
-class TestDataAssembling:
+    def test_several_participants(self):
+        participants = [
+            {"name": "A", "lawyer": "Lawyer A", "law_firm": "Firm A"},
+            {"name": "B", "lawyer": None, "law_firm": None},
+        ]
+        assert convert_participants_to_tuple(participants) == (
+            "A", ("Lawyer A", "Firm A"), "B", (None, None))
 
     def test_convert_when_missing_claimant(self):
-        example_dict = {
-            "first_side": None,
-            "second_side": {
-                "MICHAEL WILSON & PARTNERS LIMITED": {"David Holland QC": None}
-            },
-        }
-        assert isinstance(convert_dict_to_tuple(example_dict), tuple)
+        assert convert_participants_to_tuple(None) == ()
 
 
 class TestDataAssembling:
@@ -170,140 +285,135 @@ class TestAllData:
             assert result is None
 
 
-class TestParticipants:
+def completion(content):
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
 
-    def test_sample_participants(self):
-        test = {
-            "MICHAEL WILSON & PARTNERS LIMITED": {"David Holland QC": None},
-            "SOME OTHER WILSON & PARTNERS LIMITED": {"James Holland QC": None},
-        }
-        assert is_valid_participant(test) == True
 
-    def test_no_participant_no_crash(self):
-        test = {None: {"Lawyer name": None}}
-        assert is_valid_participant(test) == True
+class TestGPTReply:
 
-    def test_no_lawyer_no_crash(self):
-        test = {"BIOGAS PRODUCTS LIMITED": {None: None}}
-        assert is_valid_participant(test) == True
-
-    def test_side_name_not_valid_type(self):
-        test = {123: {"lawyer": "law_firm"}}
-        assert not is_valid_participant(test)
-
-    def test_lawyer_not_valid_type(self):
-        test = {"CLIENT": {123: "law_firm"}}
-        assert not is_valid_participant(test)
-
-    def test_law_firm_not_valid_type(self):
-        test = {"CLIENT": {"LAWYER": 123}}
-        assert not is_valid_participant(test)
+    @patch("transform.get_summary")
+    def test_unchanged_transcript_not_sent_twice(self, mock_get_summary, example_gpt_dict):
+        mock_get_summary.return_value = completion(json.dumps(example_gpt_dict))
+        cache = LocalCache(":memory:")
+        assert get_gpt_reply("User: text", cache) == example_gpt_dict
+        assert get_gpt_reply("User: text", cache) == example_gpt_dict
+        mock_get_summary.assert_called_once()
 
-    def test_missing_lawyer_value(self):
-        test = {"BIOGAS PRODUCTS LIMITED": {"Lawyer name"}}
-        assert is_valid_participant(test) == False
+    @patch("transform.get_summary")
+    def test_prompt_change_invalidates(self, mock_get_summary, example_gpt_dict):
+        mock_get_summary.return_value = completion(json.dumps(example_gpt_dict))
+        cache = LocalCache(":memory:")
+        get_gpt_reply("User: text", cache)
+        with patch("transform.prompts.SYSTEM_MESSAGE", "A new prompt"):
+            get_gpt_reply("User: text", cache)
+        assert mock_get_summary.call_count == 2
 
-    def test_missing_lawyer(self):
-        test = {"BIOGAS PRODUCTS LIMITED": "Lawyer name"}
-        assert is_valid_participant(test) == False
+    @patch("transform.get_summary")
+    def test_only_invalid_fields_asked_again(self, mock_get_summary, example_gpt_dict):
+        invalid = example_gpt_dict | {"summary": "", "tags": []}
+        mock_get_summary.side_effect = [
+            completion(json.dumps(invalid)),
+            completion(json.dumps({"summary": "Fixed summary", "tags": ["Fixed"]})),
+        ]
+        reply = get_gpt_reply("User: text", LocalCache(":memory:"))
+        assert reply == example_gpt_dict | {"summary": "Fixed summary", "tags": ["Fixed"]}
+        repair_format = mock_get_summary.call_args.kwargs["response_format"]
+        assert repair_format["json_schema"]["schema"]["required"] == ["summary", "tags"]
 
-    def test_missing_lawyer_and_participant(self):
-        test = {None: None}
-        assert is_valid_participant(test) == False
+    @patch("transform.get_summary")
+    def test_invalid_reply_not_cached(self, mock_get_summary):
+        mock_get_summary.return_value = completion("invalid: string dict}")
+        cache = LocalCache(":memory:")
+        assert get_gpt_reply("User: text", cache) == {}
+        get_gpt_reply("User: text", cache)
+        assert mock_get_summary.call_count == 4
 
 
 class TestGPTResponses:
 
     def test_valid_gpt_response(self, example_gpt_dict):
-        example_gpt_dict = {
-            "verdict": "My verdict",
-            "summary": "My summary",
-            "case_number": "My case number",
-            "verdict_summary": "My verdict summary",
-            "judge": ["Judge A"],
-            "tags": ["Tag A"],
-            "first_side": {
-                "MICHAEL WILSON & PARTNERS LIMITED": {"David Holland QC": None}
-            },
-            "second_side": {
-                "SOME OTHER WILSON & PARTNERS LIMITED": {"James Holland QC": None}
-            },
-        }
-
         assert validate_gpt_response(example_gpt_dict) == True
 
-    def test_invalid_gpt_response_not_string(self):
-        example_gpt_dict = {
-            "verdict": 123,
-            "summary": "sum",
-            "case_number": "My case number",
-            "verdict_summary": "My verdict summary",
-            "judge": ["Judge A"],
-            "tags": ["Tag A"],
-            "first_side": {
-                "MICHAEL WILSON & PARTNERS LIMITED": {"David Holland QC": None}
-            },
-            "second_side": {
-                "SOME OTHER WILSON & PARTNERS LIMITED": {"James Holland QC": None}
-            },
-        }
+    def test_extra_keys_ignored(self, example_gpt_dict):
+        assert validate_gpt_response(example_gpt_dict | {"title": "A v B"}) == True
+
+    def test_invalid_gpt_response_not_string(self, example_gpt_dict):
+        example_gpt_dict["summary"] = 123
         assert validate_gpt_response(example_gpt_dict) == False
 
-    def test_invalid_gpt_response_empty_string(self):
-        example_gpt_dict = {
-            "verdict": "guilty bad person",
-            "summary": "",
-            "case_number": "My case number",
-            "verdict_summary": "My verdict summary",
-            "judge": ["Judge A"],
-            "tags": ["Tag A"],
-            "first_side": {
-                "MICHAEL WILSON & PARTNERS LIMITED": {"David Holland QC": None}
-            },
-            "second_side": {
-                "SOME OTHER WILSON & PARTNERS LIMITED": {"James Holland QC": None}
-            },
-        }
+    def test_invalid_gpt_response_empty_string(self, example_gpt_dict):
+        example_gpt_dict["summary"] = ""
         assert validate_gpt_response(example_gpt_dict) == False
 
-    def test_invalid_gpt_response_empty_list(self):
-        example_gpt_dict = {
-            "verdict": "guilty bad person",
-            "summary": "sum",
-            "case_number": "My case number",
-            "verdict_summary": "My verdict summary",
-            "judge": [],
-            "tags": [],
-            "first_side": {
-                "MICHAEL WILSON & PARTNERS LIMITED": {"David Holland QC": None}
-            },
-            "second_side": {
-                "SOME OTHER WILSON & PARTNERS LIMITED": {"James Holland QC": None}
-            },
-        }
+    def test_invalid_gpt_response_empty_list(self, example_gpt_dict):
+        example_gpt_dict["judge"] = []
+        example_gpt_dict["tags"] = []
         assert validate_gpt_response(example_gpt_dict) == False
 
-    def test_invalid_gpt_response_invalid_participant(self):
-        example_gpt_dict = {
-            "verdict": "guilty bad person",
-            "summary": "sum",
-            "case_number": "My case number",
-            "verdict_summary": "My verdict summary",
-            "judge": ["Judge A"],
-            "tags": ["Tag A"],
-            "first_side": {"MICHAEL WILSON & PARTNERS LIMITED": {"Only one term"}},
-            "second_side": {
-                "SOME OTHER WILSON & PARTNERS LIMITED": {"James Holland QC": None}
-            },
-        }
+    def test_invalid_gpt_response_invalid_participant(self, example_gpt_dict):
+        example_gpt_dict["first_side"] = [{"name": "MICHAEL WILSON & PARTNERS LIMITED"}]
         assert validate_gpt_response(example_gpt_dict) == False
 
+    def test_invalid_gpt_response_unknown_verdict(self, example_gpt_dict):
+        example_gpt_dict["verdict"] = "guilty bad person"
+        assert validate_gpt_response(example_gpt_dict) == False
+
+
+class TestAllCasesData:
+
+    @patch("transform.get_data")
+    def test_all_data_keeps_order(self, mock_get_data):
+        mock_get_data.side_effect = lambda html_data, index: html_data[index]["citation"]
+        html_data = [{"citation": str(i)} for i in range(10)]
+        assert get_all_data(html_data, max_workers=4) == [str(i) for i in range(10)]
+
+    @patch("transform.get_data")
+    def test_all_data_selected_indexes(self, mock_get_data):
+        mock_get_data.side_effect = lambda html_data, index: index
+        html_data = [{} for _ in range(5)]
+        assert get_all_data(html_data, [4, 1, 3]) == [4, 1, 3]
+
+    @patch("transform.get_data")
+    def test_all_data_empty(self, mock_get_data):
+        assert get_all_data([]) == []
+        mock_get_data.assert_not_called()
+
+
+class FakeRateLimitError(Exception):
+    pass
+
 
 class TestGetSummary(unittest.TestCase):
 
-    @patch("transform.OpenAI")
-    def test_summary(self, MockOpenAI):
-        mock_client = MockOpenAI.return_value
+    @patch("transform.time.sleep")
+    @patch("transform.RETRYABLE_ERRORS", (FakeRateLimitError,))
+    @patch("transform.get_openai_client")
+    def test_summary_retries_rate_limit(self, mock_get_openai_client, mock_sleep):
+        mock_client = mock_get_openai_client.return_value
+        mock_client.chat.completions.create.side_effect = [
+            FakeRateLimitError(),
+            FakeRateLimitError(),
+            MagicMock(usage=MagicMock(completion_tokens=5, prompt_tokens=10, total_tokens=15)),
+        ]
+        limiter = MagicMock()
+        summary = get_summary("prompt", "transcript", limiter)
+        assert summary.usage.total_tokens == 15
+        assert mock_client.chat.completions.create.call_count == 3
+        assert mock_sleep.call_count == 2
+        assert limiter.acquire.call_count == 3
+        limiter.record_usage.assert_called_once()
+
+    @patch("transform.time.sleep")
+    @patch("transform.RETRYABLE_ERRORS", (FakeRateLimitError,))
+    @patch("transform.get_openai_client")
+    def test_summary_gives_up_after_retries(self, mock_get_openai_client, mock_sleep):
+        mock_get_openai_client.return_value.chat.completions.create.side_effect = FakeRateLimitError()
+        with pytest.raises(FakeRateLimitError):
+            get_summary("prompt", "transcript", MagicMock())
+
+    @patch("transform.get_openai_client")
+    def test_summary(self, mock_get_openai_client):
+        mock_client = mock_get_openai_client.return_value
         mock_client.chat.completions.create.return_value = MagicMock(
             usage=MagicMock(completion_tokens=5, prompt_tokens=10, total_tokens=15)
         )
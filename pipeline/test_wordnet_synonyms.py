@@ -0,0 +1,64 @@
+"Script that will test the functioning of the wordnet_synonyms script against a small synonym table"
+from unittest.mock import patch
+import pytest
+from wordnet_synonyms import build_synonym_table, SynonymTable
+from tag_canonicalisation import synonym_extractor
+
+ENTRIES = [
+    ("achieve", ["accomplish", "achieve", "attain", "reach"]),
+    ("children", ["child", "kid"]),
+    ("happy", ["felicitous", "glad", "happy"]),
+    ("review", ["follow-up", "review", "reexamination"]),
+]
+
+
+@pytest.fixture
+def table(tmp_path):
+    table_path = str(tmp_path / "synonyms.sqlite")
+    build_synonym_table(table_path, ENTRIES)
+    return SynonymTable(table_path)
+
+
+class TestSynonymTable:
+
+    def test_build_counts_words(self, tmp_path):
+        assert build_synonym_table(str(tmp_path / "synonyms.sqlite"), ENTRIES) == 4
+
+    def test_word_found_ignoring_case(self, table):
+        assert table.get_lemmas("Achieve") == ["accomplish", "achieve", "attain", "reach"]
+
+    def test_irregular_inflection_stored(self, table):
+        assert table.get_lemmas("children") == ["child", "kid"]
+
+    def test_regular_inflection_found(self, table):
+        assert table.get_lemmas("reviews") == ["follow-up", "review", "reexamination"]
+
+    def test_unknown_words(self, table):
+        assert table.get_lemmas("asdfghjkl") == []
+        assert table.get_lemmas("") == []
+        assert table.get_lemmas("@") == []
+
+    def test_lookups_kept_in_memory(self, table):
+        table.get_lemmas("happy")
+        with patch.object(table, "find") as mock_find:
+            assert table.get_lemmas("Happy") == ["felicitous", "glad", "happy"]
+            mock_find.assert_not_called()
+
+    def test_failed_build_leaves_no_table(self, tmp_path):
+        def failing_entries():
+            yield ENTRIES[0]
+            raise LookupError("wordnet not found")
+        table_path = tmp_path / "synonyms.sqlite"
+        with pytest.raises(LookupError):
+            build_synonym_table(str(table_path), failing_entries())
+        assert not list(tmp_path.iterdir())
+
+
+class TestSynonymExtractor:
+
+    def test_uses_table(self, table):
+        with patch("tag_canonicalisation.get_synonym_table", return_value=table):
+            assert synonym_extractor("Achieve") == {"Accomplish", "Attain", "Reach"}
+            assert synonym_extractor("not happy") == {"Felicitous", "Glad", "Happy"}
+            assert synonym_extractor(3) == set()
+
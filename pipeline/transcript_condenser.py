@@ -0,0 +1,221 @@
+"""Python script to condense a court transcript for the GPT prompt within a budget of tokens,
+keeping the parts the reply is taken from, the header naming the court, case number, judges,
+parties and counsel and the paragraphs that dispose of the case, found by cheap regex scores
+of every paragraph instead of keeping the first and last tokens of the transcript"""
+
+import re
+
+# share of the budget the header can take, the rest is left for the scored paragraphs
+HEADER_SHARE = 0.4
+# a numbered paragraph like "1." or "12.The claimant" starts the body of a judgment
+NUMBERED_PARAGRAPH = re.compile(r"^\(?\d{1,3}[.)]")
+# the header runs to the first numbered paragraph, or this many paragraphs without one
+MAX_HEADER_PARAGRAPHS = 60
+HEADING_MAX_WORDS = 8
+# paragraphs at the start of the body introduce the case, the last ones usually dispose of it
+INTRODUCTION_PARAGRAPHS = 3
+DISPOSAL_PARAGRAPHS = 4
+POSITION_SCORES = {"introduction": 3, "disposal": 6}
+# patterns of what GPT is asked for, scored for every match in a paragraph
+SCORED_PATTERNS = [
+    (
+        re.compile(
+            r"\b(?:neutral citation|case no|claim no|appeal no|case number)\b"
+            r"|\b[A-Z]{1,4}-?\d{4}-\d{4,6}\b",
+            re.IGNORECASE,
+        ),
+        4,
+    ),
+    (
+        re.compile(
+            r"\binstructed by\b|\b[KQ]C\b|\bcounsel\b|\bsolicitors?\b|\bLLP\b|\bbarristers?\b"
+            r"|\bappeared (?:for|on behalf of)\b|\bin person\b",
+            re.IGNORECASE,
+        ),
+        4,
+    ),
+    (
+        re.compile(
+            r"\bbefore\s*:|\b(?:lord|lady) justice\b|\b(?:mr|mrs|ms) justice\b|\bjudge\b"
+            r"|\bmaster\b|\brecorder\b|\bpresident\b|\bmagistrates?\b",
+            re.IGNORECASE,
+        ),
+        3,
+    ),
+    (
+        re.compile(
+            r"\b(?:claimants?|defendants?|appellants?|respondents?|applicants?|petitioners?"
+            r"|interested part(?:y|ies)|prosecution|regina|rex)\b",
+            re.IGNORECASE,
+        ),
+        1,
+    ),
+    (
+        re.compile(
+            r"\b(?:for (?:these|those|the above|all of these) reasons|in conclusion|it follows"
+            r"|accordingly|i would|we would|i (?:dismiss|allow|refuse|grant)"
+            r"|(?:is|are|be) (?:dismissed|allowed|refused|granted|quashed|struck out))\b",
+            re.IGNORECASE,
+        ),
+        5,
+    ),
+    (
+        re.compile(
+            r"\b(?:dismiss|allow|refus|grant|quash|uph[eo]ld|set aside|remit|guilty|acquit"
+            r"|convict|sentenc|strike out|struck out|settle|costs|declaration|injunction"
+            r"|damages|compensation)\w*",
+            re.IGNORECASE,
+        ),
+        2,
+    ),
+]
+# so a long paragraph is not picked over a short one only for repeating the same words
+MAX_MATCHES_SCORED = 3
+# a short paragraph like "Conclusion" is a heading, scored with the paragraph after it
+KEY_HEADING = re.compile(
+    r"\b(?:conclusions?|disposal|decision|result|outcome|summary|introduction|background"
+    r"|the facts|order)\b",
+    re.IGNORECASE,
+)
+HEADING_SCORE = 6
+# what is left of the budget is filled with the start of the best paragraph too long for it,
+# unless it is less than this, so a transcript of a few long paragraphs isn't left with none
+MIN_CUT_TOKENS = 50
+# paragraphs are picked by this estimate of their tokens, only the ones picked are encoded
+CHARS_PER_TOKEN = 4
+# a text of more characters than this many per token of the budget is taken to be over it
+MAX_CHARS_PER_TOKEN = 8
+
+
+def split_paragraphs(text: str) -> list[str]:
+    """Splits a transcript into its lines of text, dropping blank ones"""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def get_header_size(paragraphs: list[str]) -> int:
+    """Returns the number of paragraphs before the first numbered one, the header of the
+    judgment with its court, case number, judges, parties and counsel"""
+    for index, paragraph in enumerate(paragraphs[:MAX_HEADER_PARAGRAPHS]):
+        if NUMBERED_PARAGRAPH.match(paragraph):
+            return index
+    return min(len(paragraphs), MAX_HEADER_PARAGRAPHS) // 2
+
+
+def is_key_heading(paragraph: str) -> bool:
+    """Checks whether a paragraph is a heading of a section GPT needs"""
+    return len(paragraph.split()) <= HEADING_MAX_WORDS and bool(KEY_HEADING.search(paragraph))
+
+
+def score_paragraph(paragraph: str) -> int:
+    """Scores a paragraph by the matches of the patterns of what GPT is asked for"""
+    return sum(
+        weight * min(len(pattern.findall(paragraph)), MAX_MATCHES_SCORED)
+        for pattern, weight in SCORED_PATTERNS
+    )
+
+
+def score_body(body: list[str]) -> list[int]:
+    """Scores every paragraph of the body of a judgment by its text, whether it follows a key
+    heading and whether it is one of the first paragraphs or last paragraphs"""
+    scores = [score_paragraph(paragraph) for paragraph in body]
+    for index, paragraph in enumerate(body):
+        if is_key_heading(paragraph):
+            scores[index] += HEADING_SCORE
+            if index + 1 < len(body):
+                scores[index + 1] += HEADING_SCORE
+        if index < INTRODUCTION_PARAGRAPHS:
+            scores[index] += POSITION_SCORES["introduction"]
+        if index >= len(body) - DISPOSAL_PARAGRAPHS:
+            scores[index] += POSITION_SCORES["disposal"]
+    return scores
+
+
+def rank_candidates(candidates: list[tuple]) -> list[tuple]:
+    """Orders the paragraphs, given as (score, distance from the nearer end of the body, index,
+    tokens), by the highest score, then those nearest the start or end of the judgment like the
+    truncation keeps"""
+    return sorted(candidates, key=lambda candidate: (-candidate[0], candidate[1]))
+
+
+def select_within_budget(candidates: list[tuple], token_budget: int) -> set[int]:
+    """Picks the best ranked paragraphs that fit in the budget, returning their indexes"""
+    selected = set()
+    for _, _, index, tokens in rank_candidates(candidates):
+        if tokens <= token_budget:
+            selected.add(index)
+            token_budget -= tokens
+    return selected
+
+
+def cut_to_tokens(paragraph: str, token_budget: int, encoder) -> str:
+    """Returns the start of a paragraph, its first token_budget tokens of the encoder, encoding
+    only as much of the paragraph as those tokens could take"""
+    start = paragraph[: token_budget * MAX_CHARS_PER_TOKEN]
+    return encoder.decode(encoder.encode(start)[:token_budget]).rstrip()
+
+
+def condense_transcript(text: str, token_budget: int, encoder, placeholder: str = "[...]") -> str:
+    """Condenses a transcript to about token_budget tokens of the encoder, keeping the header
+    of the judgment, then the paragraphs scoring highest, in the order of the transcript with
+    the placeholder where paragraphs were left out. What is left of the budget is filled with
+    the start of the best paragraph too long to fit. A transcript within the budget is returned
+    as it is. Paragraphs are picked by their length and only the ones picked are encoded, so the
+    time taken doesn't grow with the tokens of a long judgment"""
+    paragraphs = split_paragraphs(text)
+    # the newline joining each paragraph to the next is counted as a token
+    if len(text) <= token_budget * MAX_CHARS_PER_TOKEN and (
+        sum(len(encoder.encode(paragraph)) + 1 for paragraph in paragraphs) <= token_budget
+    ):
+        return text
+    estimates = [len(paragraph) // CHARS_PER_TOKEN + 1 for paragraph in paragraphs]
+
+    header_size = get_header_size(paragraphs)
+    header_budget = int(token_budget * HEADER_SHARE)
+    header = []
+    for index in range(header_size):
+        if estimates[index] > header_budget:
+            continue
+        header.append(index)
+        header_budget -= estimates[index]
+    body_budget = token_budget - sum(estimates[index] for index in header)
+
+    body_scores = score_body(paragraphs[header_size:])
+    # a placeholder is counted with every paragraph as it may follow a gap
+    candidates = [
+        (
+            score,
+            min(offset, len(body_scores) - 1 - offset),
+            header_size + offset,
+            estimates[header_size + offset] + 2,
+        )
+        for offset, score in enumerate(body_scores)
+    ]
+    ranked = [candidate[2] for candidate in rank_candidates(candidates)]
+    body = select_within_budget(candidates, body_budget)
+
+    # the paragraphs picked are encoded, dropping the lowest ranked while they are over budget
+    tokens = {index: len(encoder.encode(paragraphs[index])) + 1 for index in header}
+    tokens.update({index: len(encoder.encode(paragraphs[index])) + 3 for index in body})
+    dropped = [index for index in reversed(ranked) if index in body] + header[::-1]
+    while sum(tokens.values()) > token_budget:
+        del tokens[dropped.pop(0)]
+    selected = set(tokens)
+
+    remaining = token_budget - sum(tokens.values())
+    cut = {}
+    skipped = [candidate for candidate in candidates if candidate[2] not in selected]
+    if skipped and remaining >= MIN_CUT_TOKENS:
+        index = rank_candidates(skipped)[0][2]
+        # the newline and the placeholders before and after the cut paragraph are counted
+        cut[index] = cut_to_tokens(paragraphs[index], remaining - 5, encoder)
+        selected.add(index)
+
+    lines = []
+    for index, paragraph in enumerate(paragraphs):
+        if index in cut:
+            lines.extend([cut[index], placeholder])
+        elif index in selected:
+            lines.append(paragraph)
+        elif not lines or lines[-1] != placeholder:
+            lines.append(placeholder)
+    return "\n".join(lines)
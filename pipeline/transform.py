@@ -4,19 +4,77 @@ website through ChatGPT into a format that can be loaded into a database"""
 from os import getenv
 from datetime import datetime, date
 from string import capwords
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import logging
-from ast import literal_eval
+import random
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
+import orjson
+from openai import RateLimitError, APIConnectionError, InternalServerError
 from openai.types.chat.chat_completion import ChatCompletion
 import tiktoken
 import prompts
 from extract import get_listing_data
+from rate_limiter import RateLimiter
+from openai_client import get_openai_client
+from gpt_cache import get_cache_key, get_gpt_cache
+from gpt_schema import get_invalid_fields, get_response_format
+from transcript_condenser import condense_transcript
 
 
 load_dotenv()
 logger = logging.getLogger("pipeline")
 
+GPT_MODEL = "gpt-4o-mini"
+GPT_TEMPERATURE = 0.1  # low temperature to ensure the model doesn't diverge from the prompt
+GPT_WORKERS = int(getenv("GPT_WORKERS", "8"))
+GPT_MAX_RETRIES = 6
+GPT_MAX_COMPLETION_TOKENS = 1000  # reserved in the rate limiter for each reply
+GPT_REPAIR_ATTEMPTS = 1
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+CHARS_PER_TOKEN = 4
+TOKEN_WINDOW_MARGIN = 256
+# tokens of a transcript condensed to its key sections, unset keeps the first and last 4000 tokens
+TRANSCRIPT_TOKEN_BUDGET = int(getenv("TRANSCRIPT_TOKEN_BUDGET", "0"))
+
+gpt_rate_limiter = RateLimiter()
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = GPT_MODEL) -> tiktoken.Encoding:
+    """Returns the tokeniser of a model, loaded once and reused for every transcript"""
+    return tiktoken.encoding_for_model(model)
+
+
+def encode_start(
+    encoder: tiktoken.Encoding, text: str, n_tokens: int
+) -> tuple[list[int], int] | None:
+    """Encodes only as much of the start of the text as needed to get its first n tokens,
+    returns the tokens and the number of characters encoded, or None if the whole text is needed"""
+    window = (n_tokens + TOKEN_WINDOW_MARGIN) * CHARS_PER_TOKEN
+    while window < len(text):
+        tokens = encoder.encode(text[:window])
+        # the last tokens may be a word cut in half by the window so they aren't kept
+        if len(tokens) > n_tokens + TOKEN_WINDOW_MARGIN:
+            return tokens[:n_tokens], window
+        window *= 2
+    return None
+
+
+def encode_end(
+    encoder: tiktoken.Encoding, text: str, n_tokens: int
+) -> tuple[list[int], int] | None:
+    """Encodes only as much of the end of the text as needed to get its last n tokens,
+    returns the tokens and the number of characters encoded, or None if the whole text is needed"""
+    window = (n_tokens + TOKEN_WINDOW_MARGIN) * CHARS_PER_TOKEN
+    while window < len(text):
+        tokens = encoder.encode(text[-window:])
+        if len(tokens) > n_tokens + TOKEN_WINDOW_MARGIN:
+            return tokens[-n_tokens:], window
+        window *= 2
+    return None
+
 
 def shorten_text_by_tokens(
     text: str,
@@ -24,15 +82,22 @@ def shorten_text_by_tokens(
     keep_end_tokens: int = 4000,
     placeholder: str = "[...]",
 ) -> str:
-    """Shortens court transcript by removing tokens from the middle"""
-    encoder = tiktoken.encoding_for_model("gpt-4o-mini")
-    tokens = encoder.encode(text)
+    """Shortens court transcript by removing tokens from the middle,
+    only the start and end of long transcripts are tokenised"""
+    encoder = get_encoder()
+    start = encode_start(encoder, text, keep_start_tokens)
+    end = encode_end(encoder, text, keep_end_tokens) if start else None
+
+    if start and end and start[1] + end[1] <= len(text):
+        start_tokens, end_tokens = start[0], end[0]
+    else:
+        tokens = encoder.encode(text)
 
-    if len(tokens) <= keep_start_tokens + keep_end_tokens:
-        return text
+        if len(tokens) <= keep_start_tokens + keep_end_tokens:
+            return text
 
-    start_tokens = tokens[:keep_start_tokens]
-    end_tokens = tokens[-keep_end_tokens:]
+        start_tokens = tokens[:keep_start_tokens]
+        end_tokens = tokens[-keep_end_tokens:]
 
     start_text = encoder.decode(start_tokens)
     end_text = encoder.decode(end_tokens)
@@ -42,89 +107,178 @@ def shorten_text_by_tokens(
     return shortened_text
 
 
-def get_summary(prompt: str, transcript: str) -> ChatCompletion:
-    """Collect data about the transcript using the GPT-4o-mini model"""
-    client = OpenAI(api_key=getenv("OPENAI_API_KEY"))
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": transcript},
-        ],
-        temperature=0.1,  # low temperature to ensure the model doesn't diverge from the prompt
-    )
-    usage = completion.usage
+def estimate_tokens(*texts: str) -> int:
+    """Cheap estimate of the tokens a request will use, corrected by the real usage later"""
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + GPT_MAX_COMPLETION_TOKENS
+
+
+def get_retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter so parallel workers don't retry in step"""
+    return random.uniform(0, min(60, 2**attempt))
+
+
+def build_messages(prompt: str, transcript: str, extra_messages: list[dict] = ()) -> list[dict]:
+    """Returns the chat messages sent to GPT for a transcript"""
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": transcript},
+        *extra_messages,
+    ]
+
+
+def log_usage(usage, label: str = "GPT-4o-mini usage cost") -> list[int]:
+    """Logs the tokens used by a completion in the format read by calculate_gpt_cost"""
     completion_tokens = getattr(usage, "completion_tokens", 0)
     prompt_tokens = getattr(usage, "prompt_tokens", 0)
     total_tokens = getattr(usage, "total_tokens", 0)
     cost = [completion_tokens, prompt_tokens, total_tokens]
-    logger.info("GPT-4o-mini usage cost: %s", cost)
+    logger.info("%s: %s", label, cost)
+    return cost
+
+
+def get_summary(
+    prompt: str,
+    transcript: str,
+    rate_limiter: RateLimiter | None = None,
+    extra_messages: list[dict] = (),
+    response_format: dict | None = None,
+) -> ChatCompletion:
+    """Collect data about the transcript using the GPT-4o-mini model as JSON following the
+    case schema, waiting for the rate limiter and retrying when the API rate limits the
+    request or is unavailable. Without a rate limiter, waits for gpt_rate_limiter, which a
+    backfill process replaces with the limiter shared by all of its processes"""
+    rate_limiter = gpt_rate_limiter if rate_limiter is None else rate_limiter
+    client = get_openai_client()
+    messages = build_messages(prompt, transcript, extra_messages)
+    estimated_tokens = estimate_tokens(*(message["content"] for message in messages))
+    for attempt in range(GPT_MAX_RETRIES + 1):
+        rate_limiter.acquire(estimated_tokens)
+        try:
+            completion = client.chat.completions.create(
+                model=GPT_MODEL,
+                messages=messages,
+                temperature=GPT_TEMPERATURE,
+                response_format=response_format or get_response_format(),
+            )
+            break
+        except RETRYABLE_ERRORS as err:
+            if attempt == GPT_MAX_RETRIES:
+                raise
+            delay = get_retry_delay(attempt)
+            logger.warning(
+                "GPT request failed (%s), retrying in %.1f seconds",
+                type(err).__name__,
+                delay,
+            )
+            time.sleep(delay)
+    total_tokens = log_usage(completion.usage)[2]
+    if isinstance(total_tokens, int):
+        rate_limiter.record_usage(estimated_tokens, total_tokens)
     return completion
 
 
-def is_valid_participant(participant_dict: dict) -> bool:
-    """Check if the participant dict is valid"""
-    for key, value in participant_dict.items():
-        if not isinstance(key, (str, type(None))):
-            return False
-        if not isinstance(value, dict):
-            return False
-        for sub_key, sub_value in value.items():
-            if not isinstance(sub_key, (str, type(None))):
-                return False
-            if not isinstance(sub_value, (str, type(None))):
-                return False
-
-    return True
+def validate_gpt_response(gpt_response_dict: dict) -> bool:
+    """Validates the data shape extracted from the GPT-4o-mini API against the case schema"""
+    return not get_invalid_fields(gpt_response_dict)
 
 
-def validate_gpt_response(gpt_response_dict: dict) -> bool:
-    """Validates the data shape extracted from the GPT-4o-mini API"""
-    expected_keys = {
-        "verdict": str,
-        "summary": str,
-        "case_number": str,
-        "verdict_summary": str,
-        "judge": list,
-        "tags": list,
-        "first_side": dict,
-        "second_side": dict,
-    }
+def build_user_message(transcript: str, token_budget: int = TRANSCRIPT_TOKEN_BUDGET) -> str:
+    """Returns the user message asking GPT about a shortened transcript, condensed to the
+    sections GPT needs within token_budget tokens when a budget is given"""
+    if token_budget:
+        return prompts.USER_MESSAGE + condense_transcript(transcript, token_budget, get_encoder())
+    return prompts.USER_MESSAGE + shorten_text_by_tokens(transcript)
 
-    for key, expected_type in expected_keys.items():
-        value = gpt_response_dict.get(key)
-        if value is None:
-            return False
-        if not isinstance(value, expected_type):
-            return False
-        if isinstance(value, str) and not value.strip():
-            return False
-        if isinstance(value, list) and len(value) == 0:
-            return False
-        if isinstance(value, dict):
-            if not is_valid_participant(value):
-                return False
 
-    return True
+def parse_gpt_content(content: str) -> dict | None:
+    """Converts the JSON object returned by GPT to a dict"""
+    try:
+        reply = orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return None
+    return reply if isinstance(reply, dict) else None
+
+
+def build_repair_messages(reply: dict, invalid_fields: list[str]) -> list[dict]:
+    """Returns the messages asking GPT to correct some fields of its reply"""
+    return [
+        {"role": "assistant", "content": orjson.dumps(reply).decode("utf-8")},
+        {
+            "role": "user",
+            "content": prompts.REPAIR_MESSAGE + ", ".join(invalid_fields),
+        },
+    ]
+
+
+def repair_reply(user_message: str, reply: dict, invalid_fields: list[str]) -> dict:
+    """Asks GPT again for only the invalid fields of a reply and merges them in,
+    instead of throwing the whole reply away"""
+    for _ in range(GPT_REPAIR_ATTEMPTS):
+        logger.info("Asking GPT again for the invalid fields %s", invalid_fields)
+        completion = get_summary(
+            prompts.SYSTEM_MESSAGE,
+            user_message,
+            extra_messages=build_repair_messages(reply, invalid_fields),
+            response_format=get_response_format(invalid_fields),
+        )
+        repaired = parse_gpt_content(completion.choices[0].message.content) or {}
+        reply = reply | {field: repaired[field] for field in invalid_fields if field in repaired}
+        invalid_fields = get_invalid_fields(reply)
+        if not invalid_fields:
+            break
+    return reply
+
+
+def get_gpt_reply(user_message: str, cache=None) -> dict:
+    """Returns GPT-4o-mini's reply to a transcript, from the cache when the same transcript
+    was sent with the same prompt, schema, model and temperature before. Invalid fields are
+    asked for again and only valid replies are cached"""
+    cache = cache or get_gpt_cache()
+    key = get_cache_key(
+        prompts.SYSTEM_MESSAGE, user_message, GPT_MODEL, GPT_TEMPERATURE, get_response_format()
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        logger.info("GPT cache hit for %s", key)
+        return cached["reply"]
+    content = get_summary(prompts.SYSTEM_MESSAGE, user_message).choices[0].message.content
+    reply = parse_gpt_content(content) or {}
+    invalid_fields = get_invalid_fields(reply)
+    if invalid_fields:
+        reply = repair_reply(user_message, reply, invalid_fields)
+        invalid_fields = get_invalid_fields(reply)
+    if not invalid_fields:
+        cache.set(key, {"reply": reply})
+    return reply
 
 
 def get_data(html_data: list[dict], index: int) -> dict:
     """Combines the html data with the GPT-4o-mini data for a single case"""
     transcript = html_data[index].get("text_raw")
-    shortened_transcript = shorten_text_by_tokens(transcript)
+    user_message = build_user_message(transcript)
     del html_data[index]["text_raw"]
-    user_message = prompts.USER_MESSAGE + shortened_transcript
-    try:
-        # converts a dict-like string to a dict
-        gpt_data = literal_eval(
-            get_summary(prompts.SYSTEM_MESSAGE, user_message).choices[0].message.content
-        )
-    except (SyntaxError, ValueError):
+    gpt_data = get_gpt_reply(user_message)
+    if not gpt_data:
         return None
     data = html_data[index] | gpt_data
     return data
 
 
+def get_all_data(
+    html_data: list[dict],
+    indexes: list[int] | None = None,
+    max_workers: int = GPT_WORKERS,
+) -> list[dict]:
+    """Runs get_data for several cases at once, by default every case,
+    and returns the results in the order of the indexes"""
+    if indexes is None:
+        indexes = list(range(len(html_data)))
+    if max_workers <= 1 or len(indexes) <= 1:
+        return [get_data(html_data, index) for index in indexes]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(indexes))) as executor:
+        return list(executor.map(lambda index: get_data(html_data, index), indexes))
+
+
 def format_date(date_string: str) -> date:
     """Converts a date string to a date object"""
     if not date_string or not isinstance(date_string, str):
@@ -133,19 +287,14 @@ def format_date(date_string: str) -> date:
     return datetime.strptime(clean_date_string, "%d %b %Y").date()
 
 
-def convert_dict_to_tuple(participant_dict: dict) -> tuple:
-    """Converts a claimant and defendant data dictionary to a tuple"""
+def convert_participants_to_tuple(participants: list[dict]) -> tuple:
+    """Converts the claimants or defendants of a case to a flat tuple of
+    names and (lawyer, law firm) pairs"""
     result = []
-    for outer_key, inner_dict in participant_dict.items():
-        if inner_dict is None:
-            result.append((outer_key, (None, None)))
-        else:
-            inner_key = list(inner_dict.keys())[0]
-            inner_value = inner_dict[inner_key]
-            result.append((outer_key, (inner_key, inner_value)))
-    flattened_result = tuple(item for sublist in result for item in sublist)
-
-    return flattened_result
+    for participant in participants or []:
+        result.append(participant.get("name"))
+        result.append((participant.get("lawyer"), participant.get("law_firm")))
+    return tuple(result)
 
 
 def assemble_data(data_list: list[dict], is_batch_pipeline: bool = False) -> dict:
@@ -186,8 +335,8 @@ def assemble_data(data_list: list[dict], is_batch_pipeline: bool = False) -> dic
                 table_data["v_sum"].append(data.get("verdict_summary"))
                 table_data["people"].append(
                     (
-                        convert_dict_to_tuple(data.get("first_side")),
-                        convert_dict_to_tuple(data.get("second_side")),
+                        convert_participants_to_tuple(data.get("first_side")),
+                        convert_participants_to_tuple(data.get("second_side")),
                     )
                 )
             else:
@@ -0,0 +1,131 @@
+"""Python script for the WordNet synonym table, built once from the NLTK corpus (in the Docker image
+by nltk_setup.py) into a read-only SQLite file, so looking up synonyms never loads NLTK or WordNet"""
+
+from os import getenv, path, remove, replace
+from threading import Lock
+import logging
+import sqlite3
+
+logger = logging.getLogger("pipeline")
+
+SYNONYM_TABLE_PATH = getenv(
+    "SYNONYM_TABLE_PATH", path.join(path.dirname(path.abspath(__file__)), "wordnet_synonyms.sqlite")
+)
+MMAP_BYTES = 64 * 1024 * 1024
+
+# WordNet's rules for turning a regular inflection back into the word it comes from,
+# irregular inflections are stored in the table themselves
+MORPHOLOGICAL_SUBSTITUTIONS = (
+    ("s", ""),
+    ("ses", "s"),
+    ("ves", "f"),
+    ("xes", "x"),
+    ("zes", "z"),
+    ("ches", "ch"),
+    ("shes", "sh"),
+    ("men", "man"),
+    ("ies", "y"),
+    ("es", "e"),
+    ("es", ""),
+    ("ed", "e"),
+    ("ed", ""),
+    ("ing", "e"),
+    ("ing", ""),
+    ("er", ""),
+    ("est", ""),
+    ("er", "e"),
+    ("est", "e"),
+)
+
+
+def get_wordnet_entries():
+    """Yields every word WordNet knows, including its irregular inflections,
+    with the lemma names of all the synsets of the word"""
+    from nltk.corpus import wordnet  # pylint: disable=import-outside-toplevel
+
+    words = set(wordnet.all_lemma_names())
+    for exceptions in wordnet._exception_map.values():  # pylint: disable=protected-access
+        words.update(exceptions)
+    for word in sorted(words):
+        lemmas = {lemma.name() for syn in wordnet.synsets(word) for lemma in syn.lemmas()}
+        if lemmas:
+            yield word, sorted(lemmas)
+
+
+def build_synonym_table(table_path: str = SYNONYM_TABLE_PATH, entries=None) -> int:
+    """Writes the lemma names of every word to the synonym table, returning the number of words"""
+    entries = get_wordnet_entries() if entries is None else entries
+    building_path = table_path + ".building"  # only replaces the table once it is complete
+    if path.exists(building_path):
+        remove(building_path)
+    conn = sqlite3.connect(building_path)
+    conn.execute(
+        "CREATE TABLE synonym (word TEXT PRIMARY KEY, lemmas TEXT NOT NULL) WITHOUT ROWID"
+    )
+    try:
+        conn.executemany(
+            "INSERT INTO synonym(word, lemmas) VALUES (?, ?)",
+            ((word, " ".join(lemmas)) for word, lemmas in entries),
+        )
+    except Exception:
+        conn.close()
+        remove(building_path)
+        raise
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM synonym").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+    replace(building_path, table_path)
+    return count
+
+
+class SynonymTable:
+    """Read-only, memory-mapped lookup of the synonym table, with the words looked up kept in memory"""
+
+    def __init__(self, table_path: str = SYNONYM_TABLE_PATH):
+        self.conn = sqlite3.connect(
+            f"file:{table_path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        self.conn.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+        self.memo = {}
+        self.lock = Lock()
+
+    def find(self, word: str) -> list[str] | None:
+        """Returns the lemma names stored for a word, or None if it is not in the table"""
+        row = self.conn.execute("SELECT lemmas FROM synonym WHERE word = ?", (word,)).fetchone()
+        return row[0].split(" ") if row else None
+
+    def get_lemmas(self, word: str) -> list[str]:
+        """Returns the lemma names of the synsets of a word like wordnet.synsets does,
+        trying the words a regular inflection could come from if it is not in the table"""
+        word = word.lower()
+        with self.lock:
+            if word not in self.memo:
+                lemmas = self.find(word)
+                if lemmas is None:
+                    lemmas = []
+                    for suffix, ending in MORPHOLOGICAL_SUBSTITUTIONS:
+                        if word.endswith(suffix) and len(word) > len(suffix):
+                            lemmas.extend(self.find(word[: -len(suffix)] + ending) or [])
+                    lemmas = list(dict.fromkeys(lemmas))
+                self.memo[word] = lemmas
+            return self.memo[word]
+
+
+table_lock = Lock()
+tables = {}
+
+
+def get_synonym_table() -> SynonymTable:
+    """Returns the synonym table shared by the process, building it from WordNet first
+    when it is missing, e.g. when running outside the Docker image"""
+    with table_lock:
+        if "default" not in tables:
+            if not path.exists(SYNONYM_TABLE_PATH):
+                import nltk  # pylint: disable=import-outside-toplevel
+
+                logger.info("Building the WordNet synonym table at %s", SYNONYM_TABLE_PATH)
+                nltk.download("wordnet", quiet=True)
+                build_synonym_table()
+            tables["default"] = SynonymTable()
+        return tables["default"]